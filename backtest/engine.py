@@ -0,0 +1,204 @@
+# Бэктест сетки + MACD 1m / RSI 4h на исторических 1m свечах.
+# Индикаторы считаются массивами numpy один раз на весь ряд, в цикле по минутам остаются только сравнения
+# чисел и решения из common.strategy - те же, что в живой торговле.
+# Запуск из корня проекта: python -m backtest.engine klines_1m.csv [--grid-size 0.01] | --synthetic-days 365
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import NamedTuple
+
+from numpy import memmap, array as np_array, where, maximum, arange, full, nan, isnan, searchsorted, unique, \
+    empty, load as np_load, loadtxt, zeros, exp, cumsum
+from numpy.random import default_rng
+from talib import MACD, EMA
+
+from common.config import config
+from common.func import get_decimal_places
+from common.strategy import main_lot_for_balance, profit_to_target, next_buy_price, cost_with_fee
+from indicators.candle_store import CANDLE_DTYPE
+from indicators.streaming import StreamRSI
+
+MS_4H = 4 * 60 * 60 * 1000
+
+
+class BacktestParams(NamedTuple):
+    grid_size: float = 0.01
+    target_profit: float = config.TARGET_PROFIT
+    taker_maker: float = config.TAKER_MAKER
+    main_lot_map: dict = config.MAIN_LOT_MAP
+    rsi_lot_multipliers: tuple = config.RSI_LOT_MULTIPLIERS
+    balance: float = 1000.0
+    step_size: float = 0.0001
+    min_qty: float = 0.0  # Фильтры символа, как SymbolFilters в check_order: меньше - биржа отклоняет ордер
+    min_notional: float = 0.0
+
+
+class BacktestResult(NamedTuple):
+    realized_pnl: float  # Доход закрытых сделок, как real_profit в place_sell_order
+    unrealized_pnl: float  # Открытые ордера по последней цене
+    final_equity: float
+    max_drawdown: float  # Максимальная просадка капитала, USDT
+    max_drawdown_pct: float
+    fees: float
+    buys: int
+    sells: int
+    open_orders: int
+    max_open_orders: int
+    max_invested: float
+
+
+def load_klines(file: str):  # .npy/.bin (хранилище свечей бота) со структурой CANDLE_DTYPE или CSV
+    if file.endswith('.npy'):
+        return np_load(file, mmap_mode='r')
+
+    if file.endswith('.bin'):
+        return memmap(file, dtype=CANDLE_DTYPE, mode='r')
+
+    rows = loadtxt(file, delimiter=',', skiprows=1, usecols=range(6), ndmin=2)
+    klines = empty(len(rows), dtype=CANDLE_DTYPE)
+    for i, name in enumerate(CANDLE_DTYPE.names):
+        klines[name] = rows[:, i]
+    return klines
+
+
+def synthetic_klines(days: int, start: float = 100.0, volatility: float = 0.001, seed: int = 0):
+    minutes = days * 24 * 60
+    close = start * exp(cumsum(default_rng(seed).normal(0, volatility, minutes)))
+    klines = zeros(minutes, dtype=CANDLE_DTYPE)
+    klines['open_time'] = arange(minutes) * 60_000
+    klines['close'] = close
+    klines['open'][1:], klines['open'][0] = close[:-1], start
+    klines['high'] = maximum(klines['open'], close)
+    klines['low'] = where(klines['open'] < close, klines['open'], close)
+    return klines
+
+
+def macd_triggers(close):
+    # Триггер после закрытия каждой минуты: 1 - buy, -1 - sell, 0 - new (до первого сигнала).
+    # Как в start_indicators: hist закрытой свечи и hist следующей свечи с той же ценой (peek)
+    macd, signal, hist = MACD(close, fastperiod=12, slowperiod=26, signalperiod=9)
+    fast, slow = EMA(close, 12), EMA(close, 26)
+    macd_peek = macd + (close - fast) * (2 / 13) - (close - slow) * (2 / 27)
+    hist_peek = macd_peek - (signal + (macd_peek - signal) * (2 / 10))
+
+    signals = where((hist > 0) & (hist_peek > 0), 1, where((hist < 0) & (hist_peek < 0), -1, 0))
+    # macd_trigger меняет состояние только на противоположный сигнал, значит триггер - последний ненулевой сигнал
+    last = maximum.accumulate(where(signals != 0, arange(len(signals)), 0))
+    return where(signals[last] != 0, signals[last], 0)
+
+
+def rsi_4h_peek(open_time, close, period: int = 14):
+    # RSI 4h для незакрытой свечи по цене каждой минуты (как rsi_4h.peek(price) в start_indicators)
+    buckets = open_time // MS_4H
+    bars, first = unique(buckets, return_index=True)
+    closes_4h = close[(first[1:] - 1).tolist() + [len(close) - 1]]
+
+    # Состояние Уайлдера после закрытия каждой 4h свечи: цикл по 4h свечам (их в 240 раз меньше минут)
+    avg_gain, avg_loss, prev_close = full(len(bars), nan), full(len(bars), nan), closes_4h
+    rsi = StreamRSI(period)
+    for i, price in enumerate(closes_4h.tolist()):
+        rsi.update(price)
+        if rsi.value is not None:
+            avg_gain[i], avg_loss[i] = rsi.averages
+
+    prev = searchsorted(bars, buckets) - 1  # Последняя закрытая 4h свеча для каждой минуты
+    valid = prev >= 0
+    prev = where(valid, prev, 0)
+    diff = close - prev_close[prev]
+    gain = (avg_gain[prev] * (period - 1) + maximum(diff, 0)) / period
+    loss = (avg_loss[prev] * (period - 1) + maximum(-diff, 0)) / period
+    total = gain + loss
+    result = where(abs(total) < 1e-8, 0.0, 100 * gain / where(total == 0, 1, total))
+    return where(valid & ~isnan(gain), result, nan)
+
+
+def prepare_series(klines):  # Ряды, не зависящие от параметров стратегии: цена, триггер MACD, RSI 4h
+    close = np_array(klines['close'], dtype=float)
+    return close, macd_triggers(close), rsi_4h_peek(np_array(klines['open_time']), close)
+
+
+def run_backtest(klines, params: BacktestParams = BacktestParams()):
+    return simulate(*prepare_series(klines), params)
+
+
+def simulate(close, triggers, rsi, params: BacktestParams = BacktestParams()):
+    edges = np_array([edge for edge, _ in params.rsi_lot_multipliers])
+    multipliers = np_array([multiplier for _, multiplier in params.rsi_lot_multipliers])
+    lot_multiplier = multipliers[searchsorted(edges, where(isnan(rsi), 0, rsi), side='right')]
+
+    if (ready := ~isnan(rsi)).any():  # Торговля после прогрева индикаторов (init_rsi)
+        start = max(int(ready.argmax()), 34)
+    else:
+        start = len(close)
+    decimals = get_decimal_places(params.step_size)
+    grid_size, target_profit, taker_maker = params.grid_size, params.target_profit, params.taker_maker
+    min_qty, min_notional = params.min_qty, params.min_notional
+
+    cash = params.balance
+    qty = cost_fee = realized = fees = max_invested = 0.0
+    last_price = None
+    buys = sells = open_orders = max_open_orders = 0
+    equity = full(len(close), params.balance)
+
+    prices, buy_flags, lot_multipliers = close.tolist(), (triggers == 1).tolist(), lot_multiplier.tolist()
+    for i in range(start, len(prices)):
+        price = prices[i]
+
+        if qty and profit_to_target(price, qty, cost_fee, target_profit) > 0:  # Продажа всех ордеров
+            cash += price * qty
+            realized += price * qty - cost_fee
+            qty = cost_fee = 0.0
+            last_price, open_orders, sells = None, 0, sells + 1
+
+        if buy_flags[i] and (last_price is None or price < next_buy_price(last_price, grid_size)):
+            main_lot = main_lot_for_balance(cash, params.main_lot_map)
+            # Нулевой лот - "Не удалось получить лот", cash не больше лота - блокировка USDT
+            if main_lot is not None and 0 < (lot := main_lot * lot_multipliers[i]) < cash:
+                executed_qty = round(lot / price, decimals)
+                cost = executed_qty * price
+                if executed_qty > 0 and executed_qty >= min_qty and cost >= min_notional:  # Иначе отказ check_order
+                    with_fee = cost_with_fee(cost, taker_maker)
+                    cash -= with_fee
+                    fees += with_fee - cost
+                    qty += executed_qty
+                    cost_fee += with_fee
+                    last_price, open_orders, buys = price, open_orders + 1, buys + 1
+                    max_open_orders = max(max_open_orders, open_orders)
+                    max_invested = max(max_invested, cost_fee)
+
+        equity[i] = cash + qty * price
+
+    drawdown = maximum.accumulate(equity) - equity
+    worst = int(drawdown.argmax())
+    peak = equity[:worst + 1].max()
+    return BacktestResult(realized_pnl=realized, unrealized_pnl=qty * prices[-1] - cost_fee,
+                          final_equity=float(equity[-1]), max_drawdown=float(drawdown[worst]),
+                          max_drawdown_pct=float(drawdown[worst] / peak * 100) if peak else 0.0, fees=fees,
+                          buys=buys, sells=sells, open_orders=open_orders, max_open_orders=max_open_orders,
+                          max_invested=max_invested)
+
+
+def main():
+    parser = ArgumentParser(description='Бэктест сетки + MACD 1m / RSI 4h')
+    parser.add_argument('file', nargs='?', help='1m свечи: .npy/.bin (CANDLE_DTYPE) или .csv')
+    parser.add_argument('--synthetic-days', type=int, help='вместо файла - синтетика на столько дней')
+    parser.add_argument('--grid-size', type=float, default=0.01)
+    parser.add_argument('--target-profit', type=float, default=config.TARGET_PROFIT)
+    parser.add_argument('--balance', type=float, default=1000.0)
+    parser.add_argument('--step-size', type=float, default=0.0001)
+    parser.add_argument('--min-qty', type=float, default=0.0)
+    parser.add_argument('--min-notional', type=float, default=0.0)
+    args = parser.parse_args()
+
+    klines = synthetic_klines(args.synthetic_days) if args.synthetic_days else load_klines(args.file)
+    params = BacktestParams(grid_size=args.grid_size, target_profit=args.target_profit, balance=args.balance,
+                            step_size=args.step_size, min_qty=args.min_qty, min_notional=args.min_notional)
+
+    started = perf_counter()
+    result = run_backtest(klines, params)
+    print(f'{len(klines)} минутных свечей за {perf_counter() - started:.2f} с')
+    for key, value in result._asdict().items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# Перебор параметров стратегии (grid_size, TARGET_PROFIT, TAKER_MAKER, main_lot, карта RSI -> лот) по многим
+# символам в пуле процессов. Ряды цен и индикаторов считаются один раз на символ и пишутся в .npy,
+# воркеры открывают их через memmap - данные делят страницы ОС, а не копируются в каждый процесс.
+# Запуск из корня проекта:
+#   python -m backtest.sweep BTC=btc_1m.csv ETH=eth_1m.npy --grid-size 0.005 0.01 0.02 --target-profit 0.005 0.01
+#   python -m backtest.sweep --synthetic 8 --synthetic-days 90
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from csv import writer
+from itertools import product
+from os import cpu_count, makedirs
+from os.path import dirname, join
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from numpy import save, load as np_load, stack
+
+from backtest.engine import BacktestParams, load_klines, synthetic_klines, prepare_series, simulate
+from common.config import config
+
+RSI_LOT_PRESETS = {
+    'default': config.RSI_LOT_MULTIPLIERS,
+    'flat': ((float('inf'), 1),),
+    'soft': ((30, 2), (40, 1.5), (60, 1), (70, 0.5), (float('inf'), 0.25)),
+    'hard': ((20, 6), (25, 5), (30, 4), (35, 3), (40, 2), (60, 1), (70, 0.1), (float('inf'), 0.0)),
+}
+
+_series = {}  # Кэш memmap в процессе-воркере: symbol -> (close, triggers, rsi)
+
+
+def _prepare(symbol: str, klines, data_dir: str):
+    file = join(data_dir, f'{symbol}.npy')
+    save(file, stack(prepare_series(klines)))  # 3 x N float64: close, triggers, rsi
+    return symbol, file
+
+
+def _run(task: tuple):
+    symbol, file, params, preset = task
+    if symbol not in _series:
+        close, triggers, rsi = np_load(file, mmap_mode='r')
+        _series[symbol] = close, triggers, rsi
+
+    result = simulate(*_series[symbol], params)
+    pnl = result.realized_pnl + result.unrealized_pnl
+    score = pnl / result.max_drawdown if result.max_drawdown else pnl  # Доход на единицу просадки
+    return symbol, params, preset, score, result
+
+
+def sweep(klines_by_symbol: dict, grid: dict, workers: int, out_file: str):
+    started = perf_counter()
+    with TemporaryDirectory() as data_dir:
+        files = dict(_prepare(symbol, klines, data_dir) for symbol, klines in klines_by_symbol.items())
+        prepared = perf_counter()
+
+        tasks = [(symbol, file, BacktestParams(grid_size=grid_size, target_profit=target_profit,
+                                               taker_maker=taker_maker, main_lot_map={(0, float('inf')): main_lot},
+                                               rsi_lot_multipliers=RSI_LOT_PRESETS[preset], balance=grid['balance'],
+                                               min_qty=grid['min_qty'], min_notional=grid['min_notional']),
+                  preset)
+                 for symbol, file in files.items()
+                 for grid_size, target_profit, taker_maker, main_lot, preset in product(
+                     grid['grid_size'], grid['target_profit'], grid['taker_maker'], grid['main_lot'], grid['rsi_lot'])]
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+    # Ранжируем внутри символа по доходу на единицу просадки
+    results.sort(key=lambda item: (item[0], -item[3]))
+    makedirs(dirname(out_file) or '.', exist_ok=True)
+    with open(out_file, 'w', newline='', encoding='utf-8') as f:
+        table = writer(f)
+        table.writerow(('symbol', 'rank', 'score', 'grid_size', 'target_profit', 'taker_maker', 'main_lot', 'rsi_lot',
+                        *results[0][4]._fields))
+        rank = 0
+        for i, (symbol, params, preset, score, result) in enumerate(results):
+            rank = 1 if i == 0 or results[i - 1][0] != symbol else rank + 1
+            table.writerow((symbol, rank, round(score, 4), params.grid_size, params.target_profit, params.taker_maker,
+                            params.main_lot_map[(0, float('inf'))], preset, *result))
+
+    print(f'Подготовка рядов: {prepared - started:.2f} с, {len(tasks)} прогонов на {workers} процессах: '
+          f'{perf_counter() - prepared:.2f} с. Таблица: {out_file}')
+    for symbol in klines_by_symbol:
+        symbol, params, preset, score, result = next(item for item in results if item[0] == symbol)
+        print(f'{symbol}: grid_size {params.grid_size}, target_profit {params.target_profit}, '
+              f'main_lot {params.main_lot_map[(0, float("inf"))]}, rsi_lot {preset}, score {score:.3f}, '
+              f'pnl {result.realized_pnl + result.unrealized_pnl:.2f}, drawdown {result.max_drawdown:.2f}')
+
+
+def main():
+    parser = ArgumentParser(description='Перебор параметров стратегии по символам')
+    parser.add_argument('files', nargs='*', help='SYMBOL=файл 1m свечей (.csv или .npy)')
+    parser.add_argument('--synthetic', type=int, default=0, help='число синтетических символов вместо файлов')
+    parser.add_argument('--synthetic-days', type=int, default=90)
+    parser.add_argument('--grid-size', type=float, nargs='+', default=[0.005, 0.01, 0.015, 0.02])
+    parser.add_argument('--target-profit', type=float, nargs='+', default=[0.005, 0.01, 0.015])
+    parser.add_argument('--taker-maker', type=float, nargs='+', default=[config.TAKER_MAKER])
+    parser.add_argument('--main-lot', type=float, nargs='+', default=[10, 14, 20])
+    parser.add_argument('--rsi-lot', nargs='+', default=list(RSI_LOT_PRESETS), choices=list(RSI_LOT_PRESETS))
+    parser.add_argument('--balance', type=float, default=1000.0)
+    parser.add_argument('--min-qty', type=float, default=0.0, help='minQty символа: меньшие покупки не проходят')
+    parser.add_argument('--min-notional', type=float, default=0.0, help='minNotional символа, USDT')
+    parser.add_argument('--workers', type=int, default=cpu_count())
+    parser.add_argument('--out', default=join('data', 'sweep_results.csv'))
+    args = parser.parse_args()
+
+    klines_by_symbol = {name: load_klines(file) for name, file in (item.split('=', 1) for item in args.files)}
+    klines_by_symbol |= {f'SYN{i}': synthetic_klines(args.synthetic_days, seed=i) for i in range(args.synthetic)}
+    if not klines_by_symbol:
+        parser.error('нужны файлы SYMBOL=файл или --synthetic N')
+
+    grid = {'grid_size': args.grid_size, 'target_profit': args.target_profit, 'taker_maker': args.taker_maker,
+            'main_lot': args.main_lot, 'rsi_lot': args.rsi_lot, 'balance': args.balance, 'min_qty': args.min_qty,
+            'min_notional': args.min_notional}
+    sweep(klines_by_symbol, grid, args.workers, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+from asyncio import Lock, sleep, create_task, shield
+from hashlib import sha256
+from hmac import new as hmac_new
+from json import loads, JSONDecodeError
+from logging import getLogger
+from random import random
+from time import monotonic, perf_counter, time
+
+from aiohttp import ClientSession, ClientError
+
+from common.config import config
+from common.metrics import metrics
+
+logger = getLogger('my_app')
+
+# Группы эндпоинтов с отдельными лимитами BingX: рыночные данные, торговля, аккаунт
+ENDPOINT_GROUPS = {
+    '/openApi/spot/v2/market/kline': 'market',
+    '/openApi/spot/v1/common/symbols': 'market',
+    '/openApi/spot/v1/trade/order': 'trade',
+    '/openApi/user/auth/userDataStream': 'account',
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_CODES = {100410}  # Коды BingX, при которых запрос стоит повторить (превышение частоты)
+
+
+class TokenBucket:  # Не больше rate запросов в секунду, запас до burst; pause - пауза по требованию биржи
+    def __init__(self, rate: float, burst: float):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._lock = Lock()
+        self.waited = 0.0  # Суммарное ожидание лимита, сек
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+        self._tokens = 0.0
+
+    def scale(self, share: float):  # Доля общего лимита аккаунта, когда запросы идут из нескольких процессов
+        self._rate *= share
+        self._burst = max(1.0, self._burst * share)
+        self._tokens = min(self._tokens, self._burst)
+
+    async def acquire(self, weight: float = 1):
+        async with self._lock:  # Очередь по порядку, иначе тяжелые запросы могут голодать
+            while True:
+                now = monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                    self._updated = now
+                    if self._tokens >= weight:
+                        self._tokens -= weight
+                        return
+
+                    delay = (weight - self._tokens) / self._rate
+
+                self.waited += delay
+                await sleep(delay)
+
+
+class BingXClient:  # REST BingX поверх общей ClientSession: подпись, лимиты, повторы GET, склейка одинаковых GET
+    def __init__(self, base_url: str, secret_key: str, rates: dict, retries: int, backoff: float):
+        self._base_url = base_url
+        self._signer = hmac_new((secret_key or '').encode(), digestmod=sha256)  # Ключ готовится один раз, на запрос copy()
+        self._buckets = {group: TokenBucket(rate, burst) for group, (rate, burst) in rates.items()}
+        for group, bucket in self._buckets.items():
+            metrics.counter('bingx_rest_limit_wait_seconds_total', 'Ожидание лимита группы эндпоинтов, сек',
+                            func=lambda bucket=bucket: bucket.waited, group=group)
+        self._retries = retries
+        self._backoff = backoff
+        self._in_flight = {}  # (endpoint, параметры без timestamp): Task - одинаковые GET ждут один запрос
+        self.latency = {}  # endpoint: Histogram задержек, мс
+        self.stats = {'requests': 0, 'retries': 0, 'coalesced': 0, 'failed': 0}
+        for key in self.stats:
+            metrics.counter(f'bingx_rest_{key}_total', f'REST BingX: {key}', func=lambda key=key: self.stats[key])
+
+    def scale_rates(self, share: float):
+        for bucket in self._buckets.values():
+            bucket.scale(share)
+
+    def _sign(self, params_str: str):
+        signer = self._signer.copy()
+        signer.update(params_str.encode())
+        return signer.hexdigest()
+
+    async def request(self, method: str, session: ClientSession, endpoint: str, params: dict):
+        # Результат как у прежнего _send_request: (data, "OK") или (None, текст ошибки)
+        if method != 'GET':
+            return await self._send(method, session, endpoint, params)
+
+        key = (endpoint, tuple(sorted(params.items())))
+        if (task := self._in_flight.get(key)) is not None:
+            self.stats['coalesced'] += 1
+        else:
+            task = self._in_flight[key] = create_task(self._get_with_retry(session, endpoint, params))
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        return await shield(task)  # Отмена одного ожидающего не отменяет общий запрос
+
+    async def _get_with_retry(self, session: ClientSession, endpoint: str, params: dict):
+        for attempt in range(self._retries + 1):
+            data, text, retry = await self._send('GET', session, endpoint, dict(params), with_retry=True)
+            if not retry or attempt == self._retries:
+                break
+
+            self.stats['retries'] += 1
+            await sleep(self._backoff * 2 ** attempt * (0.5 + random()))  # Экспонента с джиттером
+
+        if data is None:
+            self.stats['failed'] += 1
+        return data, text
+
+    async def _send(self, method: str, session: ClientSession, endpoint: str, params: dict, with_retry: bool = False):
+        if (bucket := self._buckets.get(ENDPOINT_GROUPS.get(endpoint, 'market'))) is not None:
+            await bucket.acquire()
+
+        params['timestamp'] = int(time() * 1000)
+        params_str = "&".join([f"{x}={params[x]}" for x in sorted(params)])
+        url = f"{self._base_url}{endpoint}?{params_str}&signature={self._sign(params_str)}"
+
+        self.stats['requests'] += 1
+        started = perf_counter()
+        data, text, retry = None, '', False
+        try:
+            async with session.request(method, url) as response:
+                self._apply_rate_headers(bucket, response.headers)
+
+                if response.status == 200:
+                    if response.content_type == 'application/json':
+                        data = await response.json()
+                    elif response.content_type == 'text/plain':
+                        data = loads(await response.text())
+                    else:
+                        text = f"Неожиданный Content-Type send_request: {response.content_type}"
+
+                    if data is not None:
+                        text, retry = "OK", isinstance(data, dict) and data.get('code') in RETRY_CODES
+
+                else:
+                    text = f"Ошибка {response.status} для {params.get('symbol')}: {await response.text()}"
+                    retry = response.status in RETRY_STATUSES
+
+        except (ClientError, TimeoutError) as e:
+            text, retry = f'Ошибка соединения с сетью (send_request): {e}', True
+
+        except JSONDecodeError as e:
+            text = f"Ошибка декодирования send_request JSON: {e}"
+
+        except Exception as e:
+            text = f"Ошибка при выполнении запроса send_request: {e}"
+
+        if (histogram := self.latency.get(endpoint)) is None:
+            histogram = self.latency[endpoint] = metrics.histogram('bingx_rest_latency_ms', 'Задержка REST BingX, мс',
+                                                                   endpoint=endpoint)
+        histogram.observe((perf_counter() - started) * 1000)
+        return (data, text, retry) if with_retry else (data, text)
+
+    @staticmethod
+    def _apply_rate_headers(bucket: TokenBucket | None, headers):
+        # Retry-After (сек) и X-RateLimit-Requests-Remain/Expire (мс) BingX: лимит исчерпан - ждем его сброса
+        if bucket is None:
+            return
+
+        if (retry_after := headers.get('Retry-After')) is not None:
+            bucket.pause(float(retry_after))
+        elif headers.get('X-RateLimit-Requests-Remain') == '0':
+            bucket.pause(float(headers.get('X-RateLimit-Requests-Expire', 1000)) / 1000)
+
+    def latency_report(self):
+        return '\n'.join(f'{endpoint}: {histogram}' for endpoint, histogram in self.latency.items())
+
+
+bingx_client = BingXClient(config.BASE_URL, config.SECRET_KEY, config.REST_RATES, config.REST_RETRIES,
+                           config.REST_BACKOFF)
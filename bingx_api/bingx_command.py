@@ -1,99 +1,108 @@
-from asyncio import sleep, gather
+from asyncio import sleep, gather, create_task, wait_for, TimeoutError as AsyncTimeoutError
 from datetime import datetime
 from decimal import Decimal
-from gzip import decompress
-from time import time
-from hmac import new as hmac_new
-from hashlib import sha256
+from time import monotonic, perf_counter
 
-from aiohttp import ClientSession, ClientConnectorError
+from aiohttp import ClientSession
 from sqlalchemy.ext.asyncio import AsyncSession
 from logging import getLogger
-from json import loads, JSONDecodeError
 
 from common.config import config
-from common.func import get_decimal_places, add_task
-from database.orm_query import add_order, update_profit, del_orders
-from bingx_api.bingx_models import WebSocketPrice, SymbolOrderManager, AccountManager, TaskManager, ConfigManager
+from common.func import add_task
+from common.logs import Lazy, log_sampler
+from common.metrics import metrics
+from common.strategy import cost_with_fee
+from database.persistence import persist_queue
+from bingx_api.bingx_client import bingx_client
+from bingx_api.ws_decode import decode_message, PING, PONG
+from bingx_api.bingx_models import WebSocketPrice, SymbolOrderManager, AccountManager, TaskSupervisor, ConfigManager, \
+    CandleBuilders, TriggerDispatcher, SymbolMetadata
 
 logger = getLogger('my_app')
 
 ws_price = WebSocketPrice()
 so_manager = SymbolOrderManager()
 account_manager = AccountManager()
-task_manager = TaskManager()
+task_supervisor = TaskSupervisor(config.TASK_RESTART_BACKOFF, config.TASK_RESTART_BACKOFF_MAX, config.TASK_STABLE_AFTER)
 config_manager = ConfigManager()
-
-
-async def _send_request(method: str, session: ClientSession, endpoint: str, params: dict):
-    params['timestamp'] = int(time() * 1000)
-    params_str = "&".join([f"{x}={params[x]}" for x in sorted(params)])
-    sign = hmac_new(config.SECRET_KEY.encode(), params_str.encode(), sha256).hexdigest()
-    url = f"{config.BASE_URL}{endpoint}?{params_str}&signature={sign}"
-
-    try:
-        async with session.request(method, url) as response:
-            if response.status == 200:
-                if response.content_type == 'application/json':
-                    data = await response.json()
-                elif response.content_type == 'text/plain':
-                    data = loads(await response.text())
-                else:
-                    return None, f"Неожиданный Content-Type send_request: {response.content_type}"
-
-                return data, "OK"
-
-            else:
-                return None, f"Ошибка {response.status} для {params.get('symbol')}: {await response.text()}"
-
-    except ClientConnectorError as e:
-        return None, f'Ошибка соединения с сетью (send_request): {e}'
-
-    except JSONDecodeError as e:
-        return None, f"Ошибка декодирования send_request JSON: {e}"
-
-    except Exception as e:
-        return None, f"Ошибка при выполнении запроса send_request: {e}"
+candle_builders = CandleBuilders(config.CANDLE_INTERVALS)
+trigger_dispatcher = TriggerDispatcher(so_manager, config_manager)
+symbol_meta = SymbolMetadata()
+
+# Метрики горячих путей
+TICK_TO_DECISION = metrics.histogram('tick_to_decision_ms',
+                                     'От получения тика в price_upd_ws до решения в start_trading, мс')
+ORDER_ROUNDTRIP = {side: metrics.histogram('order_roundtrip_ms', 'Запрос ордера на бирже, мс', side=side)
+                   for side in ('BUY', 'SELL')}
+ORDERS = {(side, ok): metrics.counter('orders_total', 'Ордера на бирже', side=side, result='ok' if ok else 'error')
+          for side in ('BUY', 'SELL') for ok in (True, False)}
+WS_CONNECTS = {stream: metrics.counter('ws_connects_total', 'Подключения websocket, повторные - переподключения',
+                                       stream=stream) for stream in ('price', 'account')}
+WS_MESSAGES = {stream: metrics.counter('ws_messages_total', 'Сообщения websocket', stream=stream)
+               for stream in ('price', 'account')}
+WS_ERRORS = {stream: metrics.counter('ws_errors_total', 'Ошибки разбора сообщений websocket', stream=stream)
+             for stream in ('price', 'account')}
+WS_HANDLE = metrics.histogram('ws_message_handle_ms', 'Разбор и обработка сообщения price_upd_ws, мс')
 
 
 async def get_candlestick_data(symbol: str, session: ClientSession, interval: str, limit: int):
     endpoint = '/openApi/spot/v2/market/kline'
     params = {"symbol": f'{symbol}-USDT', "interval": interval, "limit": limit}
 
-    return await _send_request("GET", session, endpoint, params)
+    return await bingx_client.request("GET", session, endpoint, params)
 
 
 async def place_order(symbol: str, session: ClientSession, side: str, executed_qty: float | Decimal):
     endpoint = '/openApi/spot/v1/trade/order'
     params = {"symbol": f'{symbol}-USDT', "type": "MARKET", "side": side, "quantity": executed_qty}
 
-    return await _send_request("POST", session, endpoint, params)
+    started = perf_counter()
+    data, text = await bingx_client.request("POST", session, endpoint, params)
+    ORDER_ROUNDTRIP[side].observe((perf_counter() - started) * 1000)
+    ORDERS[side, bool(data and data.get('data'))].inc()
+    return data, text
 
 
 async def get_symbol_info(symbol: str, session: ClientSession):
     endpoint = '/openApi/spot/v1/common/symbols'
     params = {"symbol": f'{symbol}-USDT'}
 
-    return await _send_request("GET", session, endpoint, params)
+    return await bingx_client.request("GET", session, endpoint, params)
+
+
+async def get_symbols_info(session: ClientSession):  # Все символы одним запросом
+    return await bingx_client.request("GET", session, '/openApi/spot/v1/common/symbols', {})
+
+
+async def manage_symbol_meta(http_session: ClientSession):
+    while True:
+        data, text = await get_symbols_info(http_session)
+        if data and (symbols := (data.get('data') or {}).get('symbols')):
+            count = symbol_meta.update(symbols, monotonic())
+            logger.info(f'Фильтры символов обновлены: {count} USDT-пар')
+            await sleep(config.SYMBOLS_META_TTL)
+        else:
+            logger.error(f'Ошибка получения фильтров символов: {text} {data}')
+            await sleep(config.SYMBOLS_META_RETRY)
 
 
 async def manage_listen_key(http_session: ClientSession):
     endpoint = '/openApi/user/auth/userDataStream'
 
-    listen_key, text = await _send_request("POST", http_session, endpoint, {})
-    if listen_key is None:
+    listen_key, text = await bingx_client.request("POST", http_session, endpoint, {})
+    if not listen_key or 'listenKey' not in listen_key:
         logger.error(f'Ошибка получения listen_key: {text}')
         return
 
     await account_manager.add_listen_key(listen_key['listenKey'])
     while True:
         await sleep(1200)
-        await _send_request("PUT", http_session, endpoint, {"listenKey": listen_key['listenKey']})
+        await bingx_client.request("PUT", http_session, endpoint, {"listenKey": listen_key['listenKey']})
 
 
 async def _check_usdt_balance(lot: float):
-    usdt_block = await account_manager.get_usdt_block()
-    usdt_balance = await account_manager.get_balance('USDT')
+    usdt_block = account_manager.usdt_block
+    usdt_balance = account_manager.balance('USDT')
     report = f'\nБаланс слишком маленький: {usdt_balance}\n'
 
     if usdt_balance > lot and usdt_block in ('block', 'continue_block'):
@@ -110,88 +119,153 @@ async def _check_usdt_balance(lot: float):
         return report
 
 
+# Покупки, отклоненные без запроса к бирже (нет лота, check_order): symbol -> _buy_inputs на момент отказа.
+# start_trading не повторяет такую покупку, пока не изменятся уровни, конфиг или фильтры символа
+_buy_rejected = {}
+
+
+def _buy_inputs(symbol: str):
+    return (trigger_dispatcher.levels(symbol), config_manager.snapshot(symbol),
+            symbol_meta.get(symbol, so_manager.get(symbol).step_size))
+
+
+def buy_blocked(symbol: str):
+    return symbol in _buy_rejected and _buy_rejected[symbol] == _buy_inputs(symbol)
+
+
+def _reject_buy(symbol: str, report: str):
+    _buy_rejected[symbol] = _buy_inputs(symbol)
+    logger.warning(report, extra={'symbol': symbol})
+    return report
+
+
+_sell_rejected = {}  # Продажа отклонена без запроса к бирже: повторяем, когда изменятся ордера или фильтры
+
+
+def _sell_inputs(symbol: str):
+    return so_manager.get(symbol).summary, symbol_meta.get(symbol, so_manager.get(symbol).step_size)
+
+
+def sell_blocked(symbol: str):
+    return symbol in _sell_rejected and _sell_rejected[symbol] == _sell_inputs(symbol)
+
+
 async def place_buy_order(symbol: str, price: float, session: AsyncSession, http_session: ClientSession):
-    if not (lot := await config_manager.get_data(symbol, 'lot')):
-        report = f'\nНе удалось получить лот для {symbol}\n'
-        logger.warning(report)
-        return report
+    if not (lot := config_manager.get(symbol, 'lot')):
+        return _reject_buy(symbol, f'\nНе удалось получить лот для {symbol}\n')
 
     if report := await _check_usdt_balance(lot):
         return report
 
-    # Округляем стоимость покупки до ближайшего кратного step_size
-    execute_qty = round(lot / price, get_decimal_places(await so_manager.get_step_size(symbol)))
+    # Округляем количество до шага биржи; ордер, который биржа заведомо отклонит, не отправляем
+    filters = symbol_meta.get(symbol, so_manager.get(symbol).step_size)
+    execute_qty = symbol_meta.quantize_qty(filters, lot / price)
+    if reason := symbol_meta.check_order(filters, execute_qty, price):
+        return _reject_buy(symbol, f'\nОрдер НЕ открыт {symbol}: {reason}\n')
+    _buy_rejected.pop(symbol, None)
 
     data, text = await place_order(symbol, http_session, 'BUY', executed_qty=execute_qty)
 
-    if not (order_data := data.get("data")):
-        if data["code"] == 100202:  # Если ответ от биржи 100202, то нехватает средств, блокируем покупки
+    if not (order_data := data and data.get("data")):
+        if data and data.get("code") == 100202:  # Если ответ от биржи 100202, то нехватает средств, блокируем покупки
             await account_manager.set_usdt_block('block')
 
         report = f'\n\nОрдер НЕ открыт {symbol}: {text} {data}\n'
-        logger.error(report)
+        logger.error(report, extra={'symbol': symbol})
         return report
 
     data_for_db = {
         'price': float(order_data['price']),
         'executed_qty': float(order_data['executedQty']),
         'cost': (cost := float(order_data['cummulativeQuoteQty'])),
-        'cost_with_fee': cost * (1 + config.TAKER_MAKER),  # 0.4% комиссия(на бирже 0.1% + 0.1%)
+        'cost_with_fee': cost_with_fee(cost, config.TAKER_MAKER),  # 0.4% комиссия(на бирже 0.1% + 0.1%)
         'open_time': datetime.fromtimestamp(order_data['transactTime'] / 1000)
     }
 
-    report = f"""\n
-              RSI_lot: {await config_manager.get_data(symbol, 'lot')}
-              main_lot: {await config_manager.get_data(symbol, 'main_lot')}
-              balance: {await account_manager.get_balance('USDT')}
-              cummulativeQuoteQty: {order_data['cummulativeQuoteQty']}
-              execute_qty: {order_data['executedQty']}
-              Ордер открыт {symbol}  {str(data)}\n
-"""
-
-    order_id = await add_order(session, symbol, data_for_db)  # Добавить ордер в базу
+    order_id = persist_queue.add_order(symbol, data_for_db)  # В БД запишется фоном (write-behind)
     data_for_db['id'] = order_id  # Добавить id ордера в память
     await so_manager.update_order(symbol, data_for_db)  # Добавить ордер в память
 
-    logger.info(report)
+    # Отчет собирается в потоке логов или по запросу хэндлера, значения фиксируем сейчас
+    report = Lazy(_buy_report, symbol, config_manager.get(symbol, 'lot'), config_manager.get(symbol, 'main_lot'),
+                  account_manager.balance('USDT'), data)
+    logger.info('%s', report, extra={'symbol': symbol, 'order_id': order_data.get('orderId')})
     return report
 
 
+def _buy_report(symbol: str, lot: float, main_lot: float, balance: float, data: dict):
+    order_data = data['data']
+    return f"""\n
+              RSI_lot: {lot}
+              main_lot: {main_lot}
+              balance: {balance}
+              cummulativeQuoteQty: {order_data['cummulativeQuoteQty']}
+              execute_qty: {order_data['executedQty']}
+              Ордер открыт {symbol}  {str(data)}\n
+"""
+
+
 async def place_sell_order(symbol: str, summary_executed: float, total_cost_with_fee: float, session: AsyncSession,
                            http_session: ClientSession, orders_id: list = None):
     # Ордер на продажу по суммарной стоимости покупки монеты, напр 0.00011 BTC
+    filters = symbol_meta.get(symbol, so_manager.get(symbol).step_size)
+    summary_executed = symbol_meta.quantize_qty(filters, summary_executed)  # Сумма float может дать 0.30000000000000004
+    if (tick := ws_price.price(symbol)) and (reason := symbol_meta.check_order(filters, summary_executed, tick[1])):
+        if orders_id is None:  # Продажа всех ордеров - как в start_trading
+            _sell_rejected[symbol] = _sell_inputs(symbol)
+        report = f'\n\nПродажа не прошла {symbol} summary_executed {summary_executed}: {reason}\n\n'
+        logger.warning(report, extra={'symbol': symbol})
+        return report
+    _sell_rejected.pop(symbol, None)
+
     order_data, text = await place_order(symbol, http_session, 'SELL', summary_executed)
-    if not (order_data_ok := order_data.get("data")):
+    if not (order_data_ok := order_data and order_data.get("data")):
         report = f'\n\nПродажа не прошла {symbol} summary_executed {summary_executed}: {text}\n{str(order_data)}\n\n'
-        logger.error(report)
+        logger.error(report, extra={'symbol': symbol})
         return report
 
-    _, price = await  ws_price.get_price(symbol)
-    real_profit = float(order_data_ok["cummulativeQuoteQty"]) - total_cost_with_fee
+    _, price = ws_price.price(symbol)
+    revenue = float(order_data_ok["cummulativeQuoteQty"])
+    real_profit = revenue - total_cost_with_fee
+    orders_count, open_time = so_manager.get(symbol).orders.opened(orders_id)
+    close_time = datetime.fromtimestamp(order_data_ok['transactTime'] / 1000) if 'transactTime' in order_data_ok \
+        else datetime.now()
 
     await gather(
         so_manager.update_profit(symbol, real_profit),
         so_manager.del_orders(symbol, orders_id),
     )
 
-    await update_profit(symbol, session, real_profit)
-    await del_orders(symbol, session, orders_id)
-    await session.commit()
-
-    report = (f'\n\nРасчет моей программы:\n'
-              f'orders_id: {orders_id}\n'
-              f'summary_executed: {summary_executed}\n'
-              f'Сумма в бирже price * summary_executed: {price * summary_executed}\n'
-              f'Сумма с комиссией total_cost_with_fee: {total_cost_with_fee}\n'
-              f'Доход cummulativeQuoteQty: {real_profit}\n'
-              f'\nОрдера закрыты {symbol}\n{str(order_data_ok)}\n')
+    persist_queue.update_profit(symbol, real_profit)
+    persist_queue.del_orders(symbol, orders_id)
+    persist_queue.add_trade(symbol, {'order_id': str(order_data_ok.get('orderId')), 'orders_count': orders_count,
+                                     'executed_qty': summary_executed, 'cost_with_fee': total_cost_with_fee,
+                                     'revenue': revenue, 'profit': real_profit,
+                                     'open_time': open_time or close_time, 'close_time': close_time})
+    try:
+        await wait_for(persist_queue.flush(), config.PERSIST_FLUSH_TIMEOUT)  # Продажу подтверждаем после commit
+    except AsyncTimeoutError:  # Продажа на бирже уже прошла, в памяти учтена - не блокируем торговлю символа
+        logger.error(f'Продажа {symbol} не записана в БД за {config.PERSIST_FLUSH_TIMEOUT} с', extra={'symbol': symbol})
 
-    logger.info(report)
+    report = Lazy(_sell_report, symbol, orders_id, summary_executed, price, total_cost_with_fee, real_profit,
+                  order_data_ok)
+    logger.info('%s', report, extra={'symbol': symbol, 'order_id': order_data_ok.get('orderId')})
     return report
 
 
+def _sell_report(symbol: str, orders_id: list, summary_executed: float, price: float, total_cost_with_fee: float,
+                 real_profit: float, order_data: dict):
+    return (f'\n\nРасчет моей программы:\n'
+            f'orders_id: {orders_id}\n'
+            f'summary_executed: {summary_executed}\n'
+            f'Сумма в бирже price * summary_executed: {price * summary_executed}\n'
+            f'Сумма с комиссией total_cost_with_fee: {total_cost_with_fee}\n'
+            f'Доход cummulativeQuoteQty: {real_profit}\n'
+            f'\nОрдера закрыты {symbol}\n{str(order_data)}\n')
+
+
 async def account_upd_ws(http_session: ClientSession):
-    while not (listen_key := await account_manager.get_listen_key()):
+    while not (listen_key := account_manager.listen_key):
         await sleep(0.3)  # Задержка перед попыткой получения ключа
 
     channel = {"id": "1", "reqType": "sub", "dataType": "ACCOUNT_UPDATE"}
@@ -201,15 +275,22 @@ async def account_upd_ws(http_session: ClientSession):
         try:
             async with http_session.ws_connect(url) as ws:
                 print(f"WebSocket connected account_upd_ws")
+                WS_CONNECTS['account'].inc()
                 await ws.send_json(channel)
 
                 async for message in ws:
+                    WS_MESSAGES['account'].inc()
                     try:
-                        if 'e' in (data := loads(decompress(message.data).decode())):
+                        if (data := decode_message(message.data)) is PING:
+                            await ws.send_str(PONG)
+
+                        elif 'e' in data:
                             await account_manager.update_balance_batch(data['a']['B'])
-                            logger.info(f"Account_upd_ws: {data['a']}")
+                            if (suppressed := log_sampler.take('account_upd_ws')) is not None:
+                                logger.debug('Account_upd_ws: %s', data['a'], extra={'suppressed': suppressed})
 
                     except Exception as e:
+                        WS_ERRORS['account'].inc()
                         logger.error(f"Непредвиденная ошибка account_upd_ws: {e}, сообщение: {message.data}")
 
         except Exception as e:
@@ -219,73 +300,145 @@ async def account_upd_ws(http_session: ClientSession):
         await sleep(5)
 
 
-@add_task(task_manager, so_manager, 'price_upd')
-async def price_upd_ws(symbol, **kwargs):
-    seconds = kwargs.get('seconds', 0)
-    http_session = kwargs.get('http_session')
-
-    channel = {"id": '1', "reqType": "sub", "dataType": f"{symbol}-USDT@lastPrice"}
-    await sleep(seconds)  # Задержка перед запуском функции, иначе ошибка API
-
-    while True:
-        try:
-            async with http_session.ws_connect(config.URL_WS) as ws:
-                print(f"WebSocket connected price_upd_ws for {symbol}")
-                await ws.send_json(channel)
-
-                async for message in ws:
-                    try:
-                        if 'data' in (data := loads(decompress(message.data).decode())):
-                            await ws_price.update_price(symbol, int(time() * 1000), float(data["data"]["c"]))
-
-                    except Exception as e:
-                        logger.error(f"Непредвиденная ошибка price_upd_ws: {e}, сообщение: {message.data}")
-
-        except Exception as e:
-            print(f"Критическая ошибка price_upd_ws: {symbol}, {e}")
-
-        # logger.error(f"price_upd_ws для {symbol} завершился. Переподключение через 5 секунд.")
-        await sleep(5)  # Пауза перед повторным подключением
-
-
-@add_task(task_manager, so_manager, 'start_trading')
+WS_KLINE_INTERVALS = {'1m': '1min', '5m': '5min', '15m': '15min', '1h': '60min', '4h': '4hour', '1d': '1day'}
+
+
+class PriceStream:  # Подписки lastPrice (и kline) всех символов на общих websocket, не больше channels_limit каналов
+    def __init__(self, channels_limit: int):
+        # Каналы символа: lastPrice + по каналу kline на интервал, если бары сверяются с биржей
+        self._channel_types = ['lastPrice'] + [f'kline_{WS_KLINE_INTERVALS[interval]}'
+                                               for interval in config.CANDLE_INTERVALS if config.KLINE_WS]
+        self._kline_intervals = {f'kline_{WS_KLINE_INTERVALS[interval]}': interval
+                                 for interval in config.CANDLE_INTERVALS}
+        self._symbols_limit = max(1, channels_limit // len(self._channel_types))
+        self._shards = []  # [{'symbols': set(), 'ws': None, 'task': Task}, ...] - одно соединение на шард
+        self._http_session = None
+        metrics.gauge('ws_price_connections', 'Открытые websocket цен',
+                      func=lambda: sum(shard['ws'] is not None for shard in self._shards))
+
+    async def _send_channels(self, ws, symbol: str, req_type: str):
+        for channel_type in self._channel_types:
+            await ws.send_json({"id": f'{symbol}-{channel_type}-{req_type}', "reqType": req_type,
+                                "dataType": f"{symbol}-USDT@{channel_type}"})
+
+    async def start(self, http_session: ClientSession, symbols: list):
+        self._http_session = http_session
+        for symbol in symbols:
+            await self.subscribe(symbol)
+
+    async def subscribe(self, symbol: str):
+        if any(symbol in shard['symbols'] for shard in self._shards):
+            return
+
+        # Ищем соединение со свободным местом, иначе открываем новое
+        if not (shard := next((s for s in self._shards if len(s['symbols']) < self._symbols_limit), None)):
+            shard = {'symbols': set(), 'ws': None}
+            self._shards.append(shard)
+            shard['task'] = create_task(self._run_shard(shard, len(self._shards)))
+
+        shard['symbols'].add(symbol)
+        if (ws := shard['ws']) is not None and not ws.closed:  # Соединение живое, подписываемся без переподключения
+            await self._send_channels(ws, symbol, 'sub')
+
+        print(f'Запущено отслеживание price_upd {symbol}')
+
+    async def unsubscribe(self, symbol: str):
+        for shard in self._shards:
+            if symbol in shard['symbols']:
+                shard['symbols'].discard(symbol)
+                candle_builders.remove(symbol)  # Бары после паузы строим заново, старый незакрытый бар неполон
+                if (ws := shard['ws']) is not None and not ws.closed:
+                    await self._send_channels(ws, symbol, 'unsub')
+
+                print(f'Остановлено отслеживание price_upd {symbol}')
+                return
+
+    async def _run_shard(self, shard: dict, number: int):
+        while True:  # Цикл для повторного подключения
+            try:
+                async with self._http_session.ws_connect(config.URL_WS) as ws:
+                    print(f"WebSocket connected price_upd_ws #{number}, символов: {len(shard['symbols'])}")
+                    WS_CONNECTS['price'].inc()
+                    shard['ws'] = ws  # Сначала ws, потом подписки: новые символы из subscribe уйдут сразу в ws
+
+                    for symbol in list(shard['symbols']):
+                        await self._send_channels(ws, symbol, 'sub')
+                        await sleep(config.WS_SUB_DELAY)  # Не превышаем лимит подписок API
+
+                    async for message in ws:
+                        received = perf_counter()
+                        WS_MESSAGES['price'].inc()
+                        try:
+                            if (data := decode_message(message.data)) is PING:
+                                await ws.send_str(PONG)
+
+                            elif payload := data.get('data'):  # Подтверждения подписки приходят без data
+                                symbol, channel_type = data['dataType'].split('-USDT@', 1)
+                                if symbol in shard['symbols']:  # Пропускаем сообщения после отписки
+                                    await self._on_data(symbol, channel_type, payload, received)
+
+                        except Exception as e:
+                            WS_ERRORS['price'].inc()
+                            logger.error(f"Непредвиденная ошибка price_upd_ws: {e}, сообщение: {message.data}")
+
+                        WS_HANDLE.observe((perf_counter() - received) * 1000)
+
+            except Exception as e:
+                print(f"Критическая ошибка price_upd_ws #{number}: {e}")
+
+            shard['ws'] = None
+            # logger.error(f"price_upd_ws #{number} завершился. Переподключение через 5 секунд.")
+            await sleep(5)  # Пауза перед повторным подключением
+
+    async def _on_data(self, symbol: str, channel_type: str, data: dict, received: float = None):
+        if channel_type == 'lastPrice':
+            # Время события биржи, а не локальные часы: границы баров не плывут от расхождения часов
+            price = float(data["c"])
+            candle_builders.get(symbol).on_tick(data['E'], price)  # Бары раньше цены: индикаторы увидят закрытие
+            await ws_price.update_price(symbol, data['E'], price)
+            trigger_dispatcher.on_tick(symbol, ws_price.price(symbol), received)
+
+        elif interval := self._kline_intervals.get(channel_type):
+            kline = data['K']
+            candle_builders.get(symbol).reconcile(interval, (kline['t'], float(kline['o']), float(kline['h']),
+                                                             float(kline['l']), float(kline['c']), float(kline['v'])))
+
+
+price_stream = PriceStream(config.WS_CHANNELS_LIMIT)
+
+
+@add_task(task_supervisor, so_manager, 'start_trading')
 async def start_trading(symbol, **kwargs):
     session = kwargs.get('session')
     http_session = kwargs.get('http_session')
     async_session = kwargs.get('async_session')
-    target_profit = config.TARGET_PROFIT
     # partly_target_profit = 0.006  # 0.6%
 
     async def trading_logic():
-        while not await config_manager.get_data(symbol, 'init_rsi'):
+        while not config_manager.get(symbol, 'init_rsi'):
             await sleep(0.3)  # Задержка перед попыткой данных rsi
 
-        logger.info(f'Запуск торговли Full {symbol}')
+        logger.info(f'Запуск торговли Full {symbol}', extra={'symbol': symbol})
 
+        tick = None
         while True:
-            _, price = await ws_price.get_price(symbol)
-
-            if summary_executed := await so_manager.get_summary(symbol, 'executed_qty'):
-                total_cost_with_fee = await so_manager.get_summary(symbol, 'cost_with_fee')
-                total_cost_with_fee_tp = total_cost_with_fee * (1 + target_profit)
-                profit_to_target = price * summary_executed - total_cost_with_fee_tp
-
-                # Создаем ордер на продажу по всем ордерам, если доход > 1%
-                if profit_to_target > 0:
-                    await place_sell_order(symbol, summary_executed, total_cost_with_fee, session, http_session)
-
-            # Ордер на покупку, если цена ниже (1%) от цены последнего ордера (если ордеров нет, то открываем новый)
-            if await so_manager.get_state(symbol) == 'track' and await so_manager.get_b_s_trigger(symbol) == 'buy':
-                if last_order := await so_manager.get_last_order(symbol):
-                    next_price = last_order['price'] * (1 - await config_manager.get_data(symbol, 'target_grid_size'))
-
-                    if price < next_price:
-                        await place_buy_order(symbol, price, session, http_session)
-
-                else:  # Если нет последнего ордера, то покупаем сразу
-                    await place_buy_order(symbol, price, session, http_session)
-
-            await sleep(1)
+            tick = await trigger_dispatcher.wait(symbol, tick)  # Просыпаемся только на тик за пределами уровней
+            _, price = ws_price.price(symbol)  # Пока ждали, цена могла вернуться внутрь уровней
+            if (received := trigger_dispatcher.received(symbol)) is not None:
+                TICK_TO_DECISION.observe((perf_counter() - received) * 1000)
+
+            # Продаем все ордера, если доход > 1%. После отказа без запроса к бирже - ждем смены ордеров или фильтров
+            if price > trigger_dispatcher.levels(symbol).take_profit and not sell_blocked(symbol):
+                summary = so_manager.get(symbol).summary
+                await place_sell_order(symbol, summary.executed_qty, summary.cost_with_fee, session, http_session)
+
+            # Покупаем, если цена ниже (1%) от цены последнего ордера (если ордеров нет, то сразу).
+            # Уровни читаем заново: после продажи они пересчитаны
+            # После отказа без запроса к бирже - ждем изменения уровней, конфига или фильтров
+            if price < trigger_dispatcher.levels(symbol).next_buy and not buy_blocked(symbol):
+                await place_buy_order(symbol, price, session, http_session)
+
+            await sleep(config.TRADING_MIN_INTERVAL)  # Ограничение частоты, тики за это время схлопываются в последний
 
     if session is None:  # Сессия не передана, создаем новый async_session_maker
         async with async_session() as session:
@@ -1,187 +1,642 @@
-from asyncio import Lock, CancelledError
-from collections import defaultdict
+from asyncio import Event, CancelledError, create_task, sleep
+from collections import defaultdict, deque
+from datetime import timedelta
+from logging import getLogger
+from math import isclose, inf
+from time import monotonic
+from types import MappingProxyType
+from typing import NamedTuple
+
+from numpy import dtype, zeros, isin, array as np_array, ndarray, concatenate
+
+from common.config import config
+from common.func import get_decimal_places
+from common.metrics import metrics, TimedLock
+from common.strategy import take_profit_price, next_buy_price
+from indicators.candle_store import INTERVAL_MS
+
+logger = getLogger('my_app')
+
+SUMMARY_KEYS = ('executed_qty', 'cost', 'cost_with_fee')
+ORDER_DTYPE = dtype([('id', 'i8'), ('price', 'f8'), ('executed_qty', 'f8'), ('cost', 'f8'), ('cost_with_fee', 'f8'),
+                     ('open_time', 'datetime64[ms]')])  # 48 байт на ордер
+
+# Ожидание захвата занятых lock менеджеров, мс
+LOCK_WAIT = {name: metrics.histogram('lock_wait_ms', 'Ожидание занятого lock менеджера, мс', lock=name)
+             for name in ('config', 'account', 'tasks', 'symbol')}
+
+# Состояние менеджеров хранится по символам. Чтение синхронное и без lock: объекты-снимки (NamedTuple,
+# MappingProxyType) не изменяются, запись заменяет снимок целиком под lock своего символа.
+# Исключение - OrderStore: меняется на месте под lock символа, между await его никто не видит частично.
+# async-методы get_*/set_* оставлены для совместимости со старым кодом и хэндлерами.
+
+
+EMPTY_CONFIG = MappingProxyType({})
+CLOSED_BARS_LIMIT = 1000  # Закрытые бары символа, которые никто не забирает (индикаторы не запущены), не копим
 
 
 class ConfigManager:
     def __init__(self):
         self.symbols = []
-        self._data = defaultdict(dict)
-        self._lock = Lock()
+        self._data = {}
+        self._locks = defaultdict(lambda: TimedLock(LOCK_WAIT['config']))
+        self.listeners = []  # callback(symbol) после изменения конфига символа
 
     async def load_config(self, batch_data: dict):
-        async with self._lock:
-            for data in batch_data:
-                self.symbols.append(data.symbol_name)
-                self._data[data.symbol_name]['grid_size'] = data.grid_size
-                # self._data[data.symbol_name]['lot'] = data.lot
+        for data in batch_data:
+            self.symbols.append(data.symbol_name)
+            await self.set_data(data.symbol_name, 'grid_size', data.grid_size)
+            # await self.set_data(data.symbol_name, 'lot', data.lot)
+
+    def clear(self):  # Перед повторной загрузкой из БД
+        self.symbols.clear()
+        self._data.clear()
+
+    def get(self, symbol: str, key: str):
+        return self._data.get(symbol, EMPTY_CONFIG).get(key)
+
+    def snapshot(self, symbol: str):
+        return self._data.get(symbol, EMPTY_CONFIG)
 
     async def set_data(self, symbol: str, key: str, value: float | bool):
-        async with self._lock:
-            self._data[symbol][key] = value
+        async with self._locks[symbol]:
+            self._data[symbol] = MappingProxyType({**self.snapshot(symbol), key: value})
+            for listener in self.listeners:
+                listener(symbol)
 
     async def get_data(self, symbol: str, key: str):
-        async with self._lock:
-            return self._data.get(symbol).get(key)
+        return self.get(symbol, key)
 
 
 class AccountManager:  # Класс для работы с данными счета
     def __init__(self):
-        self._balance = {}
+        self._balance = MappingProxyType({})
         self._usdt_block = 'unblock'
         self._listen_key = None
-        self._lock = Lock()
+        self._lock = TimedLock(LOCK_WAIT['account'])
+        self.listeners = []  # callback(kind, value) после update_balance_batch ('balance') и set_usdt_block
+
+    def balance(self, symbol: str):
+        return self._balance.get(symbol, 0.0)
+
+    @property
+    def balances(self):
+        return self._balance
+
+    def _notify(self, kind: str, value):
+        for listener in self.listeners:
+            listener(kind, value)
+
+    @property
+    def usdt_block(self):
+        return self._usdt_block
+
+    @property
+    def listen_key(self):
+        return self._listen_key
 
     async def update_balance_batch(self, batch_data: list):
         async with self._lock:
-            for data in batch_data:
-                self._balance[data['a']] = float(data['wb'])
+            self._balance = MappingProxyType({**self._balance, **{data['a']: float(data['wb']) for data in batch_data}})
+            self._notify('balance', batch_data)
 
     async def get_balance(self, symbol: str):
-        async with self._lock:
-            return self._balance.get(symbol, 0.0)
+        return self.balance(symbol)
 
     async def add_listen_key(self, listen_key: str):
         async with self._lock:
             self._listen_key = listen_key
 
     async def get_listen_key(self):
-        async with self._lock:
-            return self._listen_key
+        return self._listen_key
 
-    async def set_usdt_block(self, state: str):
+    async def set_usdt_block(self, state: str, notify: bool = True):  # notify=False - состояние пришло извне
         async with self._lock:
             self._usdt_block = state
+            if notify:
+                self._notify('usdt_block', state)
 
     async def get_usdt_block(self):
-        async with self._lock:
-            return self._usdt_block
+        return self._usdt_block
 
 
-class TaskManager:  # Класс для работы с задачами
-    def __init__(self):
-        self._tasks = defaultdict(list)
-        self._lock = Lock()
+class SupervisedTask:  # Задача символа под TaskSupervisor: состояние и статистика запусков
+    __slots__ = ('task', 'state', 'restarts', 'run_time', 'started', 'error')
 
-    async def add_task(self, symbol: str, task):
+    def __init__(self):
+        self.task = None
+        self.state = 'running'  # running, backoff - ждет перезапуска, stopped - отменена
+        self.restarts = 0
+        self.run_time = 0.0  # сумма завершенных запусков, сек
+        self.started = None  # monotonic текущего запуска
+        self.error = None  # причина последней остановки
+
+    @property
+    def uptime(self):
+        return self.run_time + (monotonic() - self.started if self.started is not None else 0.0)
+
+
+class TaskSupervisor:  # Задачи символов: упала или вышла сама - перезапуск с паузой backoff, удваивается до backoff_max
+    def __init__(self, backoff: float, backoff_max: float, stable_after: float):
+        self._backoff = backoff
+        self._backoff_max = backoff_max
+        self._stable_after = stable_after  # Запуск дольше - пауза перезапуска снова с backoff
+        self._tasks = {}  # (symbol, name): SupervisedTask
+        self._lock = TimedLock(LOCK_WAIT['tasks'])
+        metrics.gauge('tasks_running', 'Задачи символов в работе',
+                      func=lambda: sum(entry.state == 'running' for entry in self._tasks.values()))
+        metrics.counter('tasks_restarts_total', 'Перезапуски задач символов',
+                        func=lambda: sum(entry.restarts for entry in self._tasks.values()))
+
+    async def add_task(self, symbol: str, name: str, factory):  # factory() - новая корутина на каждый запуск
         async with self._lock:
-            self._tasks[symbol].append(task)
+            entry = self._tasks.setdefault((symbol, name), SupervisedTask())
+            if entry.task is not None and not entry.task.done():
+                await self._cancel(entry.task)
+
+            entry.task = create_task(self._supervise(symbol, name, entry, factory), name=f'{name} {symbol}')
+            return entry.task
+
+    async def _supervise(self, symbol: str, name: str, entry: SupervisedTask, factory):
+        delay = self._backoff
+        try:
+            while True:
+                entry.state, entry.started = 'running', monotonic()
+                try:
+                    await factory()
+                    entry.error = 'вышла без ошибки'
+                except CancelledError:
+                    raise
+                except Exception as e:
+                    entry.error = repr(e)
+                    logger.exception(f'Задача {name} {symbol} упала', extra={'symbol': symbol})
+                finally:
+                    ran = monotonic() - entry.started
+                    entry.run_time, entry.started = entry.run_time + ran, None
+
+                if ran >= self._stable_after:  # Долго работала - не цикл падений, пауза с начала
+                    delay = self._backoff
+                logger.warning(f'Задача {name} {symbol}: {entry.error}, перезапуск через {delay:g} с',
+                               extra={'symbol': symbol})
+                entry.state, entry.restarts = 'backoff', entry.restarts + 1
+                await sleep(delay)
+                delay = min(delay * 2, self._backoff_max)
+        except CancelledError:
+            entry.state = 'stopped'
+            raise
+
+    @staticmethod
+    async def _cancel(task):
+        task.cancel()
+        try:
+            await task  # Дожидаемся завершения задачи
+        except CancelledError:
+            pass  # Игнорируем CancelledError - это ожидаемое поведение
 
     async def del_tasks(self, symbol: str):
         async with self._lock:
-            for task in self._tasks.pop(symbol, []):
-                if task and not task.done():  # Проверяем, что задача существует и не завершена
-                    task.cancel()
-                    try:
-                        await task  # Дожидаемся завершения задачи
-                    except CancelledError:
-                        pass  # Игнорируем CancelledError - это ожидаемое поведение
+            for (task_symbol, _), entry in self._tasks.items():
+                if task_symbol == symbol and entry.task is not None and not entry.task.done():
+                    await self._cancel(entry.task)
+
+    def report(self):  # Строки для команды tasks
+        lines = [f'{symbol} {name}: {entry.state}, перезапусков {entry.restarts}, '
+                 f'в работе {timedelta(seconds=int(entry.uptime))}' + (f', {entry.error}' if entry.error else '')
+                 for (symbol, name), entry in sorted(self._tasks.items())]
+        return lines or ['Задач нет']
 
 
 class WebSocketPrice:  # Класс для работы с ценами в реальном времени из websockets
     def __init__(self):
-        self._data = {}
-        self._lock = Lock()
+        self._data = {}  # symbol: (time, price) - кортеж заменяется целиком, lock не нужен
+        self._events = defaultdict(Event)  # Событие нового тика по символу, заменяется на новое после каждого тика
+
+    def price(self, symbol: str):
+        return self._data.get(symbol)
 
     async def update_price(self, symbol: str, time: int, price: float):
-        async with self._lock:
-            self._data[symbol] = time, price
+        self._data[symbol] = time, price
+        event, self._events[symbol] = self._events[symbol], Event()
+        event.set()  # Будим всех ожидающих этот символ
+
+    async def wait_price(self, symbol: str, last: tuple = None):
+        # Ждем тик, отличный от last, и возвращаем последний (промежуточные тики не копятся)
+        while (data := self._data.get(symbol)) is None or data is last:
+            await self._events[symbol].wait()
+
+        return data
 
     async def get_price(self, symbol: str):
-        async with self._lock:
-            return self._data.get(symbol)
+        return self.price(symbol)
+
+
+class CandleBuilder:  # Бары OHLCV нескольких интервалов одного символа из потока тиков, время - биржевое
+    __slots__ = ('_steps', '_bars', '_klines', '_closed')
+
+    def __init__(self, intervals: tuple):
+        self._steps = {interval: INTERVAL_MS[interval] for interval in intervals}
+        self._bars = {}  # interval: [open_time, open, high, low, close, volume] текущего бара
+        self._klines = set()  # interval, чей текущий бар сверен с kline websocket
+        # (interval, бар, сверен с kline) закрытые, еще не забранные индикаторами
+        self._closed = deque(maxlen=CLOSED_BARS_LIMIT)
+
+    def bar(self, interval: str):
+        return tuple(bar) if (bar := self._bars.get(interval)) else None
+
+    def on_tick(self, time: int, price: float, volume: float = 0.0):
+        for interval, step in self._steps.items():
+            open_time = time - time % step
+            if (bar := self._bars.get(interval)) is None or open_time > bar[0]:
+                if bar is not None:
+                    self._closed.append((interval, tuple(bar), interval in self._klines))
+                self._bars[interval] = [open_time, price, price, price, price, volume]
+                self._klines.discard(interval)
+
+            elif open_time == bar[0]:
+                if price > bar[2]:
+                    bar[2] = price
+                elif price < bar[3]:
+                    bar[3] = price
+                bar[4] = price
+                bar[5] += volume
+            # Запоздавший тик прошлого бара пропускаем: бар уже опубликован
+
+    def reconcile(self, interval: str, kline: tuple, close: bool = True):
+        # Бар биржи (kline WS или REST) точнее тиков lastPrice: open и объем берем у биржи, high/low объединяем.
+        # close=False - снимок старше тиков (REST при старте), последнюю цену оставляем из тиков
+        if interval not in self._steps:
+            return
+
+        open_time, o, h, l, c, v = kline
+        if (bar := self._bars.get(interval)) is None or open_time > bar[0]:
+            if bar is not None:
+                self._closed.append((interval, tuple(bar), interval in self._klines))
+            self._bars[interval] = [open_time, o, h, l, c, v]
+            self._klines.discard(interval)
+
+        elif open_time == bar[0]:
+            bar[1], bar[2], bar[3], bar[5] = o, max(bar[2], h), min(bar[3], l), v
+            if close:
+                bar[4] = c
+
+        if close and open_time == self._bars[interval][0]:  # Бар с объемом и OHLC биржи - можно хранить на диске
+            self._klines.add(interval)
+
+    def pop_closed(self):  # Закрытые бары по порядку закрытия, каждый отдается один раз
+        closed = list(self._closed)
+        self._closed.clear()
+        return closed
+
+
+class CandleBuilders:  # Построители баров по символам, общие для всех подписчиков цены
+    def __init__(self, intervals: tuple):
+        self._intervals = intervals
+        self._builders = {}
+
+    def get(self, symbol: str) -> CandleBuilder:
+        if (builder := self._builders.get(symbol)) is None:
+            builder = self._builders[symbol] = CandleBuilder(self._intervals)
+        return builder
+
+    def remove(self, symbol: str):
+        self._builders.pop(symbol, None)
+
+
+class SymbolFilters(NamedTuple):  # Фильтры биржи по символу и заранее посчитанные точности округления
+    step_size: float
+    tick_size: float = 0.0
+    min_qty: float = 0.0
+    min_notional: float = 0.0
+    status: int = 1  # 1 - торгуется
+    qty_decimals: int = 0
+    price_decimals: int = 0
+
+    @classmethod
+    def from_step_size(cls, step_size: float):  # Фильтров биржи нет - только шаг количества из БД
+        return cls(step_size, qty_decimals=get_decimal_places(step_size))
+
+
+class SymbolMetadata:  # Фильтры всех USDT-символов одним запросом, словарь заменяется целиком при обновлении
+    def __init__(self):
+        self._filters = {}
+        self._fallback = {}  # symbol: SymbolFilters по step_size из БД, пока фильтры не загружены
+        self.updated = None  # monotonic() последнего обновления
+
+    def __contains__(self, symbol: str):
+        return symbol in self._filters
+
+    def get(self, symbol: str, step_size: float = None) -> SymbolFilters | None:
+        if (filters := self._filters.get(symbol)) is None and step_size:
+            if (filters := self._fallback.get(symbol)) is None or filters.step_size != step_size:
+                filters = self._fallback[symbol] = SymbolFilters.from_step_size(step_size)
+        return filters
+
+    def update(self, symbols_data: list, updated: float):
+        filters = {}
+        for item in symbols_data:
+            name, _, quote = item['symbol'].partition('-')
+            if quote == 'USDT':
+                step_size, tick_size = float(item['stepSize']), float(item['tickSize'])
+                filters[name] = SymbolFilters(step_size, tick_size, float(item.get('minQty', 0)),
+                                              float(item.get('minNotional', 0)), int(item.get('status', 1)),
+                                              get_decimal_places(step_size), get_decimal_places(tick_size))
+
+        self._filters, self.updated = filters, updated
+        return len(filters)
+
+    @staticmethod
+    def quantize_qty(filters: SymbolFilters, qty: float):
+        return round(qty, filters.qty_decimals)
+
+    @staticmethod
+    def check_order(filters: SymbolFilters, qty: float, price: float):  # Текст причины, если биржа отклонит ордер
+        if filters.status != 1:
+            return f'символ не торгуется (status {filters.status})'
+        if qty <= 0 or qty < filters.min_qty:
+            return f'количество {qty} меньше minQty {filters.min_qty}'
+        if qty * price < filters.min_notional:
+            return f'сумма {qty * price} меньше minNotional {filters.min_notional}'
+        return None
+
+
+class OrderSummary(NamedTuple):  # Суммы по открытым ордерам символа
+    executed_qty: float = 0.0
+    cost: float = 0.0
+    cost_with_fee: float = 0.0
+    last_price: float | None = None  # Цена последнего ордера
+
+
+class OrderStore:  # Открытые ордера символа в структурированном массиве numpy (колонки ORDER_DTYPE)
+    __slots__ = ('_array', '_size')
+
+    def __init__(self, orders: list = ()):  # orders - кортежи в порядке полей ORDER_DTYPE или массив ORDER_DTYPE
+        self._array = orders.astype(ORDER_DTYPE) if isinstance(orders, ndarray) else \
+            np_array([tuple(order) for order in orders], dtype=ORDER_DTYPE)
+        self._size = len(self._array)
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __iter__(self):  # Для совместимости: ордера как словари
+        return (self._to_dict(record) for record in self._array[:self._size])
+
+    def __getitem__(self, index: int):
+        return self._to_dict(self._array[:self._size][index])
+
+    @staticmethod
+    def _to_dict(record):
+        return dict(zip(ORDER_DTYPE.names, record.tolist()))
+
+    def column(self, key: str):  # Представление без копирования
+        return self._array[key][:self._size]
+
+    def rows(self):  # Копия ордеров массивом ORDER_DTYPE
+        return self._array[:self._size].copy()
+
+    def append(self, order: dict):
+        if self._size == len(self._array):  # Растем удвоением, амортизированно O(1)
+            array = zeros(max(16, 2 * self._size), dtype=ORDER_DTYPE)
+            array[:self._size] = self._array[:self._size]
+            self._array = array
+
+        self._array[self._size] = tuple(order[key] for key in ORDER_DTYPE.names)
+        self._size += 1
+
+    def remove(self, orders_id: list):  # Удаляет ордера по id, возвращает суммы SUMMARY_KEYS удаленных
+        orders = self._array[:self._size]
+        mask = isin(orders['id'], orders_id)
+        removed = tuple(float(orders[key][mask].sum()) for key in SUMMARY_KEYS)
+
+        kept = orders[~mask]
+        self._size = len(kept)
+        self._array[:self._size] = kept
+        return removed
+
+    def clear(self):
+        self._size = 0
+
+    def opened(self, orders_id: list = None):  # Число ордеров (все или по id) и время открытия первого из них
+        open_time = self.column('open_time')
+        if orders_id:
+            open_time = open_time[isin(self.column('id'), orders_id)]
+        return len(open_time), open_time.min().item() if len(open_time) else None
+
+    def profits(self, price: float):  # Доход по каждому ордеру одной операцией над колонками
+        return self.column('executed_qty') * price - self.column('cost_with_fee')
+
+
+class SymbolState:  # Состояние одного символа
+    __slots__ = ('step_size', 'state', 'b_s_trigger', 'profit', 'orders', 'summary', 'lock')
+
+    def __init__(self, step_size: float = 0.0, state: str = 'stop', profit: float = 0.0, orders: list = ()):
+        self.step_size = step_size
+        self.state = state
+        self.b_s_trigger = 'new'
+        self.profit = profit
+        self.orders = OrderStore(orders)
+        self.summary = self.calc_summary(self.orders)
+        self.lock = TimedLock(LOCK_WAIT['symbol'])  # Сериализует запись по символу
+
+    @staticmethod
+    def calc_summary(orders: OrderStore):
+        return OrderSummary(*(float(orders.column(key).sum()) for key in SUMMARY_KEYS),
+                            float(orders.column('price')[-1]) if orders else None)
+
+    def __repr__(self):
+        return (f'SymbolState(state={self.state}, b_s_trigger={self.b_s_trigger}, profit={self.profit}, '
+                f'orders={len(self.orders)}, summary={self.summary})')
 
 
 class SymbolOrderManager:  # Класс для работы с ордерами в реальном времени
     def __init__(self):
         self.symbols = []
-        self._data = defaultdict(self._create_default_symbol_data)
-        self._lock = Lock()
+        self._data = {}
+        self.listeners = []  # callback(symbol) после изменения ордеров, state или b_s_trigger
 
-    @staticmethod
-    def _create_default_symbol_data(step_size: float = 0.0):
-        return {'step_size': step_size,
-                'state': 'stop',
-                'b_s_trigger': 'new',
-                'profit': 0.0,
-                'orders': []}
+    def _notify(self, symbol: str):
+        for listener in self.listeners:
+            listener(symbol)
+
+    def get(self, symbol: str) -> SymbolState:
+        return self._data[symbol]
+
+    def _check_summary(self, symbol: str):  # Отладочная сверка накопленных сумм с полным пересчетом
+        symbol_data = self._data[symbol]
+        summary, expected = symbol_data.summary, symbol_data.calc_summary(symbol_data.orders)
+
+        for key in SUMMARY_KEYS:
+            if not isclose(getattr(summary, key), getattr(expected, key), rel_tol=1e-9, abs_tol=1e-12):
+                logger.error(f'Расхождение summary {symbol} {key}: {getattr(summary, key)} != {getattr(expected, key)}')
+
+        if summary.last_price != expected.last_price:
+            logger.error(f'Расхождение last_price {symbol}: {summary.last_price} != {expected.last_price}')
 
     async def add_symbols_and_orders(self, batch_data: list):
-        async with self._lock:
-            for symbol, orders in batch_data:
-                self.symbols.append(symbol.name)
-                self._data[symbol.name].update({
-                    'step_size': symbol.step_size,
-                    'state': symbol.state,
-                    'profit': symbol.profit,
-                    'orders': orders
-                })
+        for symbol, orders in batch_data:
+            self.symbols.append(symbol.name)
+            self._data[symbol.name] = SymbolState(symbol.step_size, symbol.state, symbol.profit, orders)
+            self._notify(symbol.name)
 
     async def set_b_s_trigger(self, symbol: str, trigger: str):
-        async with self._lock:
-            self._data[symbol]['b_s_trigger'] = trigger
+        async with (symbol_data := self._data[symbol]).lock:
+            symbol_data.b_s_trigger = trigger
+            self._notify(symbol)
 
     async def get_b_s_trigger(self, symbol: str):
-        async with self._lock:
-            return self._data.get(symbol).get('b_s_trigger')
+        return self._data[symbol].b_s_trigger
 
     async def set_state(self, symbol: str, state: str):
-        async with self._lock:
-            self._data[symbol]['state'] = state
+        async with (symbol_data := self._data[symbol]).lock:
+            symbol_data.state = state
+            self._notify(symbol)
 
     async def get_state(self, symbol: str):
-        async with self._lock:
-            return self._data.get(symbol).get('state')
+        return self._data[symbol].state
 
     async def update_order(self, symbol: str, data: dict):
-        async with self._lock:
-            self._data[symbol]['orders'].append(data)
+        async with (symbol_data := self._data[symbol]).lock:
+            symbol_data.orders.append(data)
+
+            summary = symbol_data.summary
+            symbol_data.summary = OrderSummary(*(getattr(summary, key) + data[key] for key in SUMMARY_KEYS),
+                                               data['price'])
+            self._notify(symbol)
+
+            if config.DEBUG_CHECKS:
+                self._check_summary(symbol)
+
+    async def correct(self, symbol: str, orders: ndarray, orders_id: list, profit: float):
+        # Поправка из БД при сверке снимка: добавить orders (ORDER_DTYPE), убрать orders_id, профит + profit
+        async with (symbol_data := self._data[symbol]).lock:
+            kept = symbol_data.orders.rows()
+            merged = concatenate((kept[~isin(kept['id'], orders_id)], orders.astype(ORDER_DTYPE)))
+            merged.sort(order='id')
+            symbol_data.orders = OrderStore(merged)
+            symbol_data.summary = symbol_data.calc_summary(symbol_data.orders)
+            symbol_data.profit += profit
+            self._notify(symbol)
 
     async def add_symbol(self, symbol: str, step_size: float):
-        async with self._lock:
-            self.symbols.append(symbol)
-            self._data[symbol] = self._create_default_symbol_data(step_size=step_size)
+        self.symbols.append(symbol)
+        self._data[symbol] = SymbolState(step_size=step_size)
+        self._notify(symbol)
 
     async def delete_symbol(self, symbol: str):
-        async with self._lock:
-            if symbol in self.symbols:
-                self.symbols.remove(symbol)
-                del self._data[symbol]
+        if symbol in self.symbols:
+            self.symbols.remove(symbol)
+            del self._data[symbol]
+            self._notify(symbol)
 
     async def get_step_size(self, symbol: str):
-        async with self._lock:
-            return self._data.get(symbol).get('step_size')
+        return self._data[symbol].step_size
 
     async def get_orders(self, symbol: str):
-        async with self._lock:
-            return self._data.get(symbol).get('orders')
+        return self._data[symbol].orders
 
     async def update_profit(self, symbol: str, profit: float):
-        async with self._lock:
-            self._data[symbol]['profit'] += profit
+        async with (symbol_data := self._data[symbol]).lock:
+            symbol_data.profit += profit
 
     async def get_profit(self, symbol: str):
-        async with self._lock:
-            return self._data.get(symbol).get('profit')
+        return self._data[symbol].profit
 
     async def get_summary_profit(self):
-        async with self._lock:
-            return sum(symbol_data['profit'] for _, symbol_data in self._data.items())
+        return sum(symbol_data.profit for symbol_data in self._data.values())
 
     async def get_last_order(self, symbol: str):
-        async with self._lock:
-            orders = self._data.get(symbol).get('orders')
-            return orders[-1] if orders else None
+        orders = self._data[symbol].orders
+        return orders[-1] if orders else None
+
+    async def get_last_price(self, symbol: str):
+        return self._data[symbol].summary.last_price
 
     async def del_orders(self, symbol: str, orders_id: list = None):
-        async with self._lock:
-            if orders_id:
-                if orders := self._data.get(symbol).get('orders'):
-                    orders[:] = [order for order in orders if order['id'] not in orders_id]
+        async with (symbol_data := self._data[symbol]).lock:
+            orders = symbol_data.orders
+
+            if orders_id and orders:
+                removed = orders.remove(orders_id)
+                summary = symbol_data.summary
+                totals = (getattr(summary, key) - value for key, value in zip(SUMMARY_KEYS, removed))
+
+            elif not orders_id:
+                orders.clear()
+                totals = ()
 
             else:
-                self._data.get(symbol).get('orders', []).clear()
+                return
+
+            # Без ордеров обнуляем суммы, чтобы не копить ошибку округления
+            symbol_data.summary = OrderSummary(*totals, float(orders.column('price')[-1])) if orders \
+                else OrderSummary()
+            self._notify(symbol)
+
+            if config.DEBUG_CHECKS:
+                self._check_summary(symbol)
 
     async def get_summary(self, symbol: str, key: str):
-        async with self._lock:
-            orders = self._data.get(symbol).get('orders')
-            return sum(order[key] for order in orders) if orders else 0.0
+        return getattr(self._data[symbol].summary, key)
+
+
+class TriggerLevels(NamedTuple):  # Уровни цены символа, при пересечении которых торговле есть что делать
+    take_profit: float = inf  # Продаем все ордера, если цена выше
+    next_buy: float = -inf  # Покупаем, если цена ниже
+
+
+NO_LEVELS = TriggerLevels()
+
+
+class TriggerDispatcher:  # Уровни всех символов; тик проверяется двумя сравнениями, торговля будится только на пересечении
+    def __init__(self, so_manager: SymbolOrderManager, config_manager: ConfigManager):
+        self._so_manager = so_manager
+        self._config_manager = config_manager
+        self._levels = {}  # symbol: TriggerLevels, пересчитываются при изменении ордеров и конфига
+        self._hits = {}  # symbol: (time, price) последнего тика за пределами уровней
+        self._received = {}  # symbol: perf_counter() получения этого тика из websocket - для замера тик -> решение
+        self._events = defaultdict(Event)
+
+        so_manager.listeners.append(self.refresh)
+        config_manager.listeners.append(self.refresh)
+
+    def levels(self, symbol: str) -> TriggerLevels:
+        return self._levels.get(symbol, NO_LEVELS)
+
+    def refresh(self, symbol: str):
+        if symbol not in self._so_manager.symbols:
+            self._levels.pop(symbol, None)
+            return
+
+        symbol_data = self._so_manager.get(symbol)
+        summary = symbol_data.summary
+        take_profit = take_profit_price(summary.executed_qty, summary.cost_with_fee, config.TARGET_PROFIT) \
+            if summary.executed_qty else inf
+
+        next_buy = -inf
+        if symbol_data.state == 'track' and symbol_data.b_s_trigger == 'buy':
+            if summary.last_price is None:  # Нет ордеров - покупаем сразу
+                next_buy = inf
+            elif (target_grid_size := self._config_manager.get(symbol, 'target_grid_size')) is not None:
+                next_buy = next_buy_price(summary.last_price, target_grid_size)
+
+        self._levels[symbol] = TriggerLevels(take_profit, next_buy)
+
+    def on_tick(self, symbol: str, tick: tuple, received: float = None):
+        if (levels := self._levels.get(symbol)) is None or levels.next_buy <= tick[1] <= levels.take_profit:
+            return
+
+        self._hits[symbol] = tick
+        self._received[symbol] = received
+        event, self._events[symbol] = self._events[symbol], Event()
+        event.set()
+
+    def received(self, symbol: str):
+        return self._received.get(symbol)
+
+    async def wait(self, symbol: str, last: tuple = None):  # Тик за пределами уровней, отличный от last
+        while (tick := self._hits.get(symbol)) is None or tick is last:
+            await self._events[symbol].wait()
+
+        return tick
@@ -0,0 +1,27 @@
+# Разбор кадров websocket BingX. Все кадры - gzip; Ping узнается по сжатым байтам без распаковки и JSON,
+# ответ на него - текст Pong. Остальное: zlib.decompress с окном gzip (без разбора заголовка на Python,
+# как в gzip.decompress) и JSON из bytes без .decode() - orjson или msgspec, если установлены.
+from gzip import compress
+from zlib import decompress
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from msgspec.json import decode as json_loads
+    except ImportError:
+        from json import loads as json_loads
+
+GZIP_WBITS = 31  # 16 + MAX_WBITS: zlib ждет заголовок и контрольную сумму gzip
+PING, PONG = b'Ping', 'Pong'
+PING_BODY = compress(PING, mtime=0)[10:]  # Сжатые данные и хвост gzip; 10 байт заголовка (время, ОС) бывают любыми
+PING_SIZE = len(PING_BODY) + 10
+
+
+def decode_message(raw: bytes):  # PING или словарь сообщения
+    if len(raw) == PING_SIZE and raw.endswith(PING_BODY):
+        return PING
+
+    if (payload := decompress(raw, GZIP_WBITS)) == PING:  # Ping, сжатый с другими параметрами
+        return PING
+    return json_loads(payload)
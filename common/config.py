@@ -21,6 +21,60 @@ class Config:
 
         self.TAKER_MAKER: float = self.TAKER + self.MAKER
 
+        self.WS_CHANNELS_LIMIT: int = int(getenv('WS_CHANNELS_LIMIT', 50))  # каналов lastPrice на одном websocket
+        self.WS_SUB_DELAY: float = 0.05  # пауза между подписками на одном websocket, сек
+
+        self.TRADING_MIN_INTERVAL: float = 0.2  # минимальный интервал между итерациями торговли по символу, сек
+        self.INDICATORS_MIN_INTERVAL: float = 1  # минимальный интервал между пересчетами индикаторов, сек
+
+        self.KLINE_CONCURRENCY: int = 5  # одновременных запросов свечей при старте
+        # Лимиты REST по группам эндпоинтов: (запросов в секунду, запас)
+        self.REST_RATES: dict = {'market': (10, 10), 'trade': (10, 5), 'account': (2, 2)}
+        self.REST_RETRIES: int = 4  # повторов GET при 429/5xx/сетевых ошибках
+        self.REST_BACKOFF: float = 0.5  # базовая пауза перед повтором, удваивается, сек
+        self.SYMBOLS_META_TTL: float = 3600  # период обновления фильтров символов (stepSize, minNotional...), сек
+        self.SYMBOLS_META_RETRY: float = 60  # повтор после ошибки загрузки фильтров, сек
+        self.CANDLE_INTERVALS: tuple = ('1m', '4h')  # интервалы баров из тиков (MACD 1m, RSI 4h)
+        self.KLINE_WS: bool = getenv('KLINE_WS') == '1'  # сверка баров с kline websocket, только сверенные - на диск
+        self.CANDLES_DIR: str = getenv('CANDLES_DIR', 'data/candles')  # локальное хранилище закрытых свечей
+
+        self.DB_ECHO: bool = getenv('DB_ECHO', '0') == '1'  # логировать SQL
+        self.PERSIST_INTERVAL_MS: float = 50  # отложенная запись ордеров в БД не реже, мс
+        self.PERSIST_BATCH_SIZE: int = 100  # или сразу, если набралось столько событий
+        self.PERSIST_RETRIES: int = 3  # повторов пакета при ошибке БД, потом поиск плохого события
+        self.PERSIST_FLUSH_TIMEOUT: float = 10  # продажа ждет commit не дольше, сек
+        self.SNAPSHOT_DIR: str = getenv('SNAPSHOT_DIR', 'data/state')  # снимок состояния и журнал для теплого старта
+        self.SNAPSHOT_INTERVAL: float = 600  # свертка журнала в новый снимок, если журнал не пуст, сек
+
+        self.METRICS_ENABLED: bool = getenv('METRICS', '1') == '1'  # счетчики и гистограммы горячих путей
+        self.METRICS_HOST: str = getenv('METRICS_HOST', '127.0.0.1')
+        self.METRICS_PORT: int = int(getenv('METRICS_PORT', 0))  # порт /metrics для Prometheus, 0 - не поднимать
+
+        self.WORKERS: int = int(getenv('WORKERS', 0))  # процессов с символами (shards.py), 0 - все в одном процессе
+        self.IPC_TIMEOUT: float = 30  # ожидание ответа воркера на команду или ping, сек
+        self.IPC_PING_INTERVAL: float = 5  # замер задержки координатор - воркер, сек
+        self.WORKER_RESTART_DELAY: float = 5  # перезапуск упавшего воркера через, сек
+
+        self.TASK_RESTART_BACKOFF: float = 1  # пауза перезапуска упавшей задачи символа, удваивается, сек
+        self.TASK_RESTART_BACKOFF_MAX: float = 60  # до, сек
+        self.TASK_STABLE_AFTER: float = 60  # задача проработала дольше - пауза снова с начальной, сек
+
+        self.LOOP_MONITOR_INTERVAL: float = 0.1  # замер задержки event loop, сек
+        self.LOOP_SLOW_CALLBACK: float = float(getenv('LOOP_SLOW_CALLBACK', 0.1))  # колбэк дольше - стек в лог, сек
+        self.PROFILE_INTERVAL: float = 0.005  # период снятия стека профилировщиком, сек
+        self.PROFILE_MAX_SECONDS: int = 300  # предел окна команды prof_<секунды>
+
+        self.LOG_DIR: str = getenv('LOG_DIR', 'logs')
+        self.LOG_JSON: bool = getenv('LOG_JSON', '1') == '1'  # JSON строкой на запись, иначе прежний текст
+        self.LOG_MAX_BYTES: int = int(getenv('LOG_MAX_BYTES', 20 * 1024 * 1024))  # ротация по размеру файла
+        self.LOG_ROTATE_WHEN: str = getenv('LOG_ROTATE_WHEN', '')  # или по времени: 'midnight', 'H'...
+        self.LOG_BACKUPS: int = int(getenv('LOG_BACKUPS', 5))  # хранить старых файлов
+        self.LOG_SAMPLE_INTERVAL: float = 10  # DEBUG с ключом sample - не чаще раза за интервал, сек
+        # записи без кадра вызова, потока и процесса - для всех логгеров процесса (lineno, funcName станут пустыми)
+        self.LOG_FAST_RECORDS: bool = getenv('LOG_FAST_RECORDS') == '1'
+
+        self.DEBUG_CHECKS: bool = getenv('DEBUG_CHECKS', '0') == '1'  # сверять накопленные суммы с полным пересчетом
+
         # self.MAIN_LOT_MAP = {
         #     (0, 400): 10,
         #     (400, 900): 20,
@@ -38,5 +92,9 @@ class Config:
 
         }
 
+        # Множители лота по корзинам RSI 4h: (верхняя граница RSI, множитель), последняя корзина до +inf
+        self.RSI_LOT_MULTIPLIERS = ((20, 4.5), (25, 3.5), (30, 3), (35, 2), (40, 1.5), (45, 1), (50, 1), (55, 1),
+                                    (60, 1), (65, 0.1), (70, 0.1), (float('inf'), 0.05))
+
 
 config = Config()
@@ -1,6 +1,5 @@
 from decimal import Decimal
-from asyncio import create_task
-from functools import wraps
+from functools import partial, wraps
 
 
 def get_decimal_places(step_size):
@@ -11,7 +10,7 @@ def get_decimal_places(step_size):
         return abs(d.as_tuple().exponent)
 
 
-def add_task(outer_func, so_manager, text: str):
+def add_task(supervisor, so_manager, text: str):  # Запуск задачи символа под TaskSupervisor
     def decorator(func):
         @wraps(func)
         async def wrapper(symbol, *args, **kwargs):
@@ -19,8 +18,7 @@ def add_task(outer_func, so_manager, text: str):
                 print(f'Отслеживание {text} {symbol} не запущено, state = STOP')
                 return
 
-            task = create_task(func(symbol, *args, **kwargs))
-            await outer_func.add_task(symbol, task)
+            task = await supervisor.add_task(symbol, text, partial(func, symbol, *args, **kwargs))
             print(f'Запущено отслеживание {text} {symbol}')
             return task
 
@@ -0,0 +1,44 @@
+# Канал координатор - воркер (shards.py): JSON строкой на сообщение поверх TCP 127.0.0.1 (asyncio ставит
+# TCP_NODELAY). send - без ожидания, request - ответ с тем же req не дольше timeout, иначе TimeoutError.
+from asyncio import StreamReader, StreamWriter, get_running_loop, wait_for
+from itertools import count
+from json import dumps, loads
+
+STREAM_LIMIT = 2 ** 20  # Максимальная длина сообщения: отчеты metrics воркеров, байт
+
+
+class Channel:
+    def __init__(self, reader: StreamReader, writer: StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._ids = count(1)
+        self._pending = {}  # req: Future ответа
+
+    def send(self, kind: str, **fields):
+        self._writer.write(dumps({'kind': kind, **fields}, ensure_ascii=False, default=str).encode() + b'\n')
+
+    def reply(self, request: dict, **fields):
+        self.send('reply', req=request['req'], **fields)
+
+    async def request(self, kind: str, timeout: float, **fields):
+        req = next(self._ids)
+        future = self._pending[req] = get_running_loop().create_future()
+        self.send(kind, req=req, **fields)
+        try:
+            return await wait_for(future, timeout)
+        finally:
+            self._pending.pop(req, None)
+
+    async def run(self, handle):  # До закрытия канала; handle(message) - для всего, кроме ответов, не должен ждать
+        try:
+            while line := await self._reader.readline():
+                message = loads(line)
+                if message['kind'] != 'reply':
+                    await handle(message)
+                elif (future := self._pending.get(message['req'])) is not None and not future.done():
+                    future.set_result(message)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('Канал IPC закрыт'))
+            self._writer.close()
@@ -0,0 +1,108 @@
+# Логирование без записи на диск в event loop: логгер кладет запись в очередь (QueueHandler), файлы пишет
+# QueueListener в своем потоке. Файлы debug/info/error с ротацией по размеру или по времени, формат - JSON строкой
+# на запись (поля symbol, order_id из extra) или прежний текст.
+# Текст записи собирается в потоке логирования: сообщения с аргументами ('%s', Lazy(...)) не форматируются в loop.
+# Аргументы таких записей не должны меняться после вызова логгера - Lazy получает готовые значения.
+# Частые DEBUG проходят через log_sampler.take(ключ) - лишние отбрасываются до создания записи.
+# LOG_FAST_RECORDS=1 - записи без поиска вызывающего кадра, потока и процесса (дешевле создание записи), но
+# глобально для модуля logging: lineno, funcName, threadName, process пусты у всех логгеров, включая библиотеки.
+from json import dumps
+import logging
+from logging import DEBUG, INFO, ERROR, Formatter, LogRecord, getLogger
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from os import makedirs, path
+from queue import SimpleQueue
+from time import monotonic
+
+from common.config import config
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+EXTRA_FIELDS = ('symbol', 'order_id')
+
+
+class Lazy:  # Текст отчета строится при первом str(): в потоке логирования или в хэндлере бота
+    __slots__ = ('_func', '_args', '_text')
+
+    def __init__(self, func, *args):
+        self._func = func
+        self._args = args
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = self._func(*self._args)
+        return self._text
+
+
+class JsonFormatter(Formatter):
+    def format(self, record: LogRecord):
+        entry = {'time': self.formatTime(record), 'level': record.levelname, 'msg': record.getMessage()}
+        for field in EXTRA_FIELDS:
+            if (value := getattr(record, field, None)) is not None:
+                entry[field] = value
+        if suppressed := getattr(record, 'suppressed', 0):
+            entry['suppressed'] = suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return dumps(entry, ensure_ascii=False, default=str)
+
+
+class Sampler:  # Частые DEBUG по ключу: не чаще одной записи за interval сек. Проверка до создания LogRecord
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._last = {}  # ключ: (время последней записи, отброшено с тех пор)
+
+    def take(self, key):  # None - запись пропустить, иначе сколько записей по ключу отброшено до этой
+        now = monotonic()
+        last, suppressed = self._last.get(key, (-self._interval, 0))
+        if now - last < self._interval:
+            self._last[key] = last, suppressed + 1
+            return None
+
+        self._last[key] = now, 0
+        return suppressed
+
+
+class LazyQueueHandler(QueueHandler):  # В отличие от QueueHandler, не форматирует сообщение в вызывающем потоке
+    def prepare(self, record: LogRecord):
+        if record.exc_info:  # traceback держит кадры стека - превращаем в текст сразу
+            record.exc_text = Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _file_handler(file: str, level: int, formatter: Formatter):
+    if config.LOG_ROTATE_WHEN:
+        handler = TimedRotatingFileHandler(file, when=config.LOG_ROTATE_WHEN, backupCount=config.LOG_BACKUPS,
+                                           encoding='utf-8')
+    else:
+        handler = RotatingFileHandler(file, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUPS,
+                                      encoding='utf-8')
+    handler.setLevel(level)
+    handler.setFormatter(formatter)
+    return handler
+
+
+def setup_logging(name: str = 'my_app', directory: str = config.LOG_DIR):  # QueueListener, остановить при выходе
+    makedirs(directory, exist_ok=True)
+    formatter = JsonFormatter() if config.LOG_JSON else Formatter(TEXT_FORMAT)
+    handlers = [_file_handler(path.join(directory, f'{level_name}.log'), level, formatter)
+                for level_name, level in (('debug', DEBUG), ('info', INFO), ('error', ERROR))]
+
+    if config.LOG_FAST_RECORDS:  # Для всего процесса: lineno/funcName/threadName/process в записях пропадут
+        logging._srcfile = None
+        logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+
+    queue = SimpleQueue()
+    logger = getLogger(name)
+    logger.setLevel(DEBUG)
+    logger.addHandler(LazyQueueHandler(queue))
+
+    listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+log_sampler = Sampler(config.LOG_SAMPLE_INTERVAL)
@@ -0,0 +1,201 @@
+# Метрики процесса: счетчики, значения и гистограммы в памяти. Отдаются в текстовом формате Prometheus
+# (serve_metrics на локальном порту) и командой бота metrics.
+# Наблюдение - пара операций над полями без lock и аллокаций (< 1 мкс); экземпляр метрики с метками берется
+# из реестра один раз и хранится у вызывающего кода. METRICS=0 - реестр выдает пустые метрики с теми же методами.
+from asyncio import Lock, Event
+from bisect import bisect_left
+from logging import getLogger
+from time import perf_counter
+
+from aiohttp import web
+
+from common.config import config
+
+logger = getLogger('my_app')
+
+LATENCY_BUCKETS_MS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float('inf'))
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class FuncMetric:  # Значение считается функцией только при выдаче: длина очереди, готовые счетчики stats
+    __slots__ = ('_func',)
+
+    def __init__(self, func):
+        self._func = func
+
+    @property
+    def value(self):
+        return self._func()
+
+
+class Histogram:  # Наблюдения по корзинам buckets (верхние границы) и их сумма; число - сумма корзин
+    __slots__ = ('buckets', 'counts', 'total')
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS_MS):
+        self.buckets = tuple(map(float, buckets))  # Сравнение float с float быстрее смешанного в bisect
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q: float):  # Верхняя граница корзины, в которую попал квантиль
+        rank, seen = q * sum(self.counts), 0
+        for edge, count in zip(self.buckets, self.counts):
+            if (seen := seen + count) >= rank:
+                return edge
+        return self.buckets[-1]
+
+    def __str__(self):
+        count = self.count
+        return (f'n={count} mean={self.total / count if count else 0:.3g} '
+                f'p50<={self.quantile(0.5)} p99<={self.quantile(0.99)}')
+
+
+class _Noop:  # Метрика при METRICS=0
+    __slots__ = ()
+    value = count = total = 0
+    counts = ()
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+    def quantile(self, q: float):
+        return 0
+
+    def __str__(self):
+        return 'n=0'
+
+
+NOOP = _Noop()
+
+
+class TimedLock(Lock):  # asyncio.Lock, ожидание захвата - в гистограмму; без конкуренции замера нет
+    def __init__(self, histogram: Histogram):
+        super().__init__()
+        self._histogram = histogram
+
+    async def acquire(self):
+        if not self.locked():
+            return await super().acquire()
+
+        started = perf_counter()
+        await super().acquire()
+        self._histogram.observe((perf_counter() - started) * 1000)
+        return True
+
+
+class Registry:
+    def __init__(self, enabled: bool):
+        self._enabled = enabled
+        self._families = {}  # name: [тип, описание, {метки: метрика}]
+
+    def _get(self, kind: str, name: str, description: str, labels: dict, factory):
+        if not self._enabled:
+            return NOOP
+
+        family = self._families.setdefault(name, [kind, description, {}])
+        key = tuple(sorted(labels.items()))
+        if (metric := family[2].get(key)) is None:
+            metric = family[2][key] = factory()
+        return metric
+
+    def counter(self, name: str, description: str = '', func=None, **labels) -> Counter:
+        return self._get('counter', name, description, labels, Counter if func is None else lambda: FuncMetric(func))
+
+    def gauge(self, name: str, description: str = '', func=None, **labels) -> Gauge:
+        return self._get('gauge', name, description, labels, Gauge if func is None else lambda: FuncMetric(func))
+
+    def histogram(self, name: str, description: str = '', buckets: tuple = LATENCY_BUCKETS_MS,
+                  **labels) -> Histogram:
+        return self._get('histogram', name, description, labels, lambda: Histogram(buckets))
+
+    @staticmethod
+    def _labels(key: tuple, extra: str = ''):
+        pairs = [f'{label}="{value}"' for label, value in key] + ([extra] if extra else [])
+        return f'{{{",".join(pairs)}}}' if pairs else ''
+
+    def render(self):  # Текстовый формат Prometheus 0.0.4
+        lines = []
+        for name, (kind, description, series) in self._families.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            for key, metric in series.items():
+                if kind != 'histogram':
+                    lines.append(f'{name}{self._labels(key)} {metric.value}')
+                    continue
+
+                cumulative = 0
+                for edge, count in zip(metric.buckets, metric.counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if edge == float('inf') else f'le="{edge}"'
+                    lines.append(f'{name}_bucket{self._labels(key, le)} {cumulative}')
+                lines += [f'{name}_sum{self._labels(key)} {metric.total}',
+                          f'{name}_count{self._labels(key)} {metric.count}']
+        return '\n'.join(lines) + '\n'
+
+    def report(self):  # Кратко для бота: значения и квантили гистограмм
+        if not self._enabled:
+            return 'Метрики отключены (METRICS=0)'
+
+        lines = []
+        for name, (kind, _, series) in self._families.items():
+            for key, metric in series.items():
+                if kind == 'histogram' and not metric.count:
+                    continue
+                value = metric if kind == 'histogram' else f'{metric.value:g}'
+                lines.append(f'{name}{self._labels(key)}: {value}')
+        return '\n'.join(lines) or 'Метрик пока нет'
+
+
+metrics = Registry(config.METRICS_ENABLED)
+
+
+async def serve_metrics(host: str, port: int):  # GET /metrics для Prometheus, только локальный адрес
+    if not port:
+        return
+
+    async def handle(_):
+        return web.Response(text=metrics.render(), content_type='text/plain')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f'Метрики Prometheus: http://{host}:{port}/metrics')
+
+    try:
+        await Event().wait()
+    finally:
+        await runner.cleanup()
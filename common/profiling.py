@@ -0,0 +1,85 @@
+# Задержка event loop и профилирование по запросу.
+# LoopMonitor: корутина засыпает на interval и меряет опоздание пробуждения (loop_lag_ms). Поток-сторож смотрит
+# на отметку корутины: loop не возвращался к ней дольше slow сек - в лог стек потока loop и текущая задача,
+# то есть колбэк, который держит loop прямо сейчас.
+# profile(seconds): поток раз в PROFILE_INTERVAL снимает стек потока loop (sys._current_frames), итог - collapsed
+# stacks ("задача;кадр;кадр число" строкой) для flamegraph.pl или speedscope.
+import sys
+from asyncio import AbstractEventLoop, current_task, get_running_loop, sleep
+from collections import Counter
+from logging import getLogger
+from os import path
+from threading import Thread, get_ident
+from time import monotonic, sleep as thread_sleep
+from traceback import format_stack
+
+from common.config import config
+from common.metrics import metrics
+
+logger = getLogger('my_app')
+
+
+def _task_name(loop: AbstractEventLoop):  # Из другого потока: current_task(loop) только читает словарь задач
+    return task.get_name() if (task := current_task(loop)) is not None else 'loop'
+
+
+class LoopMonitor:
+    def __init__(self, interval: float, slow: float):
+        self._interval = interval
+        self._slow = slow
+        self._beat = 0.0  # monotonic последнего пробуждения корутины
+        self._loop = self._thread_id = None
+        self.lag = metrics.histogram('loop_lag_ms', 'Опоздание пробуждения корутины в event loop, мс')
+        self.stalls = metrics.counter('loop_stalls_total', 'Колбэки event loop дольше LOOP_SLOW_CALLBACK')
+
+    async def run(self):
+        self._loop, self._thread_id = get_running_loop(), get_ident()
+        self._beat = monotonic()
+        Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+
+        while True:
+            await sleep(self._interval)
+            now = monotonic()
+            self.lag.observe(max(0.0, now - self._beat - self._interval) * 1000)
+            self._beat = now
+
+    def _watch(self):
+        reported = None
+        while True:
+            thread_sleep(self._slow / 2)
+            beat = self._beat
+            if (busy := monotonic() - beat - self._interval) < self._slow or beat == reported:
+                continue
+
+            reported = beat  # Одна запись на зависание
+            self.stalls.inc()
+            if (frame := sys._current_frames().get(self._thread_id)) is not None:
+                logger.warning('Event loop занят уже %.0f мс, задача %s:\n%s', busy * 1000, _task_name(self._loop),
+                               ''.join(format_stack(frame)))
+
+
+def _collapse(frame):  # Кадры от корня к вершине через ';'
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _sample(loop: AbstractEventLoop, thread_id: int, seconds: float, interval: float):
+    stacks = Counter()
+    deadline = monotonic() + seconds
+    while monotonic() < deadline:
+        if (frame := sys._current_frames().get(thread_id)) is not None:
+            stacks[f'{_task_name(loop)};{_collapse(frame)}'] += 1
+        thread_sleep(interval)
+    return '\n'.join(f'{stack} {count}' for stack, count in stacks.most_common())
+
+
+async def profile(seconds: float):  # Collapsed stacks потока loop за seconds; loop все это время работает
+    loop = get_running_loop()
+    return await loop.run_in_executor(None, _sample, loop, get_ident(), seconds, config.PROFILE_INTERVAL)
+
+
+loop_monitor = LoopMonitor(config.LOOP_MONITOR_INTERVAL, config.LOOP_SLOW_CALLBACK)
@@ -0,0 +1,58 @@
+# Решения стратегии без состояния и ввода-вывода: общие для живой торговли (bingx_command, indicator_models)
+# и для бэктеста (backtest.engine)
+from bisect import bisect_right
+
+from common.config import config
+
+
+def macd_trigger(hist_prev: float, hist_last: float, b_s_trigger: str):  # Новый триггер или None, если не меняется
+    if hist_prev > 0 and hist_last > 0 and b_s_trigger in ('sell', 'new'):
+        return 'buy'
+
+    if hist_prev < 0 and hist_last < 0 and b_s_trigger in ('buy', 'new'):
+        return 'sell'
+
+    return None
+
+
+def main_lot_for_balance(usdt_balance: float, main_lot_map: dict):
+    for (min_balance, max_balance), lot in main_lot_map.items():
+        if min_balance < usdt_balance <= max_balance:
+            return lot
+
+    return None
+
+
+def rsi_bucket(rsi: float, multipliers: tuple = config.RSI_LOT_MULTIPLIERS):  # Корзина RSI: rsi_min <= rsi < rsi_max
+    return bisect_right([edge for edge, _ in multipliers], rsi)
+
+
+def rsi_edges(multipliers: tuple = config.RSI_LOT_MULTIPLIERS):  # Конечные границы корзин RSI
+    return [edge for edge, _ in multipliers if edge != float('inf')]
+
+
+def rsi_lot_and_grid(rsi: float, main_lot: float, grid_size: float,
+                     multipliers: tuple = config.RSI_LOT_MULTIPLIERS):
+    return bucket_lot_and_grid(rsi_bucket(rsi, multipliers), main_lot, grid_size, multipliers)
+
+
+def bucket_lot_and_grid(bucket: int, main_lot: float, grid_size: float,
+                        multipliers: tuple = config.RSI_LOT_MULTIPLIERS):
+    return main_lot * multipliers[bucket][1], grid_size
+
+
+def cost_with_fee(cost: float, taker_maker: float):  # Комиссия за покупку и будущую продажу закладывается сразу
+    return cost * (1 + taker_maker)
+
+
+def profit_to_target(price: float, summary_executed: float, total_cost_with_fee: float, target_profit: float):
+    return price * summary_executed - total_cost_with_fee * (1 + target_profit)
+
+
+def take_profit_price(summary_executed: float, total_cost_with_fee: float, target_profit: float):
+    # Цена, выше которой profit_to_target > 0
+    return total_cost_with_fee * (1 + target_profit) / summary_executed
+
+
+def next_buy_price(last_price: float, target_grid_size: float):
+    return last_price * (1 - target_grid_size)
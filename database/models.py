@@ -1,4 +1,4 @@
-from sqlalchemy import DateTime, String, ForeignKey, Float
+from sqlalchemy import DateTime, String, ForeignKey, Float, Integer, Index, UniqueConstraint
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
@@ -41,3 +41,42 @@ class OrderInfo(Base):
     open_time: Mapped[DateTime] = mapped_column(DateTime)
 
     symbol: Mapped["Symbol"] = relationship(back_populates="orders")
+
+
+# Журнал закрытых сделок: строка на каждую продажу. Символ - по имени, без FK: история переживает del_symbol
+class ClosedTrade(Base):
+    __tablename__ = 'closed_trades'
+    __table_args__ = (Index('ix_closed_trades_symbol_close_time', 'symbol_name', 'close_time'),)
+
+    symbol_name: Mapped[str] = mapped_column(String(10))
+    order_id: Mapped[str] = mapped_column(String(32))  # orderId продажи на бирже
+    orders_count: Mapped[int] = mapped_column(Integer)  # Сколько ордеров покупки закрыто
+    executed_qty: Mapped[float] = mapped_column(Float)
+    cost_with_fee: Mapped[float] = mapped_column(Float)  # Стоимость покупки с комиссией
+    revenue: Mapped[float] = mapped_column(Float)  # cummulativeQuoteQty продажи
+    profit: Mapped[float] = mapped_column(Float)
+    open_time: Mapped[DateTime] = mapped_column(DateTime)  # Первый закрытый ордер покупки
+    close_time: Mapped[DateTime] = mapped_column(DateTime)
+
+
+# Свертки профита по символу за сутки / час, дополняются при записи каждой сделки (database.persistence)
+class PnlDaily(Base):
+    __tablename__ = 'pnl_daily'
+    __table_args__ = (UniqueConstraint('symbol_name', 'period'), Index('ix_pnl_daily_period', 'period'))
+
+    symbol_name: Mapped[str] = mapped_column(String(10))
+    period: Mapped[DateTime] = mapped_column(DateTime)  # Начало суток
+    trades: Mapped[int] = mapped_column(Integer, default=0)
+    revenue: Mapped[float] = mapped_column(Float, default=0.0)
+    profit: Mapped[float] = mapped_column(Float, default=0.0)
+
+
+class PnlHourly(Base):
+    __tablename__ = 'pnl_hourly'
+    __table_args__ = (UniqueConstraint('symbol_name', 'period'), Index('ix_pnl_hourly_period', 'period'))
+
+    symbol_name: Mapped[str] = mapped_column(String(10))
+    period: Mapped[DateTime] = mapped_column(DateTime)  # Начало часа
+    trades: Mapped[int] = mapped_column(Integer, default=0)
+    revenue: Mapped[float] = mapped_column(Float, default=0.0)
+    profit: Mapped[float] = mapped_column(Float, default=0.0)
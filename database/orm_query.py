@@ -1,10 +1,10 @@
+from collections import defaultdict
 from logging import getLogger
 
 from sqlalchemy import select, delete, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from database.models import OrderInfo, Symbol, SymbolConfig, Base
+from database.models import OrderInfo, Symbol, SymbolConfig, Base, PnlDaily, PnlHourly
 
 logger = getLogger('my_app')
 
@@ -16,52 +16,47 @@ async def init_db(engine, drop_all=False):
         await conn.run_sync(Base.metadata.create_all)  # Всегда создаем таблицы
 
 
-# Добавить новый ордер в БД
-async def add_order(session: AsyncSession, symbol_name: str, data: dict):
-    try:
-        db_symbol = (await session.execute(select(Symbol).where(Symbol.name == symbol_name))).scalar_one_or_none()
-        new_order = OrderInfo(**data, symbol=db_symbol)
-        session.add(new_order)
-        await session.commit()
-        return int(new_order.id)
-
-    except Exception as e:
-        logger.error(f'Error adding order to DB: {e}')
-
-
 # Изменить состояние у монеты
 async def update_state(session: AsyncSession, symbol_name: str, state: str):
     await session.execute(update(Symbol).where(Symbol.name == symbol_name).values(state=state))
     await session.commit()
 
 
-# Удалить из БД последний ордер / или все ордера
-async def del_orders(symbol_name: str, session: AsyncSession, orders_id: list = None):
-    query = (OrderInfo.id.in_(orders_id)) if orders_id else OrderInfo.symbol.has(name=symbol_name)
-    await session.execute(delete(OrderInfo).where(query))
-
-
-# Обновить профит в БД по символу
-async def update_profit(symbol: str, session: AsyncSession, profit_diff: float):
-    await session.execute(update(Symbol).where(Symbol.name == symbol).values(profit=Symbol.profit + profit_diff))
+# Профит из сверток pnl_daily / pnl_hourly с момента since: (symbol, начало периода, сделок, профит)
+async def get_pnl(session: AsyncSession, since, hourly: bool = False, symbol: str = None):
+    model = PnlHourly if hourly else PnlDaily
+    query = select(model.symbol_name, model.period, model.trades, model.profit).where(model.period >= since)
+    if symbol:
+        query = query.where(model.symbol_name == symbol)
+    return (await session.execute(query.order_by(model.symbol_name, model.period))).all()
 
 
 # Загружаем все ордера и symbols из БД в память
-async def load_from_db(session: AsyncSession, so_manager, config_manager):
-    query = select(Symbol).options(selectinload(Symbol.orders))
-    symbols = (await session.execute(query)).scalars().all()
-    data_batch = [(symbol, [order.__dict__ for order in symbol.orders]) for symbol in symbols]
+async def load_from_db(session: AsyncSession, so_manager, config_manager, owned=None):
+    # owned(symbol) - символы своего процесса в режиме воркеров (shards.py), None - все
+    symbols = [symbol for symbol in (await session.execute(select(Symbol))).scalars().all()
+               if owned is None or owned(symbol.name)]
+
+    # Ордера читаем колонками, без ORM-объектов: кортежи в порядке полей OrderStore
+    query = select(OrderInfo.symbol_id, OrderInfo.id, OrderInfo.price, OrderInfo.executed_qty, OrderInfo.cost,
+                   OrderInfo.cost_with_fee, OrderInfo.open_time).order_by(OrderInfo.id)
+    orders = defaultdict(list)
+    for symbol_id, *order in (await session.execute(query)).all():
+        orders[symbol_id].append(order)
+
+    data_batch = [(symbol, orders[symbol.id]) for symbol in symbols]
     await so_manager.add_symbols_and_orders(data_batch)
 
     symbols_config = (await session.execute(select(SymbolConfig))).scalars().all()
-    data_batch = [symbol_config for symbol_config in symbols_config]
+    data_batch = [symbol_config for symbol_config in symbols_config if owned is None or owned(symbol_config.symbol_name)]
     await config_manager.load_config(data_batch)
 
 
-# Добавить символ в БД
+# Добавить символ в БД, возвращает его id
 async def add_symbol(symbol: str, session: AsyncSession, step_size, state: str = 'stop'):
-    session.add(Symbol(name=symbol, step_size=step_size, state=state, profit=0.0))
+    session.add(row := Symbol(name=symbol, step_size=step_size, state=state, profit=0.0))
     await session.commit()
+    return row.id
 
 
 # Удалить символ из БД
@@ -0,0 +1,219 @@
+# Отложенная запись (write-behind) ордеров и профита: горячий путь только ставит изменения в очередь,
+# фоновый писатель сбрасывает их одной транзакцией раз в PERSIST_INTERVAL_MS или по PERSIST_BATCH_SIZE событий.
+# Гарантии:
+#  - покупка: ордер в памяти сразу, в БД - в течение PERSIST_INTERVAL_MS; при падении процесса в этом окне
+#    последние покупки теряются (монеты остаются на бирже, в БД их нет);
+#  - продажа: place_sell_order ждет flush() не дольше PERSIST_FLUSH_TIMEOUT, т.е. commit транзакции с удалением
+#    ордеров и профитом (для SQLite commit - это fsync журнала); дождалась - продажа в БД переживет падение процесса;
+#  - порядок событий в БД совпадает с порядком постановки в очередь;
+#  - ошибка БД: пакет повторяется PERSIST_RETRIES раз, затем делится пополам, пока не найдется событие, которое
+#    не пишется (например, IntegrityError) - оно откладывается в rejected с записью в лог, остальные пишутся;
+#  - сделка в closed_trades и ее свертки в pnl_daily / pnl_hourly пишутся в той же транзакции, что и продажа
+#    (кроме пакета, который делится после ошибки).
+# id ордеров выдаются на клиенте от max(id) при старте: писатель ордеров символа один - этот процесс
+# (в режиме воркеров у каждого свой класс вычетов id по модулю числа воркеров).
+from asyncio import Event, Lock, create_task, sleep, wait_for, TimeoutError as AsyncTimeoutError
+from collections import deque
+from itertools import groupby
+from logging import getLogger
+from operator import itemgetter
+from time import perf_counter
+
+from sqlalchemy import select, delete, update, insert, func
+
+from common.config import config
+from common.metrics import metrics, SIZE_BUCKETS
+from database.models import OrderInfo, Symbol, ClosedTrade, PnlDaily, PnlHourly
+
+logger = getLogger('my_app')
+
+# Свертка профита: таблица и начало периода сделки
+ROLLUPS = (
+    (PnlDaily, lambda close_time: close_time.replace(hour=0, minute=0, second=0, microsecond=0)),
+    (PnlHourly, lambda close_time: close_time.replace(minute=0, second=0, microsecond=0)),
+)
+
+
+class PersistQueue:
+    def __init__(self, interval_ms: float, batch_size: int):
+        self._interval = interval_ms / 1000
+        self._batch_size = batch_size
+        self._session_maker = None
+        self._queue = []  # (вид, symbol, данные) в порядке событий
+        self._symbol_ids = {}  # name: id, кэш вместо SELECT Symbol на каждый ордер
+        self._next_order_id = None
+        self._stride = 1
+        self._pending = Event()  # В очереди есть события
+        self._flush_now = Event()  # Писать не дожидаясь интервала: набран пакет или ждут flush()
+        self._queued = 0  # Номер последнего события в очереди
+        self._committed = 0  # Номер последнего записанного события
+        self._committed_event = Event()
+        self._task = None
+        self.lock = Lock()  # Запись в БД и журнал; снимок состояния берет его, чтобы журнал не менялся во время записи
+        self.journal = None  # recovery.Journal: закоммиченные события для теплого старта
+        self.stats = {'events': 0, 'commits': 0, 'errors': 0, 'rejected': 0}
+        self.rejected = deque(maxlen=1000)  # События, которые БД не принимает и после повторов: для разбора
+        for key in self.stats:
+            metrics.counter(f'db_persist_{key}_total', f'Отложенная запись в БД: {key}',
+                            func=lambda key=key: self.stats[key])
+        metrics.gauge('db_persist_queue', 'События в очереди записи в БД', func=lambda: len(self._queue))
+        self._write_time = metrics.histogram('db_write_ms', 'Транзакция отложенной записи в БД, мс')
+        self._batch_size_hist = metrics.histogram('db_write_batch', 'Событий в транзакции', buckets=SIZE_BUCKETS)
+
+    async def start(self, session_maker, stride: int = 1, offset: int = 0):
+        # Несколько процессов-писателей (shards.py): id ордеров процесса - только с id % stride == offset
+        self._session_maker = session_maker
+        self._stride = stride
+        async with session_maker() as session:
+            self._symbol_ids = dict((await session.execute(select(Symbol.name, Symbol.id))).all())
+            max_id = (await session.execute(select(func.max(OrderInfo.id)))).scalar() or 0
+            self._next_order_id = max_id - (max_id - offset) % stride
+
+        self._task = create_task(self._run())
+
+    @property
+    def symbol_ids(self):  # name: id символов в БД
+        return self._symbol_ids
+
+    def forget_symbol(self, symbol: str):  # Символ удален из БД вне очереди (del_symbol_cmd)
+        self._symbol_ids.pop(symbol, None)
+
+    def _put(self, kind: str, symbol: str, data):
+        self._queue.append((kind, symbol, data))
+        self._queued += 1
+        self.stats['events'] += 1
+        self._pending.set()
+        if len(self._queue) >= self._batch_size:
+            self._flush_now.set()
+
+    def add_order(self, symbol: str, data: dict):  # id ордера сразу, запись - позже
+        self._next_order_id += self._stride
+        self._put('order', symbol, {**data, 'id': self._next_order_id})
+        return self._next_order_id
+
+    def del_orders(self, symbol: str, orders_id: list = None):
+        self._put('delete', symbol, orders_id)
+
+    def update_profit(self, symbol: str, profit_diff: float):
+        self._put('profit', symbol, profit_diff)
+
+    def add_trade(self, symbol: str, data: dict):  # Закрытая сделка в closed_trades и свертки профита
+        self._put('trade', symbol, {**data, 'symbol_name': symbol})
+
+    async def note(self, kind: str, symbol: str, data=None):  # В журнал - изменение, закоммиченное вне очереди
+        async with self.lock:
+            if self.journal is not None:
+                self.journal.append([(kind, symbol, data)])
+
+    async def flush(self):  # Ждем commit всех событий, поставленных до вызова
+        target = self._queued
+        self._flush_now.set()
+        while self._committed < target:
+            await self._committed_event.wait()
+
+    async def _symbol_id(self, session, symbol: str):
+        if (symbol_id := self._symbol_ids.get(symbol)) is None:  # Символ добавлен после старта
+            symbol_id = (await session.execute(select(Symbol.id).where(Symbol.name == symbol))).scalar_one()
+            self._symbol_ids[symbol] = symbol_id
+        return symbol_id
+
+    async def _write(self, batch: list):
+        async with self._session_maker() as session, session.begin():
+            for kind, group in groupby(batch, key=itemgetter(0)):  # Подряд идущие события одного вида - пакетом
+                group = list(group)
+                if kind == 'order':
+                    rows = [{**data, 'symbol_id': await self._symbol_id(session, symbol)} for _, symbol, data in group]
+                    await session.execute(insert(OrderInfo), rows)
+
+                elif kind == 'delete':
+                    for _, symbol, orders_id in group:
+                        query = OrderInfo.id.in_(orders_id) if orders_id else \
+                            OrderInfo.symbol_id == await self._symbol_id(session, symbol)
+                        await session.execute(delete(OrderInfo).where(query))
+
+                elif kind == 'trade':
+                    await self._write_trades(session, [data for _, _, data in group])
+
+                else:
+                    profits = {}
+                    for _, symbol, profit_diff in group:
+                        profits[symbol] = profits.get(symbol, 0.0) + profit_diff
+                    for symbol, profit_diff in profits.items():
+                        await session.execute(update(Symbol).where(Symbol.id == await self._symbol_id(session, symbol))
+                                              .values(profit=Symbol.profit + profit_diff))
+
+    @staticmethod
+    async def _write_trades(session, trades: list):
+        await session.execute(insert(ClosedTrade), trades)
+
+        for model, period_of in ROLLUPS:  # UPDATE, а если строки периода нет - INSERT: писатель в БД один
+            totals = {}
+            for trade in trades:
+                total = totals.setdefault((trade['symbol_name'], period_of(trade['close_time'])), [0, 0.0, 0.0])
+                total[0] += 1
+                total[1] += trade['revenue']
+                total[2] += trade['profit']
+
+            for (symbol, period), (count, revenue, profit) in totals.items():
+                result = await session.execute(
+                    update(model).where(model.symbol_name == symbol, model.period == period)
+                    .values(trades=model.trades + count, revenue=model.revenue + revenue, profit=model.profit + profit))
+                if not result.rowcount:
+                    await session.execute(insert(model).values(symbol_name=symbol, period=period, trades=count,
+                                                               revenue=revenue, profit=profit))
+
+    async def _commit(self, batch: list):
+        async with self.lock:
+            started = perf_counter()
+            await self._write(batch)
+            self._write_time.observe((perf_counter() - started) * 1000)
+            if self.journal is not None:
+                self.journal.append(batch)
+        self.stats['commits'] += 1
+        self._batch_size_hist.observe(len(batch))
+
+    async def _commit_retrying(self, batch: list):  # Ошибка БД - повтор; не прошло - ищем событие, которое не пишется
+        for attempt in range(1, config.PERSIST_RETRIES + 1):
+            try:
+                return await self._commit(batch)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f'Ошибка записи в БД ({len(batch)} событий), попытка {attempt}: {e}')
+                await sleep(1)
+        await self._isolate(batch)
+
+    async def _isolate(self, batch: list):  # Половины пакета по порядку, пока не останется одно плохое событие
+        if len(batch) == 1:
+            self.stats['rejected'] += 1
+            self.rejected.append(batch[0])
+            logger.error(f'Событие не записано в БД и отложено в rejected: {batch[0]}', extra={'symbol': batch[0][1]})
+            return
+
+        for half in (batch[:len(batch) // 2], batch[len(batch) // 2:]):
+            try:
+                await self._commit(half)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f'Ошибка записи в БД ({len(half)} событий), делим пакет: {e}')
+                await self._isolate(half)
+
+    async def _run(self):
+        while True:
+            await self._pending.wait()
+            try:
+                await wait_for(self._flush_now.wait(), self._interval)
+            except AsyncTimeoutError:
+                pass
+
+            self._pending.clear()
+            self._flush_now.clear()
+            batch, self._queue, target = self._queue, [], self._queued
+
+            await self._commit_retrying(batch)
+
+            self._committed = target
+            event, self._committed_event = self._committed_event, Event()
+            event.set()
+
+
+persist_queue = PersistQueue(config.PERSIST_INTERVAL_MS, config.PERSIST_BATCH_SIZE)
@@ -0,0 +1,329 @@
+# Быстрый старт без чтения всей БД: бинарный снимок (numpy .npz) символов, ордеров и конфигов
+# плюс журнал закоммиченных изменений после снимка. Журнал пишет PersistQueue после каждого commit и тут же
+# применяет к State - копии закоммиченного состояния в памяти, поэтому снимок + журнал == состояние БД. Снимок
+# пишется из этой State без чтения БД: при холодном старте ее дают менеджеры сразу после load_from_db.
+# БД остается источником истины: после теплого старта торговля идет сразу, а State сверяется с SQL фоном (check).
+# Расхождение - символ на паузу и поправка в памяти разницей БД и State, снимок пересобирается.
+# Снимок и журнал помечены поколением: журнал другого поколения (сбой между записью снимка и журнала) не применяется.
+from asyncio import sleep
+from logging import getLogger
+from math import isclose
+from os import makedirs, path, replace
+from struct import Struct
+from time import perf_counter
+from typing import NamedTuple
+
+from numpy import dtype, empty, load as np_load, savez, ndarray, concatenate, isin
+from sqlalchemy import select
+
+from bingx_api.bingx_models import ORDER_DTYPE
+from common.config import config
+from database.models import OrderInfo, Symbol, SymbolConfig
+
+logger = getLogger('my_app')
+
+SYMBOL_DTYPE = dtype([('id', 'i8'), ('name', 'U16'), ('step_size', 'f8'), ('state', 'U15'), ('profit', 'f8')])
+SNAPSHOT_ORDER_DTYPE = dtype(ORDER_DTYPE.descr + [('symbol_id', 'i8')])
+CONFIG_DTYPE = dtype([('symbol_name', 'U16'), ('grid_size', 'f8')])
+
+JOURNAL_HEADER = Struct('<q')  # Поколение
+RECORD_HEADER = Struct('<B16sI')  # Вид, символ, длина данных
+KINDS = ('order', 'delete', 'profit', 'state', 'add_symbol', 'del_symbol')
+F8 = Struct('<d')
+SYMBOL_ADDED = Struct('<qd')  # id символа в БД, step_size
+
+
+class SymbolRow(NamedTuple):  # Поля Symbol, которые нужны SymbolOrderManager
+    id: int
+    name: str
+    step_size: float
+    state: str
+    profit: float
+
+
+class ConfigRow(NamedTuple):  # Поля SymbolConfig, которые нужны ConfigManager
+    symbol_name: str
+    grid_size: float
+
+
+class State:  # Снимок + журнал в памяти: symbols name -> SymbolRow, orders name -> ORDER_DTYPE, configs
+    def __init__(self, symbols: dict, orders: dict, configs: list, generation: int):
+        self.symbols = symbols
+        self.orders = orders
+        self.configs = configs
+        self.generation = generation
+        self.journal_records = 0
+
+    def apply(self, kind: str, symbol: str, payload: bytes):
+        match kind:
+            case 'order':
+                order = ndarray(1, dtype=ORDER_DTYPE, buffer=payload)
+                self.orders[symbol] = concatenate((self.orders[symbol], order)) if symbol in self.orders else \
+                    order.copy()
+            case 'delete':
+                if payload and symbol in self.orders:
+                    ids = ndarray(len(payload) // 8, dtype='<i8', buffer=payload)
+                    orders = self.orders[symbol]
+                    self.orders[symbol] = orders[~isin(orders['id'], ids)]
+                else:
+                    self.orders.pop(symbol, None)
+            case 'profit':
+                row = self.symbols[symbol]
+                self.symbols[symbol] = row._replace(profit=row.profit + F8.unpack(payload)[0])
+            case 'state':
+                self.symbols[symbol] = self.symbols[symbol]._replace(state=payload.decode())
+            case 'add_symbol':
+                symbol_id, step_size = SYMBOL_ADDED.unpack(payload)
+                self.symbols[symbol] = SymbolRow(symbol_id, symbol, step_size, 'stop', 0.0)
+            case 'del_symbol':
+                self.symbols.pop(symbol, None)
+                self.orders.pop(symbol, None)
+
+        self.journal_records += 1
+
+
+class Journal:  # Только дозапись закоммиченных событий PersistQueue и хэндлеров
+    def __init__(self, directory: str):
+        self.file = path.join(directory, 'journal.bin')
+        self.records = 0  # Записей с последнего снимка
+        self.state = None  # State, к которой применяется каждая дописанная запись
+
+    def reset(self, generation: int):
+        tmp = f'{self.file}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(JOURNAL_HEADER.pack(generation))
+        replace(tmp, self.file)
+        self.records = 0
+
+    def append(self, events: list):  # events: (вид, symbol, данные) как в очереди PersistQueue
+        chunks = []
+        for kind, symbol, data in events:
+            if kind not in KINDS:  # Журнал сделок (trade) не входит в состояние в памяти
+                continue
+            payload = _encode(kind, data)
+            if self.state is not None:
+                self.state.apply(kind, symbol, payload)
+            chunks.append(RECORD_HEADER.pack(KINDS.index(kind), symbol.encode(), len(payload)) + payload)
+
+        with open(self.file, 'ab') as f:  # fsync не нужен: после сбоя сверка при старте перечитает состояние из БД
+            f.write(b''.join(chunks))
+        self.records += len(chunks)
+
+    def replay(self, state: State):
+        if not path.exists(self.file):
+            return
+
+        with open(self.file, 'rb') as f:
+            raw = f.read()
+
+        if len(raw) < JOURNAL_HEADER.size or JOURNAL_HEADER.unpack_from(raw)[0] != state.generation:
+            logger.warning('Журнал другого поколения, не применяется')
+            return
+
+        offset = JOURNAL_HEADER.size
+        while offset + RECORD_HEADER.size <= len(raw):
+            kind, symbol, size = RECORD_HEADER.unpack_from(raw, offset)
+            if (end := offset + RECORD_HEADER.size + size) > len(raw):
+                logger.warning('Недописанная запись в конце журнала пропущена')
+                break
+
+            state.apply(KINDS[kind], symbol.rstrip(b'\0').decode(), raw[offset + RECORD_HEADER.size:end])
+            offset = end
+
+        self.records = state.journal_records
+
+
+def _encode(kind: str, data):
+    match kind:
+        case 'order':
+            order = empty(1, dtype=ORDER_DTYPE)
+            for key in ORDER_DTYPE.names:
+                order[key] = data[key]
+            return order.tobytes()
+        case 'delete':
+            return b''.join(int(order_id).to_bytes(8, 'little', signed=True) for order_id in data or ())
+        case 'profit':
+            return F8.pack(data)
+        case 'add_symbol':
+            return SYMBOL_ADDED.pack(*data)
+        case 'state':
+            return data.encode()
+        case _:
+            return b''
+
+
+class Recovery:
+    def __init__(self, directory: str):
+        self._directory = directory
+        self._snapshot_file = path.join(directory, 'snapshot.npz')
+        self.journal = Journal(directory)
+        self._generation = 0
+        self.state = None  # Закоммиченное состояние: из него пишется снимок
+
+    def _use(self, state: State):
+        self.state = self.journal.state = state
+
+    def load(self):  # State из снимка и журнала или None, если снимка нет
+        if not path.exists(self._snapshot_file):
+            return None
+
+        try:
+            with np_load(self._snapshot_file, allow_pickle=False) as snapshot:
+                symbols, orders, configs = snapshot['symbols'], snapshot['orders'], snapshot['configs']
+                self._generation = int(snapshot['generation'])
+        except Exception as e:
+            logger.error(f'Снимок состояния не прочитан, загрузка из БД: {e}')
+            return None
+
+        state = _state(symbols, orders, configs, self._generation)
+        self.journal.replay(state)
+        return state
+
+    async def load_into(self, so_manager, config_manager):  # True - состояние поднято без чтения БД
+        started = perf_counter()
+        if (state := self.load()) is None:
+            return False
+
+        await so_manager.add_symbols_and_orders([(row, state.orders.get(name, ()))
+                                                 for name, row in state.symbols.items()])
+        await config_manager.load_config(state.configs)
+        self._use(state)
+        logger.info(f'Теплый старт: снимок + {state.journal_records} записей журнала за '
+                    f'{(perf_counter() - started) * 1000:.1f} мс')
+        return True
+
+    def capture(self, so_manager, config_manager, symbol_ids: dict):  # Холодный старт: State из менеджеров до торговли
+        symbols = {name: so_manager.get(name) for name in so_manager.symbols}
+        self._use(State({name: SymbolRow(symbol_ids[name], name, float(data.step_size), data.state, data.profit)
+                         for name, data in symbols.items()},
+                        {name: data.orders.rows() for name, data in symbols.items()},
+                        [ConfigRow(name, config_manager.get(name, 'grid_size')) for name in config_manager.symbols],
+                        self._generation))
+
+    async def _read_db(self, session_maker):  # State из SQL
+        async with session_maker() as session:
+            symbols = (await session.execute(select(Symbol.id, Symbol.name, Symbol.step_size, Symbol.state,
+                                                    Symbol.profit))).all()
+            orders = (await session.execute(select(OrderInfo.id, OrderInfo.price, OrderInfo.executed_qty,
+                                                   OrderInfo.cost, OrderInfo.cost_with_fee, OrderInfo.open_time,
+                                                   OrderInfo.symbol_id).order_by(OrderInfo.id))).all()
+            configs = (await session.execute(select(SymbolConfig.symbol_name, SymbolConfig.grid_size))).all()
+        return _state(_array(symbols, SYMBOL_DTYPE), _array(orders, SNAPSHOT_ORDER_DTYPE),
+                      _array(configs, CONFIG_DTYPE), self._generation)
+
+    async def save(self, persist_queue):  # Снимок из State в памяти; запись в БД на паузе только на время savez
+        async with persist_queue.lock:
+            state = self.state
+            symbols = _array(list(state.symbols.values()), SYMBOL_DTYPE)
+            orders = concatenate([empty(0, SNAPSHOT_ORDER_DTYPE)] + [_snapshot_orders(state.orders[name], row.id)
+                                                                     for name, row in state.symbols.items()
+                                                                     if name in state.orders])
+            makedirs(self._directory, exist_ok=True)
+            self._generation += 1
+            tmp = f'{self._snapshot_file}.tmp.npz'
+            savez(tmp, generation=self._generation, symbols=symbols, orders=orders,
+                  configs=_array(state.configs, CONFIG_DTYPE))
+            replace(tmp, self._snapshot_file)
+            self.journal.reset(self._generation)
+            state.generation, state.journal_records = self._generation, 0
+
+        logger.info(f'Снимок состояния сохранен: символов {len(symbols)}, ордеров {len(orders)}')
+
+    async def check(self, session_maker, persist_queue, so_manager, config_manager, on_state):
+        # Фоновая сверка теплого старта с SQL, возвращает расходящиеся символы. Поправка в памяти - разница БД и
+        # State, поэтому события, которые еще ждут записи в очереди, остаются в силе.
+        # on_state(symbol, старый, новый) - задачи и подписка символа под статус из БД
+        started = perf_counter()
+        async with persist_queue.lock:  # State и БД - в одной точке журнала; ждет только запись в БД, не торговля
+            state, db = self.state, await self._read_db(session_maker)
+            symbols = {name for name in state.symbols.keys() | db.symbols.keys() if not _same(state, db, name)}
+            configs, db_configs = dict(state.configs), dict(db.configs)
+            config_names = {name for name in configs.keys() | db_configs.keys()
+                            if configs.get(name) != db_configs.get(name)}
+            if symbols or config_names:
+                self._use(db)
+
+        if not symbols and not config_names:
+            logger.info(f'Снимок состояния сверен с БД за {(perf_counter() - started) * 1000:.1f} мс: расхождений нет')
+            return set()
+
+        logger.error(f'Снимок состояния расходится с БД: символы {sorted(symbols)}, конфиги {sorted(config_names)}. '
+                     f'Символы на паузе до поправки из БД, снимок пересобирается')
+        for name in sorted(symbols):
+            db_row = db.symbols.get(name)
+            if name not in so_manager.symbols:  # Символ есть только в БД
+                await so_manager.add_symbols_and_orders([(db_row._replace(state='stop'), db.orders.get(name, ()))])
+                state_old = 'stop'
+            else:
+                state_old = so_manager.get(name).state
+                await so_manager.set_state(name, 'pause')  # Без покупок до поправки
+                if db_row is None:  # Символа нет в БД
+                    await on_state(name, state_old, 'stop')
+                    await so_manager.delete_symbol(name)
+                    persist_queue.forget_symbol(name)
+                    continue
+
+                orders, db_orders = _orders(state, name), _orders(db, name)
+                row = state.symbols.get(name)
+                await so_manager.correct(name, db_orders[~isin(db_orders['id'], orders['id'])],
+                                         orders['id'][~isin(orders['id'], db_orders['id'])].tolist(),
+                                         db_row.profit - (row.profit if row is not None else 0.0))
+
+            await so_manager.set_state(name, db_row.state)
+            await on_state(name, state_old, db_row.state)
+
+        for name in config_names:
+            if (grid_size := db_configs.get(name)) is not None:
+                if name not in config_manager.symbols:
+                    config_manager.symbols.append(name)
+                await config_manager.set_data(name, 'grid_size', grid_size)
+
+        await self.save(persist_queue)
+        return symbols | config_names
+
+    async def run(self, persist_queue, warm: bool):  # warm - снимок уже есть, сверку ведет check
+        if not warm:
+            await self.save(persist_queue)
+
+        while True:
+            await sleep(config.SNAPSHOT_INTERVAL)
+            if self.journal.records:
+                await self.save(persist_queue)
+
+
+def _state(symbols: ndarray, orders: ndarray, configs: ndarray, generation: int):  # State из массивов снимка
+    names = {int(row['id']): str(row['name']) for row in symbols}
+    order_fields = orders[list(ORDER_DTYPE.names)].astype(ORDER_DTYPE)
+    return State({name: SymbolRow(symbol_id, name, float(row['step_size']), str(row['state']), float(row['profit']))
+                  for (symbol_id, name), row in zip(names.items(), symbols)},
+                 {name: order_fields[orders['symbol_id'] == symbol_id] for symbol_id, name in names.items()},
+                 [ConfigRow(str(row['symbol_name']), float(row['grid_size'])) for row in configs], generation)
+
+
+def _orders(state: State, name: str):
+    return state.orders.get(name, empty(0, ORDER_DTYPE))
+
+
+def _same(state: State, db: State, name: str):  # Символ совпадает: state, profit и id ордеров
+    row, db_row = state.symbols.get(name), db.symbols.get(name)
+    return row is not None and db_row is not None and row.state == db_row.state and \
+        isclose(row.profit, db_row.profit, abs_tol=1e-9) and \
+        set(_orders(state, name)['id'].tolist()) == set(_orders(db, name)['id'].tolist())
+
+
+def _snapshot_orders(orders: ndarray, symbol_id: int):
+    array = empty(len(orders), dtype=SNAPSHOT_ORDER_DTYPE)
+    for key in ORDER_DTYPE.names:
+        array[key] = orders[key]
+    array['symbol_id'] = symbol_id
+    return array
+
+
+def _array(rows: list, row_dtype):
+    array = empty(len(rows), dtype=row_dtype)
+    for i, name in enumerate(row_dtype.names):
+        array[name] = [row[i] for row in rows]
+    return array
+
+
+recovery = Recovery(config.SNAPSHOT_DIR)
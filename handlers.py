@@ -1,14 +1,18 @@
 from asyncio import gather
+from datetime import datetime, timedelta
 from aiogram import Router, F
 from aiogram.filters import CommandStart
-from aiogram.types import Message
+from aiogram.types import Message, BufferedInputFile
 from aiohttp import ClientSession
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bingx_api.bingx_command import price_upd_ws, get_symbol_info, start_trading, place_buy_order, so_manager, ws_price, \
-    task_manager, place_sell_order, config_manager
+from bingx_api.bingx_command import price_stream, get_symbol_info, start_trading, place_buy_order, so_manager, ws_price, \
+    task_supervisor, place_sell_order, config_manager, trigger_dispatcher, symbol_meta
 from common.config import config
-from database.orm_query import del_symbol, add_symbol, update_state
+from common.metrics import metrics
+from common.profiling import profile
+from database.orm_query import del_symbol, add_symbol, update_state, get_pnl
+from database.persistence import persist_queue
 from filters.chat_types import IsAdmin
 from indicators.indicator_models import start_indicators
 
@@ -16,6 +20,20 @@ router = Router()
 router.message.filter(IsAdmin(config.ADMIN))  # Фильтр по ID, кто может пользоваться ботом
 
 
+async def apply_state(symbol: str, state_old: str, state_new: str, **kwargs):  # Задачи и подписка под новый статус
+    if state_old in ('track', 'pause') and state_new == 'stop':
+        await task_supervisor.del_tasks(symbol)
+        await price_stream.unsubscribe(symbol)
+        await so_manager.set_b_s_trigger(symbol, 'new')
+
+    elif state_old == 'stop' and state_new in ('track', 'pause'):
+        await gather(
+            price_stream.subscribe(symbol),
+            start_indicators(symbol, http_session=kwargs['http_session']),
+            start_trading(symbol, **kwargs)
+        )
+
+
 @router.message(F.text.startswith('track_') | F.text.startswith('pause_') | F.text.startswith('stop_'))
 async def set_state_cmd(message: Message, session: AsyncSession, http_session: ClientSession):
     state_new, symbol = message.text.split('_')
@@ -30,17 +48,9 @@ async def set_state_cmd(message: Message, session: AsyncSession, http_session: C
         update_state(session, symbol, state_new),
         so_manager.set_state(symbol, state_new)
     )
+    await persist_queue.note('state', symbol, state_new)  # Журнал теплого старта
 
-    if state_old in ('track', 'pause') and state_new == 'stop':
-        await task_manager.del_tasks(symbol)
-        await so_manager.set_b_s_trigger(symbol, 'new')
-
-    elif state_old == 'stop' and state_new in ('track', 'pause'):
-        await gather(
-            price_upd_ws(symbol, http_session=http_session),
-            start_indicators(symbol, http_session=http_session),
-            start_trading(symbol, session=session, http_session=http_session)
-        )
+    await apply_state(symbol, state_old, state_new, session=session, http_session=http_session)
 
     await message.answer(f"Статус монеты {symbol} изменен c {state_old} на {state_new}")
 
@@ -61,7 +71,8 @@ async def get_profit_cmd(message: Message):
         return await message.answer('Нет открытых ордеров')
 
     total_cost_with_fee = await so_manager.get_summary(symbol, 'cost_with_fee')
-    total_cost_with_fee_tp = total_cost_with_fee * (1 + config.TARGET_PROFIT)
+    levels = trigger_dispatcher.levels(symbol)  # Те же уровни, по которым торгует start_trading
+    total_cost_with_fee_tp = levels.take_profit * summary_executed
     current_profit = price * summary_executed - total_cost_with_fee
     profit_to_target = price * summary_executed - total_cost_with_fee_tp
 
@@ -74,14 +85,15 @@ async def get_profit_cmd(message: Message):
         f'\nДоход с учетом комиссии биржи: {current_profit}\n'
         f'Доход с учетом комиссии биржи до достижения 1%: {profit_to_target}\n'
         f'безубыток с комиссией биржи (be_level_with_fee): {total_cost_with_fee / summary_executed}\n'
-        f'безубыток с комиссией биржи + 1% (be_level_with_fee_tp): {total_cost_with_fee_tp / summary_executed}\n'
+        f'безубыток с комиссией биржи + 1% (take_profit_price): {levels.take_profit}\n'
+        f'цена следующей покупки (next_buy_price): {levels.next_buy}\n'
         # f'До достижения безубыток с комиссией биржи: {be_level_with_fee - price}\n'
         # f'До достижения  безубыток с комиссией биржи + 1%: {be_level_with_fee_tp - price}\n'
     )
 
     orders = await so_manager.get_orders(symbol)
-    order_profits = [order['executed_qty'] * price - order['cost_with_fee'] for order in orders]
-    await message.answer("\n".join(map(str, order_profits)))
+    order_profits = orders.profits(price)  # Векторно по всем ордерам
+    await message.answer("\n".join(map(str, order_profits.tolist())))
 
 
 @router.message(F.text.startswith('b_'))  # Вводим например: b_btc, b_Bnb
@@ -93,7 +105,7 @@ async def buy_order_cmd(message: Message, session: AsyncSession, http_session: C
         return await message.answer('Цена не готова')
 
     report = await place_buy_order(symbol, price_data[1], session, http_session)
-    await message.answer(report)
+    await message.answer(str(report))  # Отчет ордера собирается лениво
 
 
 @router.message(F.text.startswith('s_all_'))  # Продажа всех ордеров
@@ -107,7 +119,7 @@ async def del_orders_cmd(message: Message, session: AsyncSession, http_session:
     total_cost_with_fee = await so_manager.get_summary(symbol, 'cost_with_fee')
 
     report = await place_sell_order(symbol, summary_executed, total_cost_with_fee, session, http_session)
-    await message.answer(report)
+    await message.answer(str(report))  # Отчет ордера собирается лениво
 
 
 @router.message(F.text.startswith('s_'))  # Продажа одного последнего ордера
@@ -120,7 +132,69 @@ async def sell_order_cmd(message: Message, session: AsyncSession, http_session:
 
     report = await place_sell_order(symbol, order_data['executed_qty'], order_data['cost_with_fee'], session,
                                     http_session, orders_id=[order_data['id']])
-    await message.answer(report)
+    await message.answer(str(report))  # Отчет ордера собирается лениво
+
+
+@router.message(F.text.startswith('pnl_'))  # Профит по дням: pnl_30, pnl_BTC_90; по часам: pnl_24h, pnl_BTC_48h
+async def pnl_cmd(message: Message, session: AsyncSession):
+    symbol, period = None, '30'
+    for part in message.text.split('_')[1:]:
+        if part.rstrip('hH').isdigit():
+            period = part.lower()
+        elif part:
+            symbol = part.upper()
+
+    hourly, count = period.endswith('h'), max(int(period.rstrip('h')), 1)
+    now = datetime.now()
+    since = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=count - 1) if hourly else \
+        now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=count - 1)
+
+    if not (rows := await get_pnl(session, since, hourly, symbol)):
+        return await message.answer('Закрытых сделок за период нет')
+
+    time_format = '%Y-%m-%d %H:00' if hourly else '%Y-%m-%d'
+    lines, total = [], {}
+    for name, period_start, trades, profit in rows:
+        lines.append(f'{name} {period_start.strftime(time_format)}: {profit:.4f} ({trades})')
+        total[name] = total.get(name, 0.0) + profit
+    lines += ['', *(f'{name} итого: {profit:.4f}' for name, profit in total.items()),
+              f'Всего: {sum(total.values()):.4f}']
+
+    await _answer_lines(message, lines)
+
+
+@router.message(F.text == 'metrics')  # Счетчики и гистограммы задержек горячих путей
+async def metrics_cmd(message: Message):
+    await _answer_lines(message, metrics.report().split('\n'))
+
+
+@router.message(F.text == 'tasks')  # Задачи символов: состояние, перезапуски, время работы, последняя ошибка
+async def tasks_cmd(message: Message):
+    await _answer_lines(message, task_supervisor.report())
+
+
+@router.message(F.text.startswith('prof_'))  # Профиль event loop за N сек: prof_30, файл для flamegraph.pl/speedscope
+async def prof_cmd(message: Message):
+    if not (seconds := message.text[5:]).isdigit() or not 0 < int(seconds) <= config.PROFILE_MAX_SECONDS:
+        return await message.answer(f'Формат: prof_<секунды>, не больше {config.PROFILE_MAX_SECONDS}')
+
+    await message.answer(f'Профилирование {seconds} с...')
+    if not (stacks := await profile(int(seconds))):
+        return await message.answer('Стеки не сняты')
+
+    await message.answer_document(BufferedInputFile(stacks.encode(), filename=f'profile_{seconds}s.folded'),
+                                  caption='Collapsed stacks: flamegraph.pl или speedscope.app')
+
+
+async def _answer_lines(message: Message, lines: list):
+    text = ''
+    for line in lines:  # Сообщение Telegram - до 4096 символов
+        if len(text) + len(line) >= 4000:
+            await message.answer(text)
+            text = ''
+        text += line + '\n'
+    if text.strip():
+        await message.answer(text)
 
 
 @router.message(F.text.startswith('add_'))  # Добавить символ в БД
@@ -131,15 +205,19 @@ async def add_symbol_cmd(message: Message, session: AsyncSession, http_session:
     if symbol in so_manager.symbols:
         return await message.answer('Данный символ уже существует')
 
-    data, text = await get_symbol_info(symbol, http_session)
-    if data is None:
-        return await message.answer(f'Запрос о символе не получен {text}')
+    if (filters := symbol_meta.get(symbol)) is not None:  # Фильтры уже загружены общим запросом
+        step_size = filters.step_size
+    else:
+        data, text = await get_symbol_info(symbol, http_session)
+        if not data or not (symbols := (data.get('data') or {}).get('symbols')):
+            return await message.answer(f'Запрос о символе не получен {text} {data}')
 
-    step_size = data['data']['symbols'][0]['stepSize']
-    await gather(
+        step_size = symbols[0]['stepSize']
+    symbol_id, _ = await gather(
         add_symbol(symbol, session, step_size),
         so_manager.add_symbol(symbol, step_size),
     )
+    await persist_queue.note('add_symbol', symbol, (symbol_id, float(step_size)))  # id из БД - в снимок
     await message.answer('Символ добавлен в статусе "stop"')
 
 
@@ -157,19 +235,30 @@ async def del_symbol_cmd(message: Message, session: AsyncSession):
     if await so_manager.get_profit(symbol):
         return await message.answer('По данному символу есть профит')
 
+    await persist_queue.flush()  # Отложенные записи символа - до удаления
+    persist_queue.forget_symbol(symbol)
     await gather(
         del_symbol(symbol, session),
         so_manager.delete_symbol(symbol),
     )
+    await persist_queue.note('del_symbol', symbol)
 
     await message.answer('Символ удален')
 
 
+# Команды, которые выполняет воркер-владелец символа (shards.py), в порядке проверки префикса
+WORKER_COMMANDS = (
+    ('track_', set_state_cmd), ('pause_', set_state_cmd), ('stop_', set_state_cmd), ('profit_', get_profit_cmd),
+    ('b_', buy_order_cmd), ('s_all_', del_orders_cmd), ('s_', sell_order_cmd), ('add_', add_symbol_cmd),
+    ('del_', del_symbol_cmd), ('metrics', metrics_cmd), ('tasks', tasks_cmd),
+)
+
+
 # ----------------- T E S T ---------------------------------------
 @router.message(CommandStart())
 async def start_cmd(message: Message, session: AsyncSession, http_session: ClientSession):
-    for tasks in task_manager._tasks.items():
-        print(tasks)
+    for line in task_supervisor.report():
+        print(line)
     for tasks in so_manager._data.items():
         print(tasks)
 
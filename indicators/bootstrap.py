@@ -0,0 +1,82 @@
+from asyncio import Semaphore, create_task, gather
+from logging import getLogger
+from time import monotonic, time
+
+from aiohttp import ClientSession
+from numpy import array as np_array, concatenate, diff
+
+from bingx_api.bingx_client import bingx_client
+from bingx_api.bingx_command import get_candlestick_data
+from common.config import config
+from indicators.candle_store import candle_stores, CANDLE_DTYPE
+
+logger = getLogger('my_app')
+
+
+class KlineBootstrap:  # Стартовые свечи всех символов разом; лимиты и повторы запросов - в bingx_client
+    def __init__(self):
+        self._buffers = {}  # (symbol, interval): Task -> свечи CANDLE_DTYPE (последняя открыта) | None
+        self._semaphore = Semaphore(config.KLINE_CONCURRENCY)
+        self.stats = {'requests': 0, 'failed': 0, 'local': 0}  # local - свечей взято с диска
+        self._report_task = None
+
+    def start(self, http_session: ClientSession, symbols: list, limit: int = 300):
+        for symbol in symbols:
+            for interval in config.CANDLE_INTERVALS:
+                self._buffers[(symbol, interval)] = create_task(self._fetch(http_session, symbol, interval, limit))
+
+        self._report_task = create_task(self._report(list(self._buffers.values()), monotonic()))
+
+    async def get(self, http_session: ClientSession, symbol: str, interval: str, limit: int = 300):
+        # Готовый буфер забираем один раз; при перезапуске символа (set_state_cmd) грузим заново
+        if (task := self._buffers.pop((symbol, interval), None)) is None:
+            task = create_task(self._fetch(http_session, symbol, interval, limit))
+
+        return await task
+
+    async def _fetch(self, http_session: ClientSession, symbol: str, interval: str, limit: int):
+        # Закрытые свечи берем из локального хранилища, по REST догружаем только хвост с момента остановки
+        store = candle_stores.get(symbol, interval)
+        local = store.read(limit)
+        current_open_time = int(time() * 1000) // store.step * store.step
+
+        fetch_limit = limit
+        missing = (current_open_time - store.last_open_time) // store.step if store.last_open_time else limit
+        if missing < limit:
+            fetch_limit = missing + 2  # Недостающие закрытые + открытая свеча + запас на расхождение часов
+
+        if (fetched := await self._request(http_session, symbol, interval, fetch_limit)) is None:
+            return None
+
+        store.append(fetched[:-1])  # Последняя свеча еще открыта
+        klines = concatenate((local[local['open_time'] < fetched[0]['open_time']], fetched))[-limit:]
+
+        if len(klines) < limit and fetch_limit < limit or (diff(klines['open_time']) != store.step).any():
+            # Дыра в локальных данных (или биржа вернула меньше свечей) - берем всю историю по REST
+            if (klines := await self._request(http_session, symbol, interval, limit)) is None:
+                return None
+            store.append(klines[:-1])
+
+        self.stats['local'] += len(klines) - min(len(klines), fetch_limit)
+        return klines
+
+    async def _request(self, http_session: ClientSession, symbol: str, interval: str, limit: int):
+        async with self._semaphore:
+            self.stats['requests'] += 1
+            data, text = await get_candlestick_data(symbol, http_session, interval, limit=limit)
+
+        if data and (data_ok := data.get("data")):  # [openTime, open, high, low, close, volume, ...], новые первыми
+            return np_array([(item[0], *map(float, item[1:6])) for item in reversed(data_ok)], dtype=CANDLE_DTYPE)
+
+        self.stats['failed'] += 1
+        logger.error(f'Ошибка получения данных candlestick {symbol} {interval}: {data}, {text}')
+        return None
+
+    async def _report(self, tasks: list, started: float):
+        await gather(*tasks, return_exceptions=True)
+        logger.info(f'Загрузка свечей: {len(tasks)} буферов за {monotonic() - started:.2f} с, '
+                    f'запросов {self.stats["requests"]}, ошибок {self.stats["failed"]}, '
+                    f'свечей с диска {self.stats["local"]}, REST {bingx_client.stats}')
+
+
+kline_bootstrap = KlineBootstrap()
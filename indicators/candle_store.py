@@ -0,0 +1,62 @@
+from logging import getLogger
+from os import makedirs, path, truncate
+
+from numpy import dtype, memmap, empty
+
+from common.config import config
+
+logger = getLogger('my_app')
+
+CANDLE_DTYPE = dtype([('open_time', 'i8'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'), ('close', 'f8'),
+                      ('volume', 'f8')])  # 48 байт на свечу
+INTERVAL_MS = {'1m': 60_000, '5m': 300_000, '15m': 900_000, '1h': 3_600_000, '4h': 14_400_000, '1d': 86_400_000}
+
+
+class CandleStore:  # Закрытые свечи символа и интервала в файле записей CANDLE_DTYPE, только дозапись
+    def __init__(self, directory: str, symbol: str, interval: str):
+        self.file = path.join(directory, f'{symbol}_{interval}.bin')
+        self.step = INTERVAL_MS[interval]
+
+        makedirs(directory, exist_ok=True)
+        if (size := path.getsize(self.file) if path.exists(self.file) else 0) % CANDLE_DTYPE.itemsize:
+            # Недописанная запись после аварийной остановки - отрезаем
+            truncate(self.file, size - size % CANDLE_DTYPE.itemsize)
+            logger.warning(f'Обрезана недописанная свеча в {self.file}')
+
+        self._last_open_time = int(last[-1]['open_time']) if len(last := self.read(1)) else None
+
+    @property
+    def last_open_time(self):
+        return self._last_open_time
+
+    def read(self, limit: int = None):  # Последние limit свечей, memmap без копирования файла в память
+        if not path.exists(self.file) or path.getsize(self.file) == 0:
+            return empty(0, dtype=CANDLE_DTYPE)
+
+        candles = memmap(self.file, dtype=CANDLE_DTYPE, mode='r')
+        return candles[-limit:] if limit else candles
+
+    def append(self, candles):  # Дописываем только свечи новее последней сохраненной
+        if self._last_open_time is not None:
+            candles = candles[candles['open_time'] > self._last_open_time]
+
+        if len(candles):
+            with open(self.file, 'ab') as f:
+                f.write(candles.astype(CANDLE_DTYPE, copy=False).tobytes())
+            self._last_open_time = int(candles[-1]['open_time'])
+
+        return len(candles)
+
+
+class CandleStores:  # Хранилища по (symbol, interval), создаются при первом обращении
+    def __init__(self, directory: str):
+        self._directory = directory
+        self._stores = {}
+
+    def get(self, symbol: str, interval: str) -> CandleStore:
+        if (key := (symbol, interval)) not in self._stores:
+            self._stores[key] = CandleStore(self._directory, symbol, interval)
+        return self._stores[key]
+
+
+candle_stores = CandleStores(config.CANDLES_DIR)
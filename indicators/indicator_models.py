@@ -1,111 +1,139 @@
-from asyncio import sleep
-from collections import deque
+from asyncio import sleep, gather
+from bisect import bisect_right
 from logging import getLogger
+from math import inf
+from time import perf_counter
 from aiohttp import ClientSession
 from talib import MACD, RSI
-from numpy import array as np_array
+from numpy import array as np_array, nanmax, abs as np_abs
 
-from bingx_api.bingx_command import get_candlestick_data, ws_price, so_manager, task_manager, config_manager, \
-    account_manager
+from bingx_api.bingx_command import ws_price, so_manager, task_supervisor, config_manager, \
+    account_manager, candle_builders
 from common.config import config
 from common.func import add_task
+from common.metrics import metrics
+from common.strategy import macd_trigger, main_lot_for_balance, bucket_lot_and_grid, rsi_edges
+from indicators.bootstrap import kline_bootstrap
+from indicators.candle_store import candle_stores, CANDLE_DTYPE
+from indicators.streaming import StreamMACD, StreamRSI
 
 logger = getLogger('my_app')
 
+INDICATORS_STEP = metrics.histogram('indicators_step_ms', 'Пересчет индикаторов символа по тику, мс')
 
-async def _get_initial_close_prices(symbol: str, http_session: ClientSession, interval: str, limit: int = 300):
-    data, text = await get_candlestick_data(symbol, http_session, interval, limit=limit)
 
-    if not (data_ok := data.get("data")):
-        logger.error(f'Ошибка получения данных candlestick {symbol}: {data}, {text}')
+async def _get_initial_klines(symbol: str, http_session: ClientSession, interval: str, limit: int = 300):
+    if (klines := await kline_bootstrap.get(http_session, symbol, interval, limit=limit)) is None:
         return None
 
-    open_times, close_price = zip(*[(item[0], item[4]) for item in reversed(data_ok)])
+    # Открытая свеча REST дает построителю баров open/high/low/объем с начала бара, до первого тика
+    candle_builders.get(symbol).reconcile(interval, klines[-1].tolist(), close=False)
+    return klines
 
-    timeframe_minutes = {'1m': 1, '4h': 240}
 
-    delta = timeframe_minutes[interval] * 60 * 1000 - 1
-    next_candle_time = open_times[-1] + delta
-    return delta, next_candle_time, deque(close_price, maxlen=limit)
+def _init_stream(symbol: str, indicator: StreamMACD | StreamRSI, close_prices: tuple):
+    # Прогоняем закрытые свечи (последняя свеча еще открыта), один раз сверяем с TA-Lib на этой же истории
+    for price in close_prices[:-1]:
+        indicator.update(price)
 
+    closes = np_array(close_prices, dtype=float)
+    if isinstance(indicator, StreamMACD):
+        expected = MACD(closes, fastperiod=12, slowperiod=26, signalperiod=9)[2][-2:]
+        actual = indicator.hist, indicator.peek(close_prices[-1])
+    else:
+        expected = RSI(closes, timeperiod=14)[-2:]
+        actual = indicator.value, indicator.peek(close_prices[-1])
 
-async def _process_indicators_logic(symbol: str, close_prices: deque, logic_name: str, main_lot_map: dict = None):
-    close_prices = np_array(close_prices, dtype=float)
+    if (diff := nanmax(np_abs(np_array(actual, dtype=float) - expected))) > 1e-6:
+        logger.error(f'Расхождение {type(indicator).__name__} с TA-Lib {symbol}: {diff}')
+    else:
+        logger.debug(f'{type(indicator).__name__} {symbol} совпадает с TA-Lib, расхождение {diff}')
 
+    return indicator
+
+
+async def _process_indicators_logic(symbol: str, logic_name: str, value, main_lot_map: dict = None):
     match logic_name:
         case 'macd_1m':
-            _, _, hist = MACD(close_prices, fastperiod=12, slowperiod=26, signalperiod=9)
-
-            if hist[-2] > 0 and hist[-1] > 0 and await so_manager.get_b_s_trigger(symbol) in ('sell', 'new'):
-                await so_manager.set_b_s_trigger(symbol, 'buy')
+            hist_prev, hist_last = value
 
-            elif hist[-2] < 0 and hist[-1] < 0 and await so_manager.get_b_s_trigger(symbol) in ('buy', 'new'):
-                await so_manager.set_b_s_trigger(symbol, 'sell')
+            if trigger := macd_trigger(hist_prev, hist_last, so_manager.get(symbol).b_s_trigger):
+                await so_manager.set_b_s_trigger(symbol, trigger)
 
         case 'rsi_4h':
-            rsi = RSI(close_prices, timeperiod=14)[-1]
-            grid_size = await config_manager.get_data(symbol, 'grid_size')
-            usdt_balance = await account_manager.get_balance('USDT')
-
-            for (min_balance, max_balance), lot in main_lot_map.items():
-                if min_balance < usdt_balance <= max_balance:
-                    main_lot = lot
-                    break
-
-            rsi_lot_and_grid_map = {
-                (-float('inf'), 20): (main_lot * 4.5, grid_size * 1),
-                (20, 25): (main_lot * 3.5, grid_size * 1),
-                (25, 30): (main_lot * 3, grid_size * 1),
-                (30, 35): (main_lot * 2, grid_size * 1),
-                (35, 40): (main_lot * 1.5, grid_size * 1),
-                (40, 45): (main_lot * 1, grid_size * 1),
-                (45, 50): (main_lot * 1, grid_size * 1),
-                (50, 55): (main_lot * 1, grid_size * 1),
-                (55, 60): (main_lot * 1, grid_size * 1),
-                (60, 65): (main_lot * 0.1, grid_size * 1),
-                (65, 70): (main_lot * 0.1, grid_size * 1),
-                (70, float('inf')): (main_lot * 0.05, grid_size)
-            }
-
-            for (rsi_min, rsi_max), (target_lot, target_grid_size) in rsi_lot_and_grid_map.items():
-                if rsi_min <= rsi < rsi_max:
-                    await config_manager.set_data(symbol, 'lot', target_lot)
-                    await config_manager.set_data(symbol, 'main_lot', main_lot)  # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-                    await config_manager.set_data(symbol, 'target_grid_size', target_grid_size)
-                    await config_manager.set_data(symbol, 'init_rsi', True)  # сначала индикатор, потом запуск торгов
-                    break  # Выходим из цикла после обновления лота
-
-
-@add_task(task_manager, so_manager, 'start_indicators')
-async def start_indicators(symbol: str, http_session: ClientSession):
-    while not await ws_price.get_price(symbol):
-        await sleep(0.3)  # Задержка перед попыткой получения цены
+            bucket = value
+            grid_size = config_manager.get(symbol, 'grid_size')
 
-    initial_1m_data = await _get_initial_close_prices(symbol, http_session, '1m')
-    initial_4h_data = await _get_initial_close_prices(symbol, http_session, '4h')
+            # Баланс еще не пришел из account_upd_ws или вне карты лотов - ждем следующего пересчета
+            if (main_lot := main_lot_for_balance(account_manager.balance('USDT'), main_lot_map)) is None:
+                return
 
-    if not initial_1m_data or not initial_4h_data:
-        return
+            target_lot, target_grid_size = bucket_lot_and_grid(bucket, main_lot, grid_size)
+            current = config_manager.snapshot(symbol)
+            if current.get('init_rsi') and \
+                    (current.get('lot'), current.get('main_lot'), current.get('target_grid_size')) == \
+                    (target_lot, main_lot, target_grid_size):
+                return  # Корзина и баланс не изменились - lock не берем
 
-    delta_1m, next_candle_time_1m, close_prices_deque_1m = initial_1m_data
-    delta_4h, next_candle_time_4h, close_prices_deque_4h = initial_4h_data
+            await config_manager.set_data(symbol, 'lot', target_lot)
+            await config_manager.set_data(symbol, 'main_lot', main_lot)  # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+            await config_manager.set_data(symbol, 'target_grid_size', target_grid_size)
+            await config_manager.set_data(symbol, 'init_rsi', True)  # сначала индикатор, потом запуск торгов
 
-    while True:
-        time_now, price = await ws_price.get_price(symbol)
 
-        if time_now >= next_candle_time_1m:
-            close_prices_deque_1m[-1] = price
-            close_prices_deque_1m.append(price)
-            next_candle_time_1m += delta_1m  # Обновляем время следующей свечи
-            await _process_indicators_logic(symbol, close_prices_deque_1m, 'macd_1m')
+@add_task(task_supervisor, so_manager, 'start_indicators')
+async def start_indicators(symbol: str, http_session: ClientSession):
+    klines_1m, klines_4h = await gather(_get_initial_klines(symbol, http_session, '1m'),
+                                        _get_initial_klines(symbol, http_session, '4h'))
+    if klines_1m is None or klines_4h is None:
+        return
+
+    tick = await ws_price.wait_price(symbol)  # Ждем первую цену
 
-        close_prices_deque_4h[-1] = price
-        if time_now >= next_candle_time_4h:
-            close_prices_deque_4h.append(price)
-            next_candle_time_4h += delta_4h
+    macd_1m = _init_stream(symbol, StreamMACD(fast_period=12, slow_period=26, signal_period=9),
+                           tuple(klines_1m['close'].tolist()))
+    rsi_4h = _init_stream(symbol, StreamRSI(period=14), tuple(klines_4h['close'].tolist()))
 
-        # !!!!!!!!!! запускается много раз, изменить логику !!!!!!!!!!!!!!!
-        if await so_manager.get_b_s_trigger(symbol) in ('buy', 'new'):
-            await _process_indicators_logic(symbol, close_prices_deque_4h, 'rsi_4h', config.MAIN_LOT_MAP)
+    # Последний учтенный закрытый бар: бары, закрытые до загрузки истории, уже в ней
+    last_open_time = {'1m': int(klines_1m[-2]['open_time']), '4h': int(klines_4h[-2]['open_time'])}
+    builder = candle_builders.get(symbol)
 
-        await sleep(1)
+    # Пороги цены для границ корзин RSI меняются только на закрытии 4h бара. Пока цена внутри
+    # [band_low, band_high), корзина та же - RSI не пересчитываем
+    edges = rsi_edges()
+    rsi_prices = rsi_4h.threshold_prices(edges)
+    band_low = band_high = bucket = None
+
+    while True:
+        tick = await ws_price.wait_price(symbol, tick)
+        _, price = tick
+        started = perf_counter()
+
+        # Индикаторы пересчитываются только на закрытии бара, по цене закрытия бара
+        for interval, bar, kline in builder.pop_closed():
+            if bar[0] <= last_open_time[interval]:
+                continue
+
+            last_open_time[interval] = bar[0]
+            # На диск - только бары, сверенные с kline websocket, и без дыр. Бар из одних тиков (объем 0) и все
+            # после него на диск не пишем - при следующем старте хвост догрузит REST
+            if kline and (store := candle_stores.get(symbol, interval)).last_open_time == bar[0] - store.step:
+                store.append(np_array([bar], dtype=CANDLE_DTYPE))
+
+            if interval == '1m':
+                hist_prev = macd_1m.update(bar[4])  # O(1)
+                await _process_indicators_logic(symbol, 'macd_1m', (hist_prev, macd_1m.peek(price)))
+            else:
+                rsi_4h.update(bar[4])
+                rsi_prices, band_low = rsi_4h.threshold_prices(edges), None
+
+        if rsi_prices is not None and (band_low is None or not band_low <= price < band_high):  # None - прогрев RSI
+            bucket = bisect_right(rsi_prices, price)
+            band_low = rsi_prices[bucket - 1] if bucket else -inf
+            band_high = rsi_prices[bucket] if bucket < len(rsi_prices) else inf
+
+        if bucket is not None and so_manager.get(symbol).b_s_trigger in ('buy', 'new'):
+            await _process_indicators_logic(symbol, 'rsi_4h', bucket, config.MAIN_LOT_MAP)
+
+        INDICATORS_STEP.observe((perf_counter() - started) * 1000)
+        await sleep(config.INDICATORS_MIN_INTERVAL)
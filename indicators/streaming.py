@@ -0,0 +1,150 @@
+from collections import deque
+from copy import deepcopy
+
+
+# Потоковые индикаторы: состояние хранится по закрытым свечам, update(close) - O(1) при закрытии свечи,
+# peek(price) - значение для незакрытой свечи с текущей ценой без изменения состояния.
+# Прогрев и сглаживание повторяют TA-Lib (EMA с затравкой SMA, RSI по Уайлдеру), значения совпадают с MACD/RSI из talib
+
+
+class StreamEMA:
+    def __init__(self, period: int):
+        self.period = period
+        self.k = 2 / (period + 1)
+        self.value = None
+        self._warmup = []  # Первые period значений для затравки SMA
+
+    def _next(self, x: float):
+        return (x - self.value) * self.k + self.value
+
+    def update(self, x: float):
+        if self.value is None:
+            self._warmup.append(x)
+            if len(self._warmup) == self.period:
+                self.value = sum(self._warmup) / self.period
+                self._warmup = None
+            return self.value
+
+        self.value = self._next(x)
+        return self.value
+
+    def peek(self, x: float):
+        return deepcopy(self).update(x) if self.value is None else self._next(x)
+
+
+class StreamMACD:
+    def __init__(self, fast_period: int = 12, slow_period: int = 26, signal_period: int = 9):
+        self.fast_period = fast_period
+        self.slow_period = slow_period
+        self._fast_k = 2 / (fast_period + 1)
+        self._slow_k = 2 / (slow_period + 1)
+        self._fast = None
+        self._slow = None
+        self._warmup = deque(maxlen=slow_period)
+        self._signal = StreamEMA(signal_period)
+        self.hist = None  # Гистограмма последней закрытой свечи
+
+    def _next_macd(self, close: float):
+        fast = (close - self._fast) * self._fast_k + self._fast
+        slow = (close - self._slow) * self._slow_k + self._slow
+        return fast, slow
+
+    def update(self, close: float):
+        if self._slow is None:
+            self._warmup.append(close)
+            if len(self._warmup) < self.slow_period:
+                return None
+
+            # Как в TA-Lib: обе EMA стартуют на одной свече, быстрая - с SMA последних fast_period значений
+            values = list(self._warmup)
+            self._slow = sum(values) / self.slow_period
+            self._fast = sum(values[-self.fast_period:]) / self.fast_period
+            self._warmup = None
+        else:
+            self._fast, self._slow = self._next_macd(close)
+
+        macd = self._fast - self._slow
+        if (signal := self._signal.update(macd)) is not None:
+            self.hist = macd - signal
+
+        return self.hist
+
+    def peek(self, close: float):
+        if self._slow is None or self._signal.value is None:  # Прогрев, считаем на копии
+            return deepcopy(self).update(close)
+
+        fast, slow = self._next_macd(close)
+        macd = fast - slow
+        return macd - self._signal.peek(macd)
+
+
+class StreamRSI:
+    def __init__(self, period: int = 14):
+        self.period = period
+        self._prev_close = None
+        self._avg_gain = 0.0
+        self._avg_loss = 0.0
+        self._count = 0  # Количество изменений цены, учтенных в средних
+        self.value = None  # RSI последней закрытой свечи
+
+    @staticmethod
+    def _rsi(avg_gain: float, avg_loss: float):
+        total = avg_gain + avg_loss
+        return 100 * (avg_gain / total) if not -1e-8 < total < 1e-8 else 0.0  # TA_IS_ZERO в TA-Lib
+
+    @property
+    def averages(self):  # Средние прироста и падения после последней закрытой свечи
+        return self._avg_gain, self._avg_loss
+
+    def _next_avg(self, close: float):
+        diff = close - self._prev_close
+        gain, loss = (diff, 0.0) if diff >= 0 else (0.0, -diff)
+
+        # Сглаживание Уайлдера
+        return ((self._avg_gain * (self.period - 1) + gain) / self.period,
+                (self._avg_loss * (self.period - 1) + loss) / self.period)
+
+    def update(self, close: float):
+        if self._prev_close is None:
+            self._prev_close = close
+            return None
+
+        if self._count < self.period:  # Как в TA-Lib: копим сумму, делим один раз
+            diff = close - self._prev_close
+            self._avg_gain += max(diff, 0.0)
+            self._avg_loss += max(-diff, 0.0)
+            self._count += 1
+            if self._count == self.period:
+                self._avg_gain /= self.period
+                self._avg_loss /= self.period
+                self.value = self._rsi(self._avg_gain, self._avg_loss)
+        else:
+            self._avg_gain, self._avg_loss = self._next_avg(close)
+            self.value = self._rsi(self._avg_gain, self._avg_loss)
+
+        self._prev_close = close
+        return self.value
+
+    def peek(self, close: float):
+        if self._count < self.period:  # Прогрев, считаем на копии
+            return deepcopy(self).update(close) if self._prev_close is not None else None
+
+        return self._rsi(*self._next_avg(close))
+
+    def threshold_prices(self, levels):
+        # Цены, при которых RSI незакрытой свечи равен каждому уровню (0 < level < 100). RSI растет с ценой,
+        # поэтому до следующего закрытия корзину RSI можно определять сравнением цены с этими порогами
+        if self._count < self.period:
+            return None
+
+        gain, loss = self._avg_gain * (self.period - 1), self._avg_loss * (self.period - 1)
+        prices = []
+        for level in levels:
+            q = level / 100
+            if gain + loss and gain / (gain + loss) >= q:  # Уровень не выше RSI при той же цене - порог ниже
+                diff = gain + loss - gain / q
+            else:
+                diff = q * loss / (1 - q) - gain
+            prices.append(self._prev_close + diff)
+
+        return prices
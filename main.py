@@ -1,41 +1,30 @@
 from asyncio import gather, run
-from logging import DEBUG, FileHandler, INFO, ERROR, getLogger, Formatter
+from functools import partial
+from time import perf_counter
+from logging import getLogger
 
 from aiogram import Bot, Dispatcher
 from aiohttp import ClientSession, TCPConnector, ClientTimeout
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 from common.config import config
+from common.logs import setup_logging
+from common.metrics import serve_metrics
+from common.profiling import loop_monitor
 from database.orm_query import load_from_db, init_db
-from handlers import router
+from database.persistence import persist_queue
+from database.recovery import recovery
+from handlers import router, apply_state
+from indicators.bootstrap import kline_bootstrap
 from indicators.indicator_models import start_indicators
-from bingx_api.bingx_command import price_upd_ws, manage_listen_key, account_upd_ws, so_manager, start_trading, \
-    config_manager
+from bingx_api.bingx_command import price_stream, manage_listen_key, account_upd_ws, so_manager, start_trading, \
+    config_manager, manage_symbol_meta
 
 from middlewares.db import DataBaseSession
 from middlewares.http import HttpSession
+from shards import Coordinator, ShardForward
 
-# Создаем логгер
 logger = getLogger('my_app')
-logger.setLevel(DEBUG)  # Устанавливаем минимальный уровень логирования
-
-debug_handler = FileHandler('logs/debug.log', encoding="utf-8")
-info_handler = FileHandler('logs/info.log', encoding="utf-8")
-error_handler = FileHandler('logs/error.log', encoding="utf-8")
-formatter = Formatter('%(asctime)s - %(levelname)s - %(message)s')
-
-debug_handler.setLevel(DEBUG)
-info_handler.setLevel(INFO)
-error_handler.setLevel(ERROR)
-
-debug_handler.setFormatter(formatter)
-info_handler.setFormatter(formatter)
-error_handler.setFormatter(formatter)
-
-# Добавляем хендлеры к логгеру
-logger.addHandler(debug_handler)
-logger.addHandler(info_handler)
-logger.addHandler(error_handler)
 
 bot = Bot(token=config.TOKEN)
 dp = Dispatcher()
@@ -43,7 +32,7 @@ dp.include_router(router)
 
 
 async def main():
-    engine = create_async_engine(config.DB_URL, echo=True)
+    engine = create_async_engine(config.DB_URL, echo=config.DB_ECHO)
     async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
     connector = TCPConnector(limit=200, keepalive_timeout=30)
@@ -54,16 +43,51 @@ async def main():
     async with ClientSession(headers=config.HEADERS, connector=connector, timeout=timeout) as http_session:
         dp.update.middleware(HttpSession(session=http_session)),
 
+        if config.WORKERS:  # Символы - в процессах-воркерах, здесь счет, listen key и бот
+            await init_db(engine)
+            coordinator = Coordinator(config.WORKERS)
+            router.message.middleware(ShardForward(coordinator))
+            return await gather(
+                coordinator.run(),
+                loop_monitor.run(),
+                manage_listen_key(http_session),
+                account_upd_ws(http_session),
+                serve_metrics(config.METRICS_HOST, config.METRICS_PORT),
+                bot.delete_webhook(drop_pending_updates=True),
+                dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types()),
+            )
+
+        started = perf_counter()
         async with async_session() as session:
             await init_db(engine)
-            await load_from_db(session, so_manager, config_manager)
+            if not (warm := await recovery.load_into(so_manager, config_manager)):  # Снимок + журнал, иначе из БД
+                await load_from_db(session, so_manager, config_manager)
+        await persist_queue.start(async_session)
+        if not warm:  # Основа снимка - состояние, только что прочитанное из БД
+            recovery.capture(so_manager, config_manager, persist_queue.symbol_ids)
+        persist_queue.journal = recovery.journal
+        db_loaded = perf_counter()
 
         symbols = so_manager.symbols
+        active_symbols = [symbol for symbol in symbols if await so_manager.get_state(symbol) != 'stop']
+        kline_bootstrap.start(http_session, active_symbols)  # Свечи всех символов грузятся параллельно с подписками
+        await price_stream.start(http_session, active_symbols)
+
+        logger.info(f'Старт: БД {db_loaded - started:.2f} с, подписки на цены {perf_counter() - db_loaded:.2f} с, '
+                    f'символов {len(active_symbols)} из {len(symbols)}')
+
         tasks = (
             manage_listen_key(http_session),
+            manage_symbol_meta(http_session),
+            recovery.run(persist_queue, warm),  # Периодическая свертка журнала в снимок
+            # Теплый старт сверяется с БД фоном, торговля уже идет
+            *([recovery.check(async_session, persist_queue, so_manager, config_manager,
+                              partial(apply_state, http_session=http_session, async_session=async_session))]
+              if warm else []),
+            serve_metrics(config.METRICS_HOST, config.METRICS_PORT),
+            loop_monitor.run(),
             account_upd_ws(http_session),
             *(start_indicators(symbol, http_session=http_session) for symbol in symbols),
-            *(price_upd_ws(symbol, http_session=http_session, seconds=i) for i, symbol in enumerate(symbols)),
             *(start_trading(symbol, http_session=http_session, async_session=async_session) for symbol in symbols),
 
             # bot.delete_my_commands(scope=BotCommandScopeAllPrivateChats()),
@@ -76,5 +100,10 @@ async def main():
         await gather(*tasks)
 
 
-if __name__ == "__main__":
-    run(main())
+if __name__ == "__main__":  # Воркеры (spawn) импортируют main заново - логирование только здесь
+    # Логи пишет отдельный поток, в event loop - только постановка записи в очередь
+    log_listener = setup_logging()
+    try:
+        run(main())
+    finally:
+        log_listener.stop()  # Дописываем очередь логов
@@ -0,0 +1,230 @@
+# Режим WORKERS > 0: символы делятся между процессами-воркерами по crc32(символ) % WORKERS. У воркера свои
+# websocket цен, свечи, индикаторы, торговля и отложенная запись в БД своих символов. Координатор (main.py) держит
+# AccountManager (балансы, блок USDT, listen key, account_upd_ws) и бота: команды по символу пересылает воркеру-
+# владельцу, балансы и блок USDT рассылает воркерам. Канал - common.ipc, задержка запрос-ответ - ipc_rtt_ms.
+# Снимок состояния (database.recovery) в этом режиме не ведется: журнал и снимок - одного процесса.
+from asyncio import Event, create_task, gather, get_running_loop, open_connection, run, sleep, start_server
+from inspect import signature
+from logging import getLogger
+from multiprocessing import get_context
+from os import path
+from time import perf_counter
+from zlib import crc32
+
+from aiogram import BaseMiddleware
+from aiohttp import ClientSession, TCPConnector, ClientTimeout
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from bingx_api.bingx_client import bingx_client
+from bingx_api.bingx_command import price_stream, account_manager, so_manager, config_manager, start_trading, \
+    manage_symbol_meta
+from common.config import config
+from common.ipc import Channel, STREAM_LIMIT
+from common.logs import setup_logging
+from common.metrics import metrics, serve_metrics
+from common.profiling import loop_monitor
+from database.orm_query import load_from_db
+from database.persistence import persist_queue
+from handlers import WORKER_COMMANDS
+from indicators.bootstrap import kline_bootstrap
+from indicators.indicator_models import start_indicators
+
+logger = getLogger('my_app')
+
+SYMBOL_PREFIXES = tuple(prefix for prefix, _ in WORKER_COMMANDS if prefix.endswith('_'))
+BROADCAST_COMMANDS = ('metrics', 'tasks')  # Отвечают координатор и каждый воркер
+
+
+def shard_of(symbol: str, workers: int):
+    return crc32(symbol.upper().encode()) % workers
+
+
+def command_symbol(text: str):  # Символ команды бота или None, если команда не по символу
+    if text.startswith(SYMBOL_PREFIXES):
+        return text.rsplit('_', 1)[1].upper()
+
+
+class Coordinator:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._channels = {}  # номер воркера: Channel
+        self._port = None
+        self._listening = Event()
+        self._rtt = [metrics.histogram('ipc_rtt_ms', 'Запрос-ответ координатор - воркер, мс', worker=str(index))
+                     for index in range(workers)]
+        metrics.gauge('ipc_workers', 'Подключено воркеров', func=lambda: len(self._channels))
+        account_manager.listeners.append(self._on_account)
+
+    def _on_account(self, kind: str, value):
+        for channel in self._channels.values():
+            channel.send(kind, value=value)
+
+    async def _on_connect(self, reader, writer):
+        channel, index = Channel(reader, writer), None
+
+        async def handle(message: dict):
+            nonlocal index
+            match message['kind']:
+                case 'hello':
+                    index = message['worker']
+                    self._channels[index] = channel
+                    channel.send('account', balance=[{'a': asset, 'wb': value} for asset, value in
+                                                     account_manager.balances.items()],
+                                 usdt_block=account_manager.usdt_block)
+                    logger.info(f'Воркер {index} подключен')
+                case 'usdt_block':  # Разошлется всем воркерам через _on_account
+                    await account_manager.set_usdt_block(message['value'])
+
+        try:
+            await channel.run(handle)
+        finally:
+            if self._channels.get(index) is channel:
+                del self._channels[index]
+
+    async def command(self, worker: int, text: str):  # Ответы воркера на команду бота
+        if (channel := self._channels.get(worker)) is None:
+            return [f'Воркер {worker} не подключен']
+
+        try:
+            return (await channel.request('command', config.IPC_TIMEOUT, text=text))['answers']
+        except (TimeoutError, ConnectionError):
+            return [f'Воркер {worker} не ответил за {config.IPC_TIMEOUT} с']
+
+    async def _supervise(self, index: int):  # Процесс воркера; упал - перезапуск
+        await self._listening.wait()
+        while True:
+            process = get_context('spawn').Process(target=run_worker, args=(index, self.workers, self._port),
+                                                   name=f'worker{index}', daemon=True)
+            process.start()
+            await get_running_loop().run_in_executor(None, process.join)
+            logger.error(f'Воркер {index} завершился с кодом {process.exitcode}, перезапуск через '
+                         f'{config.WORKER_RESTART_DELAY} с')
+            await sleep(config.WORKER_RESTART_DELAY)
+
+    async def _measure_rtt(self):
+        while True:
+            await sleep(config.IPC_PING_INTERVAL)
+            for index, channel in list(self._channels.items()):
+                started = perf_counter()
+                try:
+                    await channel.request('ping', config.IPC_TIMEOUT)
+                except (TimeoutError, ConnectionError):
+                    logger.error(f'Воркер {index} не ответил на ping за {config.IPC_TIMEOUT} с')
+                    continue
+                self._rtt[index].observe((perf_counter() - started) * 1000)
+
+    async def run(self):
+        server = await start_server(self._on_connect, '127.0.0.1', 0, limit=STREAM_LIMIT)
+        self._port = server.sockets[0].getsockname()[1]
+        self._listening.set()
+        logger.info(f'Координатор: воркеров {self.workers}, порт IPC {self._port}')
+        async with server:
+            await gather(self._measure_rtt(), *(self._supervise(index) for index in range(self.workers)))
+
+
+class ShardForward(BaseMiddleware):  # Внутренний middleware роутера: после фильтров, вместо хэндлера координатора
+    def __init__(self, coordinator: Coordinator):
+        self.coordinator = coordinator
+
+    async def __call__(self, handler, event, data):
+        text = event.text or ''
+        if (symbol := command_symbol(text)) is not None:
+            answers = await self.coordinator.command(shard_of(symbol, self.coordinator.workers), text)
+        elif text in BROADCAST_COMMANDS:
+            await handler(event, data)
+            answers = []
+            for index, worker_answers in enumerate(await gather(
+                    *(self.coordinator.command(index, text) for index in range(self.coordinator.workers)))):
+                answers += [f'Воркер {index}:\n{answer}' for answer in worker_answers]
+        else:
+            return await handler(event, data)
+
+        for answer in answers:
+            await event.answer(answer)
+
+
+class WorkerMessage:  # Команда бота, пересланная координатором: ответы хэндлера копятся и уходят в reply
+    def __init__(self, text: str):
+        self.text = text
+        self.answers = []
+
+    async def answer(self, text, **_):
+        self.answers.append(str(text))
+
+
+async def _run_command(channel: Channel, request: dict, async_session, http_session: ClientSession):
+    message = WorkerMessage(request['text'])
+    try:
+        handler = next(handler for prefix, handler in WORKER_COMMANDS if message.text.startswith(prefix))
+        async with async_session() as session:
+            kwargs = {'session': session, 'http_session': http_session}
+            await handler(message, **{name: kwargs[name] for name in signature(handler).parameters if name in kwargs})
+    except Exception as e:
+        logger.exception(f'Ошибка команды {message.text}')
+        message.answers.append(f'Ошибка команды: {e}')
+    channel.reply(request, answers=message.answers)
+
+
+async def worker_main(index: int, workers: int, port: int):
+    engine = create_async_engine(config.DB_URL, echo=config.DB_ECHO)
+    async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    bingx_client.scale_rates(1 / workers)  # Лимиты биржи - на аккаунт, делим между воркерами
+
+    channel = Channel(*await open_connection('127.0.0.1', port, limit=STREAM_LIMIT))
+
+    def on_account(kind: str, value):  # Блок USDT - общий на аккаунт, ставит координатор; балансы приходят от него
+        if kind == 'usdt_block':
+            channel.send(kind, value=value)
+
+    account_manager.listeners.append(on_account)
+
+    connector = TCPConnector(limit=200, keepalive_timeout=30)
+    timeout = ClientTimeout(total=60, connect=10, sock_read=30)
+    async with ClientSession(headers=config.HEADERS, connector=connector, timeout=timeout) as http_session:
+        async def handle(message: dict):
+            match message['kind']:
+                case 'account':
+                    await account_manager.update_balance_batch(message['balance'])
+                    await account_manager.set_usdt_block(message['usdt_block'], notify=False)
+                case 'balance':
+                    await account_manager.update_balance_batch(message['value'])
+                case 'usdt_block':
+                    await account_manager.set_usdt_block(message['value'], notify=False)
+                case 'ping':
+                    channel.reply(message)
+                case 'command':
+                    create_task(_run_command(channel, message, async_session, http_session))
+
+        async with async_session() as session:
+            await load_from_db(session, so_manager, config_manager,
+                               owned=lambda symbol: shard_of(symbol, workers) == index)
+        await persist_queue.start(async_session, stride=workers, offset=index)
+        channel.send('hello', worker=index)
+
+        symbols = so_manager.symbols
+        active_symbols = [symbol for symbol in symbols if await so_manager.get_state(symbol) != 'stop']
+        kline_bootstrap.start(http_session, active_symbols)
+        await price_stream.start(http_session, active_symbols)
+        logger.info(f'Воркер {index}: символов {len(active_symbols)} из {len(symbols)}')
+
+        tasks = (
+            manage_symbol_meta(http_session),
+            loop_monitor.run(),
+            serve_metrics(config.METRICS_HOST, config.METRICS_PORT + 1 + index if config.METRICS_PORT else 0),
+            *(start_indicators(symbol, http_session=http_session) for symbol in symbols),
+            *(start_trading(symbol, http_session=http_session, async_session=async_session) for symbol in symbols),
+        )
+        background = [create_task(task) for task in tasks]
+        await channel.run(handle)  # До закрытия канала координатором
+        logger.error(f'Воркер {index}: канал с координатором закрыт, завершение')
+        for task in background:
+            task.cancel()
+        await persist_queue.flush()
+
+
+def run_worker(index: int, workers: int, port: int):  # Точка входа процесса воркера
+    log_listener = setup_logging(directory=path.join(config.LOG_DIR, f'worker{index}'))
+    try:
+        run(worker_main(index, workers, port))
+    finally:
+        log_listener.stop()
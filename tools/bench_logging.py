@@ -0,0 +1,67 @@
+# Время, которое вызов логгера отнимает у event loop: три FileHandler (как было в main.py) против
+# QueueHandler + поток QueueListener (common.logs). На итерацию - отчет ордера (большой многострочный текст)
+# и обновление счета: было INFO на каждое, стало DEBUG через log_sampler.
+# Запуск из корня проекта: python -m tools.bench_logging --n 20000
+from argparse import ArgumentParser
+from logging import DEBUG, INFO, ERROR, FileHandler, Formatter, getLogger
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+
+def _order_report(i: int):
+    data = {'code': 0, 'data': {'orderId': i, 'executedQty': '0.1', 'cummulativeQuoteQty': '10.0', 'status': 'FILLED'}}
+    return (f'\n              RSI_lot: 10\n              main_lot: 20\n              balance: 1000\n'
+            f'              Ордер открыт BTC  {str(data)}\n')
+
+
+def _run(logger, n: int, lazy: bool):
+    from common.logs import Lazy, Sampler
+
+    sampler = Sampler(10)
+
+    started = perf_counter()
+    for i in range(n):
+        if lazy:
+            logger.info('%s', Lazy(_order_report, i), extra={'symbol': 'BTC', 'order_id': i})
+            if (suppressed := sampler.take('account_upd_ws')) is not None:
+                logger.debug('Account_upd_ws: %s', i, extra={'suppressed': suppressed})
+        else:
+            logger.info(_order_report(i))
+            logger.info(f'Account_upd_ws: {i}')
+    return (perf_counter() - started) / n * 1e6
+
+
+def main():
+    parser = ArgumentParser(description='Цена вызова логгера в event loop')
+    parser.add_argument('--n', type=int, default=20000)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as log_dir:
+        logger = getLogger('bench_files')
+        logger.setLevel(DEBUG)
+        for name, level in (('debug', DEBUG), ('info', INFO), ('error', ERROR)):
+            handler = FileHandler(path.join(log_dir, f'files_{name}.log'), encoding='utf-8')
+            handler.setLevel(level)
+            handler.setFormatter(Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            logger.addHandler(handler)
+        files = _run(logger, args.n, lazy=False)
+
+        from common.logs import setup_logging
+
+        started = perf_counter()
+        listener = setup_logging('bench_queue', path.join(log_dir, 'queue'))
+        queued = _run(getLogger('bench_queue'), args.n, lazy=True)
+        listener.stop()
+        total = perf_counter() - started
+
+        with open(path.join(log_dir, 'queue', 'debug.log'), encoding='utf-8') as f:
+            debug_lines = sum(1 for line in f if 'Account_upd_ws' in line)
+
+        print(f'FileHandler x3: {files:.1f} мкс на итерацию в event loop\n'
+              f'QueueHandler: {queued:.1f} мкс на итерацию в event loop, вместе с потоком записи {total:.2f} с\n'
+              f'Account_upd_ws через log_sampler: записано {debug_lines} из {args.n}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Микробенчмарк накладных расходов одной итерации торговли на 100 символов:
+# старая схема (глобальный lock в каждом getter) / async-совместимость / синхронное чтение снимков.
+# Запуск из корня проекта: python -m tools.bench_managers
+from asyncio import Lock, run
+from datetime import datetime
+from time import perf_counter
+from types import SimpleNamespace
+
+from bingx_api.bingx_models import SymbolOrderManager, WebSocketPrice, ConfigManager, AccountManager
+
+SYMBOLS = [f'S{i}' for i in range(100)]
+ROUNDS = 200
+
+
+class LegacyManager:  # Как было до шардирования: один lock на все символы, каждый getter под lock
+    def __init__(self):
+        self._data = {symbol: {'price': (0, 1.0), 'state': 'track', 'b_s_trigger': 'buy', 'executed_qty': 1.0,
+                               'cost_with_fee': 1.0, 'target_grid_size': 0.01, 'last_order': {'price': 1.0}}
+                      for symbol in SYMBOLS}
+        self._lock = Lock()
+
+    async def get(self, symbol: str, key: str):
+        async with self._lock:
+            return self._data.get(symbol).get(key)
+
+
+async def _prepare():
+    so_manager, ws_price, config_manager = SymbolOrderManager(), WebSocketPrice(), ConfigManager()
+    account_manager = AccountManager()
+    await so_manager.add_symbols_and_orders(
+        [(SimpleNamespace(name=symbol, step_size=0.1, state='track', profit=0.0),
+          [(1, 1.0, 1.0, 1.0, 1.0, datetime.now())]) for symbol in SYMBOLS])
+    for symbol in SYMBOLS:
+        await so_manager.set_b_s_trigger(symbol, 'buy')
+        await ws_price.update_price(symbol, 0, 1.0)
+        await config_manager.set_data(symbol, 'target_grid_size', 0.01)
+    await account_manager.update_balance_batch([{'a': 'USDT', 'wb': '100'}])
+    return so_manager, ws_price, config_manager, account_manager
+
+
+async def _legacy(manager: LegacyManager):
+    for symbol in SYMBOLS:  # 8 обращений, как в старой итерации trading_logic
+        for key in ('price', 'executed_qty', 'cost_with_fee', 'state', 'b_s_trigger', 'last_order',
+                    'target_grid_size', 'state'):
+            await manager.get(symbol, key)
+
+
+async def _shim(so_manager, ws_price, config_manager, account_manager):
+    for symbol in SYMBOLS:
+        await ws_price.get_price(symbol)
+        await so_manager.get_summary(symbol, 'executed_qty')
+        await so_manager.get_summary(symbol, 'cost_with_fee')
+        await so_manager.get_state(symbol)
+        await so_manager.get_b_s_trigger(symbol)
+        await so_manager.get_last_order(symbol)
+        await config_manager.get_data(symbol, 'target_grid_size')
+        await account_manager.get_balance('USDT')
+
+
+async def _sync(so_manager, ws_price, config_manager, account_manager):
+    for symbol in SYMBOLS:
+        ws_price.price(symbol)
+        symbol_data = so_manager.get(symbol)
+        summary = symbol_data.summary
+        summary.executed_qty, summary.cost_with_fee, summary.last_price
+        symbol_data.state, symbol_data.b_s_trigger
+        config_manager.get(symbol, 'target_grid_size')
+        account_manager.balance('USDT')
+
+
+async def _measure(name: str, func, *args):
+    start = perf_counter()
+    for _ in range(ROUNDS):
+        await func(*args)
+    per_iteration = (perf_counter() - start) / ROUNDS / len(SYMBOLS) * 1e6
+    print(f'{name:<10} {per_iteration:8.2f} мкс на итерацию символа')
+
+
+async def main():
+    managers = await _prepare()
+    await _measure('legacy', _legacy, LegacyManager())
+    await _measure('async shim', _shim, *managers)
+    await _measure('sync', _sync, *managers)
+
+
+if __name__ == '__main__':
+    run(main())
@@ -0,0 +1,52 @@
+# Цена одного наблюдения метрик (common.metrics) против пустого цикла: счетчик, гистограмма, замер
+# perf_counter + observe, как в горячих путях, и захват свободного TimedLock против asyncio.Lock.
+# Запуск из корня проекта: python -m tools.bench_metrics --n 1000000
+from argparse import ArgumentParser
+from asyncio import Lock, run
+from time import perf_counter
+
+from common.metrics import Registry, TimedLock
+
+
+def _per_call_ns(func, n: int):
+    started = perf_counter()
+    for _ in range(n):
+        func()
+    return (perf_counter() - started) / n * 1e9
+
+
+async def _lock_ns(lock, n: int):
+    started = perf_counter()
+    for _ in range(n):
+        async with lock:
+            pass
+    return (perf_counter() - started) / n * 1e9
+
+
+def _timed(histogram):
+    started = perf_counter()
+    histogram.observe((perf_counter() - started) * 1000)
+
+
+def main():
+    parser = ArgumentParser(description='Цена наблюдения метрик')
+    parser.add_argument('--n', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    registry = Registry(enabled=True)
+    counter = registry.counter('bench_total')
+    histogram = registry.histogram('bench_ms')
+    empty = _per_call_ns(lambda: None, args.n)
+
+    print(f'пустой вызов: {empty:.0f} нс')
+    print(f'Counter.inc: +{_per_call_ns(counter.inc, args.n) - empty:.0f} нс')
+    print(f'Histogram.observe: +{_per_call_ns(lambda: histogram.observe(3.7), args.n) - empty:.0f} нс')
+    print(f'perf_counter x2 + observe: +{_per_call_ns(lambda: _timed(histogram), args.n) - empty:.0f} нс')
+
+    plain = run(_lock_ns(Lock(), args.n // 10))
+    timed = run(_lock_ns(TimedLock(histogram), args.n // 10))
+    print(f'свободный lock: asyncio.Lock {plain:.0f} нс, TimedLock {timed:.0f} нс')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# Память на 10k открытых ордеров: словари order.__dict__ из ORM (как было в load_from_db) против OrderStore.
+# Запуск из корня проекта: python -m tools.bench_order_memory
+from datetime import datetime, timedelta
+from time import perf_counter
+from tracemalloc import start, stop, take_snapshot
+
+from bingx_api.bingx_models import OrderStore
+from database.models import OrderInfo
+
+N = 10_000
+
+
+def _rows():
+    now = datetime.now()
+    return [(i, 100.0 - i * 0.001, 0.1, 10.0, 10.04, now + timedelta(minutes=i)) for i in range(N)]
+
+
+def _measure(name: str, build):
+    rows = _rows()
+    start()
+    before = take_snapshot()
+    data = build(rows)
+    size = sum(stat.size_diff for stat in take_snapshot().compare_to(before, 'filename'))
+    stop()
+    print(f'{name:<12} {size / 1024:9.1f} КБ на {N} ордеров, {size / N:6.1f} байт на ордер')
+    return data
+
+
+def _orm_dicts(rows):
+    keys = ('id', 'price', 'executed_qty', 'cost', 'cost_with_fee', 'open_time')
+    orders = [OrderInfo(**dict(zip(keys, row))) for row in rows]  # ORM-объекты держит сессия
+    return orders, [order.__dict__ for order in orders]
+
+
+def main():
+    _measure('ORM __dict__', _orm_dicts)
+    store = _measure('OrderStore', OrderStore)
+
+    t = perf_counter()
+    for _ in range(100):
+        store.profits(100.0)
+    print(f'profits по {N} ордерам: {(perf_counter() - t) / 100 * 1e6:.1f} мкс')
+
+
+if __name__ == '__main__':
+    main()
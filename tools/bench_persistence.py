@@ -0,0 +1,139 @@
+# Запись ордеров в БД: прямые commit на каждое событие (как было в place_*_order) против
+# отложенной записи PersistQueue. Меряется время, которое горячий путь торговли ждет БД, и число commit.
+# Запуск из корня проекта: python -m tools.bench_persistence --symbols 20 --buys 50
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import datetime
+from statistics import mean, quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import event, select, func, delete, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from database.models import Symbol, OrderInfo
+from database.orm_query import init_db
+from database.persistence import PersistQueue
+
+
+# Прежняя прямая запись, до PersistQueue
+async def _add_order(session: AsyncSession, symbol_name: str, data: dict):
+    db_symbol = (await session.execute(select(Symbol).where(Symbol.name == symbol_name))).scalar_one_or_none()
+    session.add(OrderInfo(**data, symbol=db_symbol))
+    await session.commit()
+
+
+async def _sell(session: AsyncSession, symbol_name: str, profit_diff: float):
+    await session.execute(update(Symbol).where(Symbol.name == symbol_name).values(profit=Symbol.profit + profit_diff))
+    await session.execute(delete(OrderInfo).where(OrderInfo.symbol.has(name=symbol_name)))
+    await session.commit()
+
+
+def _order(i: int):
+    return {'price': 100.0 + i, 'executed_qty': 0.1, 'cost': 10.0 + i, 'cost_with_fee': 10.04 + i,
+            'open_time': datetime.now()}
+
+
+def _ms(values: list):
+    p99 = quantiles(values, n=100)[98] if len(values) > 1 else values[0]
+    return f'mean {mean(values) * 1e3:.3f} мс, p99 {p99 * 1e3:.3f} мс'
+
+
+async def _engine(db_dir: str, name: str, symbols: list):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{db_dir}/{name}.db')
+    commits = [0]
+    event.listen(engine.sync_engine, 'commit', lambda _: commits.__setitem__(0, commits[0] + 1))
+
+    await init_db(engine, drop_all=True)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    async with session_maker() as session:
+        session.add_all([Symbol(name=symbol, step_size=0.0001, state='track', profit=0.0) for symbol in symbols])
+        await session.commit()
+
+    commits[0] = 0
+    return engine, session_maker, commits
+
+
+async def _check(session_maker, expected_orders: int, expected_profit: float):
+    async with session_maker() as session:
+        orders = (await session.execute(select(func.count(OrderInfo.id)))).scalar()
+        profit = (await session.execute(select(func.sum(Symbol.profit)))).scalar()
+    return orders == expected_orders and abs(profit - expected_profit) < 1e-6
+
+
+async def bench_direct(db_dir: str, symbols: list, buys: int):
+    engine, session_maker, commits = await _engine(db_dir, 'direct', symbols)
+    buy_times, sell_times = [], []
+    started = perf_counter()
+
+    async with session_maker() as session:
+        for i in range(buys):
+            for symbol in symbols:
+                t = perf_counter()
+                await _add_order(session, symbol, _order(i))
+                buy_times.append(perf_counter() - t)
+
+        for symbol in symbols[::2]:  # Половину символов продаем целиком
+            t = perf_counter()
+            await _sell(session, symbol, 1.0)
+            sell_times.append(perf_counter() - t)
+
+    total = perf_counter() - started
+    ok = await _check(session_maker, buys * (len(symbols) - len(symbols[::2])), len(symbols[::2]))
+    await engine.dispose()
+    return total, buy_times, sell_times, commits[0], ok
+
+
+async def bench_queue(db_dir: str, symbols: list, buys: int, interval_ms: float, batch_size: int):
+    engine, session_maker, commits = await _engine(db_dir, 'queue', symbols)
+    queue = PersistQueue(interval_ms, batch_size)
+    await queue.start(session_maker)
+    buy_times, sell_times = [], []
+    started = perf_counter()
+
+    for i in range(buys):
+        for symbol in symbols:
+            t = perf_counter()
+            queue.add_order(symbol, _order(i))
+            buy_times.append(perf_counter() - t)
+
+    for symbol in symbols[::2]:
+        t = perf_counter()
+        queue.update_profit(symbol, 1.0)
+        queue.del_orders(symbol)
+        await queue.flush()
+        sell_times.append(perf_counter() - t)
+
+    await queue.flush()
+    total = perf_counter() - started
+    ok = await _check(session_maker, buys * (len(symbols) - len(symbols[::2])), len(symbols[::2]))
+    await engine.dispose()
+    return total, buy_times, sell_times, commits[0], ok
+
+
+def _report(name: str, result: tuple):
+    total, buy_times, sell_times, commits, ok = result
+    print(f'{name}: всего {total:.2f} с, commit {commits}, данные {"сходятся" if ok else "НЕ сходятся"}\n'
+          f'  покупка ждет БД: {_ms(buy_times)}\n  продажа ждет БД: {_ms(sell_times)}')
+
+
+async def _main(symbols: int, buys: int, interval_ms: float, batch_size: int):
+    names = [f'S{i}' for i in range(symbols)]
+    with TemporaryDirectory() as db_dir:
+        _report('commit на каждое событие', await bench_direct(db_dir, names, buys))
+        _report(f'PersistQueue ({interval_ms} мс / {batch_size})',
+                await bench_queue(db_dir, names, buys, interval_ms, batch_size))
+
+
+def main():
+    parser = ArgumentParser(description='Прямые commit против отложенной записи ордеров')
+    parser.add_argument('--symbols', type=int, default=20)
+    parser.add_argument('--buys', type=int, default=50, help='покупок на символ')
+    parser.add_argument('--interval-ms', type=float, default=50)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+    run(_main(args.symbols, args.buys, args.interval_ms, args.batch_size))
+
+
+if __name__ == '__main__':
+    main()
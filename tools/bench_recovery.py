@@ -0,0 +1,133 @@
+# Старт из БД (load_from_db) против теплого старта (снимок + журнал). Проверяет, что состояние в памяти
+# совпадает, и что фоновая сверка с БД видит изменения, записанные в обход журнала, и поправляет состояние в памяти.
+# Запуск из корня проекта: python -m tools.bench_recovery --symbols 50 --orders 200
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from bingx_api.bingx_models import SymbolOrderManager, ConfigManager
+from database.models import Symbol, OrderInfo, SymbolConfig
+from database.orm_query import init_db, load_from_db
+from database.persistence import PersistQueue
+from database.recovery import Recovery
+
+
+async def _fill(session_maker, symbols: list, orders: int):
+    async with session_maker() as session:
+        session.add_all([Symbol(name=symbol, step_size=0.0001, state='track', profit=1.5) for symbol in symbols])
+        session.add_all([SymbolConfig(symbol_name=symbol, grid_size=0.01) for symbol in symbols])
+        await session.flush()
+        ids = {symbol.name: symbol.id for symbol in (await session.execute(Symbol.__table__.select())).all()}
+        session.add_all([OrderInfo(symbol_id=ids[symbol], price=100.0 + i, executed_qty=0.1, cost=10.0,
+                                   cost_with_fee=10.01, open_time=datetime(2025, 1, 1, 0, i % 60))
+                         for symbol in symbols for i in range(orders)])
+        await session.commit()
+
+
+async def _dump(so_manager: SymbolOrderManager, config_manager: ConfigManager):
+    state = {}
+    for symbol in so_manager.symbols:
+        orders = await so_manager.get_orders(symbol)
+        state[symbol] = (await so_manager.get_state(symbol), await so_manager.get_profit(symbol),
+                         [tuple(order.values()) for order in orders], config_manager.get(symbol, 'grid_size'))
+    return state
+
+
+async def _load(session_maker=None, recovery: Recovery = None):
+    so_manager, config_manager = SymbolOrderManager(), ConfigManager()
+    started = perf_counter()
+    if recovery is not None:
+        await recovery.load_into(so_manager, config_manager)
+    else:
+        async with session_maker() as session:
+            await load_from_db(session, so_manager, config_manager)
+    return perf_counter() - started, so_manager, config_manager
+
+
+async def _start(recovery: Recovery = None, session_maker=None):
+    elapsed, so_manager, config_manager = await _load(session_maker, recovery)
+    return elapsed, await _dump(so_manager, config_manager)
+
+
+async def _on_state(symbol: str, state_old: str, state_new: str):  # Задач символов в замере нет
+    pass
+
+
+async def _main(symbols: int, orders: int):
+    names = [f'S{i}' for i in range(symbols)]
+    with TemporaryDirectory() as tmp:
+        engine = create_async_engine(f'sqlite+aiosqlite:///{tmp}/state.db')
+        await init_db(engine, drop_all=True)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        await _fill(session_maker, names, orders)
+
+        recovery = Recovery(f'{tmp}/state')
+        queue = PersistQueue(10, 100)
+        await queue.start(session_maker)
+        _, so_manager, config_manager = await _load(session_maker)
+        recovery.capture(so_manager, config_manager, queue.symbol_ids)
+        started = perf_counter()
+        await recovery.save(queue)
+        save_time = perf_counter() - started
+        queue.journal = recovery.journal
+
+        # Изменения после снимка: покупки, продажа, смена статуса - попадают в журнал
+        for symbol in names[:10]:
+            queue.add_order(symbol, {'price': 1.0, 'executed_qty': 1.0, 'cost': 1.0, 'cost_with_fee': 1.0,
+                                     'open_time': datetime(2025, 1, 2)})
+        queue.update_profit(names[-1], 2.5)
+        queue.del_orders(names[-1])
+        await queue.flush()
+        async with session_maker() as session:
+            await session.execute(update(Symbol).where(Symbol.name == names[0]).values(state='pause'))
+            await session.commit()
+        await queue.note('state', names[0], 'pause')
+
+        cold_time, cold = await _start(session_maker=session_maker)
+        warm_time, warm = await _start(Recovery(f'{tmp}/state'))
+        print(f'символов {symbols}, ордеров {symbols * orders}, записей журнала {recovery.journal.records}\n'
+              f'  load_from_db: {cold_time * 1000:.1f} мс\n  снимок + журнал: {warm_time * 1000:.1f} мс\n'
+              f'  запись снимка из памяти: {save_time * 1000:.1f} мс\n'
+              f'  состояние {"совпадает" if cold == warm else "НЕ совпадает"}')
+
+        await recovery.save(queue)  # Журнал свернут в снимок из State в памяти, без чтения БД
+        _, compacted = await _start(Recovery(f'{tmp}/state'))
+        print(f'  снимок после свертки журнала {"совпадает" if compacted == cold else "НЕ совпадает"} с БД')
+
+        async with session_maker() as session:  # Изменения в обход журнала - сверка должна их найти
+            await session.execute(update(Symbol).where(Symbol.name == names[1]).values(profit=0.0))
+            await session.execute(delete(OrderInfo).where(OrderInfo.id == select(func.min(OrderInfo.id))
+                                                          .where(OrderInfo.symbol_id == queue.symbol_ids[names[2]])
+                                                          .scalar_subquery()))
+            await session.commit()
+        _, so_manager, config_manager = await _load(recovery=(stale := Recovery(f'{tmp}/state')))
+        started = perf_counter()
+        mismatched = await stale.check(session_maker, queue, so_manager, config_manager, _on_state)
+        check_time = perf_counter() - started
+        _, db_state = await _start(session_maker=session_maker)
+        corrected = await _dump(so_manager, config_manager)
+        print(f'  фоновая сверка {check_time * 1000:.1f} мс, расходятся {sorted(mismatched)}, состояние в памяти '
+              f'после поправки {"совпадает" if corrected == db_state else "НЕ совпадает"} с БД')
+
+        _, rebuilt = await _start(Recovery(f'{tmp}/state'))
+        print(f'  после сверки снимок {"совпадает" if rebuilt == db_state else "НЕ совпадает"} с БД')
+        await engine.dispose()
+        return cold == warm == compacted and mismatched == set(names[1:3]) and corrected == db_state == rebuilt
+
+
+def main():
+    parser = ArgumentParser(description='Старт из БД против снимка + журнала')
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--orders', type=int, default=200, help='ордеров на символ')
+    args = parser.parse_args()
+    if not run(_main(args.symbols, args.orders)):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# Сообщений websocket в секунду на одно ядро: прежний разбор (gzip.decompress + .decode() + json.loads,
+# Ping и подтверждения доходят до ошибки) против bingx_api.ws_decode. Поток - как у price_upd_ws:
+# в основном lastPrice, немного подтверждений подписки и Ping.
+# Запуск из корня проекта: python -m tools.bench_ws_decode --messages 200000
+from argparse import ArgumentParser
+from gzip import compress, decompress
+from json import dumps, loads
+from random import Random
+from time import perf_counter
+
+from bingx_api.ws_decode import decode_message, json_loads, PING
+
+
+def _frames(count: int, seed: int):
+    rng = Random(seed)
+    frames = []
+    for i in range(count):
+        if i % 200 == 0:
+            frames.append(compress(b'Ping', mtime=0))
+        elif i % 97 == 0:
+            frames.append(compress(dumps({'id': str(i), 'code': 0, 'msg': 'SUCCESS', 'dataType': ''}).encode()))
+        else:
+            symbol = f'S{rng.randrange(50)}'
+            frames.append(compress(dumps({
+                'code': 0, 'timestamp': 1792304842359 + i, 'dataType': f'{symbol}-USDT@lastPrice',
+                'data': {'e': 'lastPriceUpdate', 'E': 1792304842359 + i, 's': f'{symbol}-USDT',
+                         'c': f'{100 + rng.random():.6f}'}}).encode()))
+    return frames
+
+
+def _old(frames: list):
+    prices = errors = 0
+    for raw in frames:
+        try:
+            if 'data' in (data := loads(decompress(raw).decode())):
+                symbol, _ = data['dataType'].split('-USDT@', 1)
+                float(data['data']['c'])
+                prices += 1
+        except Exception:
+            errors += 1
+    return prices, errors, 0
+
+
+def _new(frames: list):
+    prices = errors = pings = 0
+    for raw in frames:
+        try:
+            if (data := decode_message(raw)) is PING:
+                pings += 1
+            elif payload := data.get('data'):
+                symbol, _ = data['dataType'].split('-USDT@', 1)
+                float(payload['c'])
+                prices += 1
+        except Exception:
+            errors += 1
+    return prices, errors, pings
+
+
+def main():
+    parser = ArgumentParser(description='Разбор сообщений websocket: прежний против ws_decode')
+    parser.add_argument('--messages', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    frames = _frames(args.messages, args.seed)
+    print(f'JSON: {json_loads.__module__}')
+    for name, func in (('gzip + json.loads', _old), ('ws_decode', _new)):
+        started = perf_counter()
+        prices, errors, pings = func(frames)
+        elapsed = perf_counter() - started
+        print(f'{name}: {len(frames) / elapsed:,.0f} сообщ/с, цен {prices}, ошибок {errors}, Ping {pings}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# Проверка BingXClient против tools.mock_bingx: подпись, склейка одинаковых GET, повторы после 429/5xx,
+# без повторов для POST, соблюдение лимита группы, гистограммы задержек.
+# Запуск из корня проекта: python -m tools.check_client
+from argparse import ArgumentParser
+from asyncio import run, gather
+from time import monotonic
+
+from aiohttp import ClientSession
+
+from bingx_api.bingx_client import BingXClient
+from tools.mock_bingx import MockBingX, synthetic_path
+
+SYMBOLS_PATH = '/openApi/spot/v1/common/symbols'
+KLINE_PATH = '/openApi/spot/v2/market/kline'
+ORDER_PATH = '/openApi/spot/v1/trade/order'
+
+
+def _check(name: str, ok: bool, details: str = ''):
+    print(f'{"OK  " if ok else "FAIL"} {name} {details}')
+    return ok
+
+
+async def run_checks(port: int):
+    mock = MockBingX({'BTC': synthetic_path(100.0, 10)})
+    await mock.start(port=port)
+    base_url = f'http://127.0.0.1:{port}'
+    results = []
+
+    def client(rates: dict = None, secret_key: str = 'mock'):
+        return BingXClient(base_url, secret_key, rates or {'market': (1000, 1000), 'trade': (1000, 1000)},
+                           retries=3, backoff=0.01)
+
+    async with ClientSession(headers={'X-BX-APIKEY': 'mock'}) as session:
+        data, _ = await client(secret_key='wrong').request('GET', session, SYMBOLS_PATH, {'symbol': 'BTC-USDT'})
+        results.append(_check('неверная подпись отклоняется', data is None))
+
+        rest = client()
+        data, _ = await rest.request('GET', session, SYMBOLS_PATH, {'symbol': 'BTC-USDT'})
+        results.append(_check('подпись принимается', bool(data and data['data']['symbols'])))
+
+        mock.requests.clear()
+        mock.delays[SYMBOLS_PATH] = 0.1
+        answers = await gather(*(rest.request('GET', session, SYMBOLS_PATH, {'symbol': 'BTC-USDT'}) for _ in range(20)))
+        mock.delays.clear()
+        results.append(_check('склейка одинаковых GET', mock.requests[SYMBOLS_PATH] == 1 and all(
+            data == answers[0][0] for data, _ in answers), f'запросов {mock.requests[SYMBOLS_PATH]} на 20 вызовов'))
+
+        mock.requests.clear()
+        mock.faults[KLINE_PATH] = [503, 429]
+        data, _ = await rest.request('GET', session, KLINE_PATH, {'symbol': 'BTC-USDT', 'interval': '1m', 'limit': 5})
+        results.append(_check('повтор GET после 503 и 429', bool(data and data['data']),
+                              f'запросов {mock.requests[KLINE_PATH]}'))
+
+        mock.requests.clear()
+        mock.faults[ORDER_PATH] = [503]
+        data, text = await rest.request('POST', session, ORDER_PATH,
+                                        {'symbol': 'BTC-USDT', 'type': 'MARKET', 'side': 'BUY', 'quantity': 0.1})
+        results.append(_check('POST не повторяется', data is None and mock.requests[ORDER_PATH] == 1, text))
+
+        limited = client({'market': (20, 1)})
+        started = monotonic()
+        await gather(*(limited.request('GET', session, KLINE_PATH, {'symbol': 'BTC-USDT', 'interval': '1m', 'limit': i})
+                       for i in range(1, 11)))
+        elapsed = monotonic() - started
+        results.append(_check('лимит группы 20/с', elapsed >= 9 / 20 * 0.9, f'10 запросов за {elapsed:.2f} с'))
+
+        results.append(_check('гистограммы задержек', all(h.count for h in rest.latency.values())))
+        print(rest.latency_report())
+
+    await mock.stop()
+    return all(results)
+
+
+def main():
+    parser = ArgumentParser(description='Проверка BingXClient на моке BingX')
+    parser.add_argument('--port', type=int, default=8901)
+    args = parser.parse_args()
+
+    if not run(run_checks(args.port)):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
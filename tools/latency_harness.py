@@ -0,0 +1,109 @@
+# Сквозной прогон бота против tools.mock_bingx: задержка от отправки тика до прихода ордера на "биржу".
+# Запуск из корня проекта: python -m tools.latency_harness --symbols 20 --steps 600
+# Телеграм-бот не запускается, БД - временный sqlite. Триггер MACD принудительно ставится в 'buy',
+# чтобы сетка покупала без ожидания минутных свечей.
+from argparse import ArgumentParser
+from logging import basicConfig, getLogger
+from asyncio import run, gather, create_task, wait_for, TimeoutError as AsyncTimeoutError
+from os import environ
+from statistics import quantiles, mean
+from tempfile import TemporaryDirectory
+
+from tools.mock_bingx import MockBingX, synthetic_path, load_path
+
+
+def _report(latencies: list, orders: list):
+    print(f'Ордеров: {len(orders)} (BUY {sum(o["side"] == "BUY" for o in orders)}, '
+          f'SELL {sum(o["side"] == "SELL" for o in orders)})')
+    if len(latencies) < 2:
+        print('Недостаточно ордеров для статистики задержки')
+        return
+
+    p50, p90, p99 = (quantiles(latencies, n=100)[i] for i in (49, 89, 98))
+    print(f'Тик -> ордер, мс: mean {mean(latencies) * 1e3:.2f}  p50 {p50 * 1e3:.2f}  p90 {p90 * 1e3:.2f}  '
+          f'p99 {p99 * 1e3:.2f}  max {max(latencies) * 1e3:.2f}')
+
+
+async def run_harness(symbols: list, paths: dict, tick_interval: float, port: int, db_dir: str):
+    # Конфиг бота читается при импорте, поэтому окружение задаем до импорта модулей бота
+    environ.update(BASE_URL=f'http://127.0.0.1:{port}', URL_WS=f'ws://127.0.0.1:{port}/market',
+                   SECRET_KEY='mock', API_KEY='mock', DB_URL=f'sqlite+aiosqlite:///{db_dir}/harness.db',
+                   CANDLES_DIR=environ.get('CANDLES_DIR', f'{db_dir}/candles'))
+
+    from aiohttp import ClientSession
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+    from common.config import config
+    from database.models import Symbol, SymbolConfig
+    from database.orm_query import init_db, load_from_db
+    from database.persistence import persist_queue
+    from bingx_api.bingx_command import price_stream, manage_listen_key, account_upd_ws, start_trading, \
+        so_manager, config_manager, manage_symbol_meta
+    from indicators.bootstrap import kline_bootstrap
+    from indicators.indicator_models import start_indicators
+    from common.metrics import metrics
+
+    mock = MockBingX(paths, tick_interval=tick_interval)
+    await mock.start(port=port)
+
+    engine = create_async_engine(config.DB_URL)
+    async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    await init_db(engine, drop_all=True)
+    async with async_session() as session:
+        session.add_all([Symbol(name=symbol, step_size=mock.step_size, state='track', profit=0.0) for symbol in symbols])
+        session.add_all([SymbolConfig(symbol_name=symbol, grid_size=0.002) for symbol in symbols])
+        await session.commit()
+        await load_from_db(session, so_manager, config_manager)
+    await persist_queue.start(async_session)
+
+    for symbol in symbols:
+        await so_manager.set_b_s_trigger(symbol, 'buy')
+
+    async with ClientSession(headers=config.HEADERS) as http_session:
+        background = [create_task(manage_listen_key(http_session)), create_task(account_upd_ws(http_session)),
+                      create_task(manage_symbol_meta(http_session))]
+        kline_bootstrap.start(http_session, symbols)
+        await price_stream.start(http_session, symbols)
+        await gather(*(start_indicators(symbol, http_session=http_session) for symbol in symbols),
+                     *(start_trading(symbol, http_session=http_session, async_session=async_session)
+                       for symbol in symbols))
+
+        try:
+            await wait_for(mock.play(), timeout=len(max(paths.values(), key=len)) * tick_interval * 3 + 30)
+        except AsyncTimeoutError:
+            print('Прогон не уложился по времени, результаты неполные')
+
+        for task in background:
+            task.cancel()
+
+    _report(mock.latencies, mock.orders)
+    print(f'Pong на Ping: {mock.pongs}')
+    print(f'\nМетрики бота:\n{metrics.report()}')
+    await mock.stop()
+    await engine.dispose()
+
+
+def main():
+    parser = ArgumentParser(description='Сквозной замер задержки тик -> ордер на моке BingX')
+    parser.add_argument('--symbols', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=600)
+    parser.add_argument('--interval', type=float, default=0.05)
+    parser.add_argument('--csv', help='записанный путь цен для всех символов')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--log-level', default='WARNING', help='уровень логов бота в stderr')
+    args = parser.parse_args()
+
+    basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+    getLogger('my_app').setLevel(args.log_level)
+
+    symbols = [f'S{i}' for i in range(args.symbols)]
+    paths = {symbol: load_path(args.csv) if args.csv else synthetic_path(100.0, args.steps, 0.003, args.seed + i)
+             for i, symbol in enumerate(symbols)}
+
+    with TemporaryDirectory() as db_dir:
+        run(run_harness(symbols, paths, args.interval, args.port, db_dir))
+
+
+if __name__ == '__main__':
+    main()
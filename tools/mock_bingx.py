@@ -0,0 +1,290 @@
+# Локальная замена BingX для офлайн-прогонов: REST (kline, order, symbols, userDataStream) с проверкой подписи,
+# счетчиками запросов и внедрением ошибок (faults/delays),
+# и websocket с gzip-сообщениями lastPrice, kline и ACCOUNT_UPDATE. Цены идут по заданному пути (запись или синтетика),
+# одинаковый seed дает одинаковый прогон.
+# Запуск отдельно: python -m tools.mock_bingx --symbols BTC ETH --port 8900
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+from asyncio import sleep, gather, run, Event
+from csv import DictReader
+from gzip import compress
+from hashlib import sha256
+from hmac import new as hmac_new
+from json import dumps, loads
+from random import Random
+from time import time, perf_counter
+from zlib import crc32
+
+from aiohttp import web, WSMsgType
+
+WS_INTERVAL_MS = {'1min': 60_000, '5min': 300_000, '15min': 900_000, '60min': 3_600_000, '4hour': 14_400_000,
+                  '1day': 86_400_000}
+INTERVAL_MS = {'1m': 60_000, '5m': 300_000, '15m': 900_000, '1h': 3_600_000, '4h': 14_400_000, '1d': 86_400_000}
+
+
+def synthetic_path(start: float, steps: int, volatility: float = 0.002, seed: int = 0):
+    rnd = Random(seed)
+    path = [start]
+    for _ in range(steps - 1):
+        path.append(path[-1] * (1 + rnd.gauss(0, volatility)))
+    return path
+
+
+def load_path(file: str, column: str = 'close'):  # CSV с колонкой close или по одной цене на строку
+    with open(file, encoding='utf-8') as f:
+        first = f.readline()
+        f.seek(0)
+        if column in first:
+            return [float(row[column]) for row in DictReader(f)]
+        return [float(line) for line in f if line.strip()]
+
+
+def _gzip(data) -> bytes:
+    return compress((data if isinstance(data, str) else dumps(data)).encode(), mtime=0)
+
+
+class MockBingX:
+    def __init__(self, paths: dict, tick_interval: float = 0.1, balance: float = 1000.0, step_size: float = 0.0001,
+                 seed: int = 0, secret_key: str = 'mock'):
+        self.paths = paths  # {symbol: [price, ...]}
+        self.prices = {symbol: path[0] for symbol, path in paths.items()}
+        self.tick_interval = tick_interval
+        self.step_size = step_size
+        self.seed = seed
+        self.balance = {'USDT': balance}
+        self.listen_key = 'mock-listen-key'
+        self.secret_key = secret_key
+        self.min_notional = 1.0
+
+        self.requests = Counter()  # path: число REST-запросов
+        self.faults = defaultdict(list)  # path: HTTP-статусы, которые вернуть следующим запросам вместо ответа
+        self.delays = {}  # path: задержка ответа, сек
+        self.pongs = 0  # Ответов Pong на Ping
+
+        self.orders = []  # Принятые ордера
+        self.latencies = []  # Время от отправки последнего тика символа до прихода ордера, сек
+        self.finished = Event()  # Путь цен проигран до конца
+
+        self._last_tick = {}  # symbol: perf_counter() отправки последнего тика
+        self._price_ws = {}  # ws: set(dataType)
+        self._bars = {}  # dataType kline: [open_time, open, high, low, close, volume] текущего бара
+        self._account_ws = set()
+        self._order_id = 0
+        self._runner = None
+
+        self.app = web.Application(middlewares=[self._rest_middleware])
+        self.app.add_routes([
+            web.get('/openApi/spot/v2/market/kline', self._kline),
+            web.post('/openApi/spot/v1/trade/order', self._order),
+            web.get('/openApi/spot/v1/common/symbols', self._symbols),
+            web.post('/openApi/user/auth/userDataStream', self._listen_key),
+            web.put('/openApi/user/auth/userDataStream', self._listen_key),
+            web.get('/market', self._ws),
+        ])
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8900):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        for ws in (*self._price_ws, *self._account_ws):
+            await ws.close()
+        await self._runner.cleanup()
+
+    # ------------------------------------------------------------------ REST
+    @web.middleware
+    async def _rest_middleware(self, request: web.Request, handler):
+        if request.path == '/market':
+            return await handler(request)
+
+        self.requests[request.path] += 1
+        if delay := self.delays.get(request.path):
+            await sleep(delay)
+        if faults := self.faults.get(request.path):
+            status = faults.pop(0)
+            headers = {'Retry-After': '0.2'} if status == 429 else None
+            return web.json_response({'code': status, 'msg': 'injected fault'}, status=status, headers=headers)
+
+        return await handler(request)
+
+    def _check_auth(self, request: web.Request):
+        params_str, _, signature = request.query_string.partition('&signature=')
+        expected = hmac_new(self.secret_key.encode(), params_str.encode(), sha256).hexdigest()
+        if 'X-BX-APIKEY' not in request.headers or signature != expected:
+            raise web.HTTPUnauthorized(text=dumps({'code': 100001, 'msg': 'signature verification failed'}))
+
+    @staticmethod
+    def _symbol(request: web.Request):
+        return request.query.get('symbol', '').removesuffix('-USDT')
+
+    async def _kline(self, request: web.Request):
+        self._check_auth(request)
+        if (symbol := self._symbol(request)) not in self.paths:
+            return web.json_response({'code': 100204, 'msg': 'symbol not exist', 'data': []})
+
+        interval, limit = request.query['interval'], int(request.query.get('limit', 500))
+        step = INTERVAL_MS[interval]
+        # История назад во времени от текущей цены (синтетика с seed символа), новые свечи первыми, как на бирже
+        closes = synthetic_path(self.prices[symbol], limit + 1, 0.002 * (step / 60_000) ** 0.5,
+                                self.seed + crc32(f'{symbol}{interval}'.encode()))
+        open_time = int(time() * 1000) // step * step
+        data = [[open_time - i * step, closes[i + 1], max(closes[i], closes[i + 1]), min(closes[i], closes[i + 1]),
+                 closes[i], 1.0, open_time - i * step + step - 1, closes[i]] for i in range(limit)]
+
+        return web.json_response({'code': 0, 'timestamp': int(time() * 1000), 'data': data})
+
+    async def _symbols(self, request: web.Request):
+        self._check_auth(request)
+        symbols = [self._symbol(request)] if 'symbol' in request.query else list(self.paths)
+        data = [{'symbol': f'{symbol}-USDT', 'minQty': self.step_size, 'maxQty': 1e9, 'minNotional': self.min_notional,
+                 'maxNotional': 1e9, 'status': 1, 'tickSize': 0.0001, 'stepSize': self.step_size}
+                for symbol in symbols if symbol in self.paths]
+        return web.json_response({'code': 0, 'msg': '', 'data': {'symbols': data}})
+
+    async def _listen_key(self, request: web.Request):
+        self._check_auth(request)
+        return web.json_response({'listenKey': self.listen_key} if request.method == 'POST' else {})
+
+    async def _order(self, request: web.Request):
+        received = perf_counter()
+        self._check_auth(request)
+        symbol, side, qty = self._symbol(request), request.query['side'], float(request.query['quantity'])
+        if symbol in self._last_tick:
+            self.latencies.append(received - self._last_tick[symbol])
+
+        price = self.prices[symbol]
+        quote = qty * price
+        if quote < self.min_notional:
+            return web.json_response({'code': 100400, 'msg': f'minNotional {self.min_notional}', 'data': {}})
+        if side == 'BUY' and quote > self.balance['USDT']:
+            return web.json_response({'code': 100202, 'msg': 'Insufficient balance', 'data': {}})
+        if side == 'SELL' and qty > self.balance.get(symbol, 0.0) + 1e-12:
+            return web.json_response({'code': 100202, 'msg': 'Insufficient balance', 'data': {}})
+
+        sign = 1 if side == 'BUY' else -1
+        self.balance['USDT'] -= sign * quote
+        self.balance[symbol] = self.balance.get(symbol, 0.0) + sign * qty
+        self._order_id += 1
+
+        order = {'symbol': f'{symbol}-USDT', 'orderId': self._order_id, 'transactTime': int(time() * 1000),
+                 'price': str(price), 'origQty': str(qty), 'executedQty': str(qty), 'cummulativeQuoteQty': str(quote),
+                 'status': 'FILLED', 'type': 'MARKET', 'side': side}
+        self.orders.append(order)
+        await self._push_account()
+        return web.json_response({'code': 0, 'msg': '', 'data': order})
+
+    # ------------------------------------------------------------------ WebSocket
+    async def _ws(self, request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        if is_account := 'listenKey' in request.query:
+            self._account_ws.add(ws)
+        else:
+            self._price_ws[ws] = set()
+
+        try:
+            async for message in ws:
+                if message.type == WSMsgType.TEXT and message.data == 'Pong':
+                    self.pongs += 1
+                if message.type != WSMsgType.TEXT or message.data == 'Pong':
+                    continue
+
+                req = loads(message.data)
+                channels = self._price_ws.get(ws, set())
+                if req.get('reqType') == 'sub':
+                    channels.add(req['dataType'])
+                elif req.get('reqType') == 'unsub':
+                    channels.discard(req['dataType'])
+                await ws.send_bytes(_gzip({'id': req.get('id'), 'code': 0, 'msg': 'SUCCESS',
+                                           'dataType': req.get('dataType', '')}))
+
+                if is_account:
+                    await self._push_account()
+        finally:
+            self._price_ws.pop(ws, None)
+            self._account_ws.discard(ws)
+
+        return ws
+
+    async def _push_account(self):
+        message = _gzip({'e': 'ACCOUNT_UPDATE', 'E': int(time() * 1000),
+                         'a': {'m': 'ORDER', 'B': [{'a': asset, 'wb': str(value), 'cw': str(value), 'bc': '0'}
+                                                   for asset, value in self.balance.items()]}})
+        for ws in list(self._account_ws):
+            if not ws.closed:
+                await ws.send_bytes(message)
+
+    async def _push_price(self, symbol: str, price: float):
+        data_type = f'{symbol}-USDT@lastPrice'
+        message = _gzip({'code': 0, 'dataType': data_type,
+                         'data': {'e': 'lastPriceUpdate', 'E': int(time() * 1000), 's': f'{symbol}-USDT',
+                                  'c': str(price)}})
+        sends = [ws.send_bytes(message) for ws, channels in self._price_ws.items()
+                 if data_type in channels and not ws.closed]
+        sends += self._kline_sends(symbol, price)
+        self._last_tick[symbol] = perf_counter()
+        await gather(*sends)
+
+    def _kline_sends(self, symbol: str, price: float):  # Текущий бар каналов kline_*, как присылает биржа
+        now, sends = int(time() * 1000), []
+        for name, step in WS_INTERVAL_MS.items():
+            data_type = f'{symbol}-USDT@kline_{name}'
+            if not (subscribers := [ws for ws, channels in self._price_ws.items()
+                                    if data_type in channels and not ws.closed]):
+                continue
+
+            open_time = now - now % step
+            if (bar := self._bars.get(data_type)) is None or bar[0] != open_time:
+                bar = self._bars[data_type] = [open_time, price, price, price, price, 0.0]
+            bar[2], bar[3], bar[4], bar[5] = max(bar[2], price), min(bar[3], price), price, bar[5] + 1.0
+
+            message = _gzip({'code': 0, 'dataType': data_type,
+                             'data': {'e': 'kline', 'E': now, 's': f'{symbol}-USDT',
+                                      'K': {'t': open_time, 'T': open_time + step - 1, 'i': name, 'o': str(bar[1]),
+                                            'h': str(bar[2]), 'l': str(bar[3]), 'c': str(bar[4]),
+                                            'v': str(bar[5])}}})
+            sends += [ws.send_bytes(message) for ws in subscribers]
+
+        return sends
+
+    async def play(self):  # Проигрываем пути цен по всем символам, по тику на символ за tick_interval
+        ping, ping_every = 0, max(1, int(5 / self.tick_interval))
+        for step in range(max(map(len, self.paths.values()))):
+            for symbol, path in self.paths.items():
+                if step < len(path):
+                    self.prices[symbol] = path[step]
+                    await self._push_price(symbol, path[step])
+
+            if (ping := ping + 1) % ping_every == 0:
+                for ws in list(self._price_ws):
+                    if not ws.closed:
+                        await ws.send_bytes(_gzip('Ping'))
+
+            await sleep(self.tick_interval)
+
+        self.finished.set()
+
+
+async def _main():
+    parser = ArgumentParser(description='Локальный мок BingX')
+    parser.add_argument('--symbols', nargs='+', default=['BTC'])
+    parser.add_argument('--csv', help='файл с ценами (колонка close или по цене на строку), для всех символов')
+    parser.add_argument('--steps', type=int, default=10_000)
+    parser.add_argument('--interval', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--secret', default='mock', help='SECRET_KEY бота для проверки подписи')
+    args = parser.parse_args()
+
+    paths = {symbol: load_path(args.csv) if args.csv else synthetic_path(100.0, args.steps, seed=args.seed + i)
+             for i, symbol in enumerate(args.symbols)}
+    mock = MockBingX(paths, tick_interval=args.interval, seed=args.seed, secret_key=args.secret)
+    await mock.start(port=args.port)
+    print(f'BASE_URL=http://127.0.0.1:{args.port}  URL_WS=ws://127.0.0.1:{args.port}/market')
+    await mock.play()
+    await mock.stop()
+
+
+if __name__ == '__main__':
+    run(_main())